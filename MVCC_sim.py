@@ -28,9 +28,18 @@ Author: Konstantinos Diamantidis - March 2020
 import time
 import os
 import sys
+import shutil
 import subprocess
 import curses
+import importlib
+import importlib.util
 
+# the modules install_modules() installs
+REQUIRED_MODULES = ['libtmux', 'yamlordereddictloader', 'yaml']
+# written once every dependency was found, for the interpreter it names
+DEPENDENCIES_STAMP = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+    'mvcc_sim_dependencies')
 
 
 def install_modules():
@@ -49,7 +58,6 @@ def install_modules():
 
     :return: None
     """
-    import importlib
     import site
 
     try:
@@ -85,7 +93,7 @@ def install_modules():
 
             # so that the installed module can be imported
             # without having to rerun the script
-            reload(site)
+            importlib.reload(site)
             globals()['libtmux'] = importlib.import_module('libtmux')
             time.sleep(3)
             os.system('clear')
@@ -99,7 +107,7 @@ def install_modules():
                     "pip", "install", 'yamlordereddictloader==0.4.0'
             ])
             print('\nScreen will now clear')
-            reload(site)
+            importlib.reload(site)
             globals()['yamlordereddictloader'] = importlib.import_module('yamlordereddictloader')
             time.sleep(3)
             os.system('clear')
@@ -113,7 +121,7 @@ def install_modules():
                     "pip", "install", 'pyyaml=5.3.1'
             ])
             print('\nScreen will now clear')
-            reload(site)
+            importlib.reload(site)
             globals()['yaml'] = importlib.import_module('yaml')
             time.sleep(3)
             os.system('clear')
@@ -151,13 +159,57 @@ def install_tmux():
             time.sleep(1)
 
 
-install_modules()
-install_tmux()
+def missing_modules():
+    """
+    Finds the required modules that are not installed, without importing them.
+
+    :return: list of module names
+    """
+    importlib.invalidate_caches()
+    return [module for module in REQUIRED_MODULES if importlib.util.find_spec(module) is None]
+
+
+def check_dependencies(stamp_file=DEPENDENCIES_STAMP):
+    """
+    Installs the missing modules and tmux.
+    Once everything is found, the stamp file gets written
+    and the following launches only check the stamp and that tmux is on the PATH.
+
+    :param stamp_file: (optional) path of the stamp file
+    :return: None
+    """
+    try:
+        with open(stamp_file, 'r') as stamp:
+            if stamp.read().strip() == sys.executable and shutil.which('tmux'):
+                return
+    except (IOError, OSError):
+        pass
+
+    if missing_modules():
+        install_modules()
+    if not shutil.which('tmux'):
+        install_tmux()
+
+    if not missing_modules() and shutil.which('tmux'):
+        try:
+            if not os.path.isdir(os.path.dirname(stamp_file)):
+                os.makedirs(os.path.dirname(stamp_file))
+            with open(stamp_file, 'w') as stamp:
+                stamp.write(sys.executable + '\n')
+        except (IOError, OSError):
+            pass
+
+
+if __name__ == "__main__":
+    # before the imports below, which need the modules
+    check_dependencies()
 
 from mvcc_runner import find_comment
 from mvcc_runner import find_comments
 from mvcc_runner import is_dbms_running
 from mvcc_runner import SUPPORTED_DBMS
+from mvcc_daemon import is_daemon_running
+from mvcc_index import get_section
 
 YAML_FILE = "./mvcc_tests.yml"
 
@@ -202,7 +254,8 @@ def restart_dbms(dbms):
 def run_scenario(dbms, test_num, test_comment, yamlfile):
     """
     Opens a new temrinal window and executes ./mvcc_runner.py
-    which runs the selected test scenario in a tmux session.
+    which runs the selected test scenario in a tmux session,
+    or on the warm sessions of mvcc_daemon.py if it is running.
 
     :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
     :param test_num: the number of the test scenario to be run (e.g. 'test4')
@@ -211,11 +264,15 @@ def run_scenario(dbms, test_num, test_comment, yamlfile):
     :param yamlfile: the location of the yaml file. Hardcoded at the moment to "./mvcc_tests.yml"
     :return: None
     """
+    runner = 'python ./mvcc_runner.py '
+    if is_daemon_running():
+        runner += '--daemon '
+
     subprocess.call([
         'x-terminal-emulator',
         '-title', dbms.upper() + ' - ' + test_num.upper() + ' - ' + test_comment,
         '-geometry', '150x52',
-        '-e', 'python ./mvcc_runner.py ' + dbms + ' ' + test_num + ' ' + yamlfile
+        '-e', runner + dbms + ' ' + test_num + ' ' + yamlfile
     ])
 
 
@@ -428,7 +485,7 @@ def main():
                       + str(SUPPORTED_DBMS))
                 sys.exit(0)
 
-        if not is_dbms_running(DBMS):
+        if not is_dbms_running(DBMS, dict(get_section(YAML_FILE, DBMS + '-config'))):
             print(DBMS + ' is not running')
             sys.exit(0)
 
@@ -0,0 +1,517 @@
+#!/usr/bin/python
+"""
+Classifies the anomaly of a scenario run from its captured history:
+the result set of every statement and the outcome of every transaction,
+as recorded by mvcc_headless.run_scenario.
+
+The history is replayed over a model of the tables to find which version
+of a row each statement read and wrote. From those it builds the
+dependency graph of the transactions (Adya et al.):
+    wr - a transaction read a version another one wrote
+    ww - a transaction overwrote a version another one wrote
+    rw - a transaction read a version another one overwrote (anti-dependency),
+         or missed a row another one made match its where clause (predicate rw)
+Every cycle of the graph is a non-serializable interleaving and gets
+classified as lost update, non-repeatable read, read skew, write skew,
+phantom, ... Reading an uncommitted version is a dirty read.
+
+The verdict of a run is 'fail' when an anomaly occurred that
+the scenario's isolation level should prevent (Berenson et al.),
+'inconclusive' when a statement failed with an error no isolation level
+explains (e.g. a missing table): the scenario did not run as written.
+Dropping a table before creating it may fail, that does not count.
+------------------------------------------------------------------------------
+"""
+import decimal
+import re
+
+import mvcc_headless
+import mvcc_memory
+
+# anomalies each isolation level must prevent
+PREVENTED_ANOMALIES = {
+    'read uncommitted': ['dirty write'],
+    'read committed': ['dirty write', 'dirty read'],
+    'repeatable read': ['dirty write', 'dirty read', 'non-repeatable read', 'lost update',
+                        'read skew', 'write skew'],
+    'snapshot': ['dirty write', 'dirty read', 'non-repeatable read', 'lost update',
+                 'read skew', 'phantom'],
+    'serializable': ['dirty write', 'dirty read', 'non-repeatable read', 'lost update',
+                     'read skew', 'write skew', 'phantom', 'serialization anomaly'],
+}
+
+# the errors the isolation levels raise instead of letting an anomaly happen
+EXPECTED_ERRORS = ['serialization_failure', 'deadlock', 'lock_timeout']
+
+# statements parsed by mvcc_memory.parse whose second element is a table name
+TABLE_STATEMENTS = ['truncate', 'drop', 'create', 'create_as', 'insert', 'insert_select',
+                    'update', 'delete', 'select']
+
+# e.g. '# Anomaly|Lost Update - Isolation|Serializable'
+COMMENT = re.compile(r'Anomaly\|(.+?)\s+-\s+Isolation\|(.+)$', re.IGNORECASE)
+
+# longest cycle searched for, in transactions
+MAX_CYCLE_LENGTH = 5
+
+
+def normalize(value):
+    """Makes values from different drivers comparable (Decimal, padded CHAR, ...)."""
+    if isinstance(value, decimal.Decimal) or isinstance(value, float):
+        if value == int(value):
+            return int(value)
+        return float(value)
+    if isinstance(value, str):
+        return value.rstrip()
+    return value
+
+
+class Item(object):
+    """The versions of a single row, in commit order."""
+    __slots__ = ('versions', 'pending')
+
+    def __init__(self, values=None):
+        # [writer, values], writer None for the initial version,
+        # values None while the row does not exist
+        self.versions = [[None, values]]
+        self.pending = {}
+
+    def latest(self):
+        return self.versions[-1][1]
+
+
+class History(object):
+    """The :class:`History <History>` object
+
+    Replays the statements of a run over a model of the tables,
+    collecting the reads and writes of every transaction.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    """
+
+    def __init__(self, dbms):
+        self.dbms = dbms
+        # table name -> (columns, key column index)
+        self.schemas = {}
+        # table name -> {key: Item}
+        self.tables = {}
+        # transaction instance -> 'committed' | 'aborted' | 'open'
+        self.outcomes = {}
+        # (reader, table, key, writer, version index or None)
+        self.reads = []
+        # (reader, table, where, returned keys)
+        self.predicate_reads = []
+        # (reader, writer) of the versions read before their writer committed
+        self.dirty_reads = []
+        self.levels = []
+
+    def parse(self, statement):
+        translated = mvcc_headless.translate_statement(self.dbms, statement)
+        if translated is None or translated[0] != 'sql':
+            return None
+        try:
+            return mvcc_memory.parse(translated[1])
+        except mvcc_memory.Error:
+            return None
+
+    def items(self, table):
+        return self.tables.setdefault(table, {})
+
+    def item(self, table, key):
+        items = self.items(table)
+        if key not in items:
+            items[key] = Item()
+        return items[key]
+
+    def base(self, instance, item):
+        """The version a write of the instance starts from: its own or the latest committed."""
+        if instance in item.pending:
+            return item.pending[instance]
+        return item.latest()
+
+    def setup(self, statements):
+        """Applies the table initialization statements, as initial versions."""
+        for statement in statements or []:
+            parsed = self.parse(statement)
+            if parsed:
+                self.apply(None, parsed, None)
+
+    def apply(self, instance, parsed, record):
+        """
+        Applies a statement that executed without an error.
+
+        :param instance: transaction instance, None for committed setup statements
+        :param parsed: statement as parsed by mvcc_memory
+        :param record: the statement's record, None during setup
+        :return: None
+        """
+        kind = parsed[0]
+        if kind == 'create':
+            _, table, columns, key = parsed
+            self.schemas[table] = (columns, columns.index(key) if key else 0)
+            self.tables[table] = {}
+        elif kind in ('drop', 'truncate'):
+            self.tables.pop(parsed[1], None)
+        elif kind == 'isolation':
+            self.levels.append(parsed[1])
+        elif kind == 'insert' and parsed[1] in self.schemas:
+            columns, key_index = self.schemas[parsed[1]]
+            for row in parsed[3]:
+                values = [None] * len(columns)
+                for position, expression in enumerate(row):
+                    column = parsed[2][position] if parsed[2] else columns[position]
+                    values[columns.index(column)] = mvcc_memory.evaluate(expression, (), [])
+                self.write(instance, parsed[1], values[key_index], tuple(values))
+        elif kind in ('update', 'delete') and parsed[1] in self.schemas:
+            if record is not None and record.get('rowcount') == 0:
+                # e.g. the row was not visible to the transaction's snapshot
+                return
+            columns, _ = self.schemas[parsed[1]]
+            where = parsed[3] if kind == 'update' else parsed[2]
+            for key, item in list(self.items(parsed[1]).items()):
+                values = self.base(instance, item)
+                if values is None or (where is not None and
+                                      not mvcc_memory.evaluate(where, values, columns)):
+                    continue
+                if kind == 'update':
+                    new_values = list(values)
+                    for column, expression in parsed[2]:
+                        new_values[columns.index(column)] = mvcc_memory.evaluate(
+                            expression, values, columns)
+                    self.write(instance, parsed[1], key, tuple(new_values))
+                else:
+                    self.write(instance, parsed[1], key, None)
+        elif kind == 'select' and record is not None and parsed[1] in self.schemas:
+            self.read(instance, parsed, record)
+
+    def write(self, instance, table, key, values):
+        item = self.item(table, key)
+        if instance is None:
+            item.versions.append([None, values])
+        else:
+            item.pending[instance] = values
+
+    def read(self, instance, parsed, record):
+        _, table, select_columns, where, _ = parsed
+        columns, key_index = self.schemas[table]
+        key_pin = None
+        if where is not None:
+            key_pin = mvcc_memory.key_lookup(
+                where, mvcc_memory.Table(table, columns, key_index))
+
+        # the row's key, when the result set has the key column
+        key_position = None
+        if select_columns is None:
+            key_position = key_index
+        elif columns[key_index] in [label for label, _ in select_columns]:
+            key_position = [label for label, _ in select_columns].index(columns[key_index])
+
+        returned = set()
+        for row in record.get('rows') or []:
+            row = tuple(normalize(value) for value in row)
+            for key, item in list(self.items(table).items()):
+                if key_pin is not None and key != key_pin[0]:
+                    continue
+                if key_position is not None and normalize(key) != row[key_position]:
+                    continue
+                version = self.find_version(instance, item, row, select_columns, columns)
+                if version is not None:
+                    returned.add(key)
+                    self.reads.append((instance, table, key) + version)
+                    break
+
+        if key_pin is not None and not returned:
+            # the row was read as not existing (or not matching)
+            item = self.item(table, key_pin[0])
+            index = len(item.versions) - 1
+            while index > 0 and item.versions[index][1] is not None and \
+                    mvcc_memory.evaluate(where, item.versions[index][1], columns):
+                index -= 1
+            if instance not in item.pending:
+                self.reads.append((instance, table, key_pin[0],
+                                   item.versions[index][0], index))
+        elif key_pin is None:
+            self.predicate_reads.append((instance, table, where, returned))
+
+    def find_version(self, instance, item, row, select_columns, columns):
+        """
+        Finds the version of the row a result set row came from,
+        own writes first, then the committed versions newest first,
+        then other transactions' uncommitted writes.
+
+        :return: (writer, version index or None) or None if no version matches
+        """
+        def matches(values):
+            if values is None:
+                return False
+            if select_columns is None:
+                projected = values
+            else:
+                try:
+                    projected = [mvcc_memory.evaluate(expression, values, columns)
+                                 for _, expression in select_columns]
+                except mvcc_memory.Error:
+                    return False
+            return tuple(normalize(value) for value in projected) == row
+
+        if instance in item.pending:
+            if matches(item.pending[instance]):
+                return instance, None
+        for index in range(len(item.versions) - 1, -1, -1):
+            if matches(item.versions[index][1]):
+                return item.versions[index][0], index
+        for writer, values in item.pending.items():
+            if writer != instance and matches(values):
+                self.dirty_reads.append((instance, writer))
+                return writer, None
+
+        return None
+
+    def end(self, instance, outcome):
+        """Commits or discards the instance's writes."""
+        self.outcomes[instance] = outcome
+        for items in self.tables.values():
+            for item in items.values():
+                if instance in item.pending:
+                    values = item.pending.pop(instance)
+                    if outcome == 'committed':
+                        item.versions.append([instance, values])
+
+    def replay(self, result):
+        """
+        Replays the statements of a scenario run in the order they took effect.
+
+        :param result: as returned by mvcc_headless.run_scenario
+        :return: None
+        """
+        records = []
+        for step in result['steps']:
+            for record in step['statements']:
+                records.append(record)
+        records.sort(key=lambda record: record.get('end', 0))
+
+        counters, current = {}, {}
+        for record in records:
+            transaction = record['transaction']
+            if transaction not in current:
+                counters[transaction] = counters.get(transaction, 0) + 1
+                current[transaction] = transaction + \
+                    ('' if counters[transaction] == 1 else '.' + str(counters[transaction]))
+                self.outcomes[current[transaction]] = 'open'
+            instance = current[transaction]
+
+            if record['action'] in ('commit', 'rollback'):
+                outcome = record.get('outcome', 'committed')
+                self.end(instance, 'committed' if outcome == 'committed' else 'aborted')
+                del current[transaction]
+            elif 'error' in record:
+                kind = record['error']['kind']
+                if record['action'] == 'sql' and not record.get('autocommit') and \
+                        mvcc_headless.aborts_transaction(self.dbms, kind):
+                    # the transaction was rolled back by the dbms
+                    self.end(instance, 'aborted')
+                    del current[transaction]
+            elif record['action'] == 'sql':
+                parsed = self.parse(record['statement'])
+                if parsed is None:
+                    continue
+                if record.get('autocommit'):
+                    self.apply(None, parsed, None)
+                else:
+                    self.apply(instance, parsed, record)
+
+    def edges(self):
+        """
+        Builds the dependency graph of the transactions that did not abort.
+
+        :return: list of (from, to, kind, item) where kind is 'ww' | 'wr' | 'rw' | 'prw'
+        """
+        alive = set(instance for instance, outcome in self.outcomes.items()
+                    if outcome != 'aborted')
+        edges = set()
+
+        for table, items in self.tables.items():
+            for key, item in items.items():
+                writers = [writer for writer, _ in item.versions]
+                for previous, following in zip(writers, writers[1:]):
+                    if previous in alive and following in alive and previous != following:
+                        edges.add((previous, following, 'ww', table + ':' + str(key)))
+
+        for reader, table, key, writer, index in self.reads:
+            if reader not in alive:
+                continue
+            name = table + ':' + str(key)
+            if writer in alive and writer != reader:
+                edges.add((writer, reader, 'wr', name))
+            item = self.tables.get(table, {}).get(key)
+            if index is not None and item is not None and index + 1 < len(item.versions):
+                overwriter = item.versions[index + 1][0]
+                if overwriter in alive and overwriter != reader:
+                    edges.add((reader, overwriter, 'rw', name))
+
+        for reader, table, where, returned in self.predicate_reads:
+            if reader not in alive or table not in self.schemas:
+                continue
+            columns = self.schemas[table][0]
+            for key, item in self.tables.get(table, {}).items():
+                if key in returned:
+                    continue
+                # versions that made the row match the where clause the reader did not see
+                for index in range(1, len(item.versions)):
+                    writer, values = item.versions[index]
+                    if writer in alive and writer != reader and values is not None and \
+                            (where is None or mvcc_memory.evaluate(where, values, columns)):
+                        edges.add((reader, writer, 'prw', table + ':' + str(key)))
+
+        return sorted(edges)
+
+
+def find_cycles(edges):
+    """
+    Finds the simple cycles of the dependency graph, as lists of edges.
+
+    :param edges: as returned by History.edges
+    :return: list of cycles
+    """
+    outgoing = {}
+    for edge in edges:
+        outgoing.setdefault(edge[0], []).append(edge)
+    # every cycle is found once, from its smallest transaction
+    order = dict((node, position) for position, node in enumerate(sorted(outgoing)))
+    cycles = []
+
+    def visit(start, node, path, visited):
+        for edge in outgoing.get(node, []):
+            target = edge[1]
+            if target == start:
+                cycles.append(path + [edge])
+            elif target in order and order[target] > order[start] and \
+                    target not in visited and len(path) + 1 < MAX_CYCLE_LENGTH:
+                visit(start, target, path + [edge], visited | set([target]))
+
+    for start in order:
+        visit(start, start, [], set([start]))
+
+    return cycles
+
+
+def classify_cycle(cycle):
+    """
+    Names the anomaly of a dependency cycle.
+
+    :param cycle: list of edges
+    :return: e.g. 'lost update'
+    """
+    kinds = [edge[2] for edge in cycle]
+    if 'prw' in kinds:
+        return 'phantom'
+    if all(kind == 'ww' for kind in kinds):
+        return 'dirty write'
+    if all(kind in ('rw', 'prw') for kind in kinds):
+        return 'write skew'
+    if len(cycle) == 2:
+        first, second = cycle if cycle[0][2] == 'rw' else (cycle[1], cycle[0])
+        if first[2] == 'rw' and second[2] == 'ww' and first[3] == second[3]:
+            return 'lost update'
+        if first[2] == 'rw' and second[2] == 'wr':
+            return 'non-repeatable read' if first[3] == second[3] else 'read skew'
+
+    return 'serialization anomaly'
+
+
+def scenario_info(comment):
+    """Returns (anomaly, isolation level) from a test comment, lowercased, or (None, None)."""
+    match = COMMENT.search(comment or '')
+    if not match:
+        return None, None
+    return match.group(1).strip().lower(), match.group(2).strip().lower()
+
+
+def unexpected_errors(result):
+    """
+    Returns the statement errors that are not in EXPECTED_ERRORS.
+    Once a transaction failed with an expected error, the errors of its next
+    statements (e.g. postgres refusing them until it ends) are not returned.
+    Neither are the errors of a failed DROP TABLE, or of any statement on a table
+    the run creates later: the scenarios drop their tables before creating them,
+    which fails on a database that never had them.
+
+    :param result: as returned by mvcc_headless.run_scenario
+    :return: list of error dicts (code, kind, message)
+    """
+    history = History(result['dbms'])
+    records = [(record, history.parse(record['statement']))
+               for step in result['steps'] for record in step['statements']]
+    created = {}
+    for position, (record, parsed) in enumerate(records):
+        if parsed and parsed[0] == 'create':
+            created.setdefault(parsed[1], position)
+
+    errors = []
+    failed = set()
+    for position, (record, parsed) in enumerate(records):
+        error = record.get('error')
+        if error and error.get('kind') in EXPECTED_ERRORS:
+            failed.add(record['transaction'])
+        elif error and record['transaction'] not in failed and \
+                not (parsed and parsed[0] in TABLE_STATEMENTS and
+                     (parsed[0] == 'drop' or created.get(parsed[1], -1) > position)):
+            errors.append(error)
+        if record.get('outcome'):
+            failed.discard(record['transaction'])
+
+    return errors
+
+
+def analyze(result, table_initialization=None):
+    """
+    Classifies the anomalies of a scenario run.
+
+    :param result: as returned by mvcc_headless.run_scenario
+    :param table_initialization: (optional) the 'table-initialization' section of the yaml file
+    :return: dict with the dependency edges, the anomalies found,
+             whether the run was serializable, the unexpected errors and the verdict
+    """
+    scenario_anomaly, level = scenario_info(result.get('comment'))
+    analysis = {'scenario_anomaly': scenario_anomaly, 'level': level,
+                'edges': [], 'anomalies': [], 'serializable': None,
+                'unexpected_errors': [], 'verdict': 'unknown'}
+    if result.get('status') != 'ok':
+        return analysis
+
+    history = History(result['dbms'])
+    history.setup(table_initialization)
+    history.replay(result)
+    if not level and history.levels:
+        level = analysis['level'] = history.levels[0]
+
+    edges = history.edges()
+    analysis['edges'] = [{'from': edge[0], 'to': edge[1], 'kind': edge[2], 'item': edge[3]}
+                         for edge in edges]
+
+    found = set()
+    for reader, writer in history.dirty_reads:
+        if history.outcomes.get(reader) != 'aborted':
+            found.add(('dirty read', (writer, reader)))
+    for cycle in find_cycles(edges):
+        found.add((classify_cycle(cycle), tuple(sorted(set(edge[0] for edge in cycle)))))
+    analysis['anomalies'] = [{'type': anomaly, 'transactions': list(transactions)}
+                             for anomaly, transactions in sorted(found)]
+    analysis['serializable'] = not found
+
+    if level in PREVENTED_ANOMALIES:
+        prevented = PREVENTED_ANOMALIES[level]
+        failed = [anomaly for anomaly, _ in found if anomaly in prevented]
+        analysis['verdict'] = 'fail' if failed else 'pass'
+    analysis['unexpected_errors'] = unexpected_errors(result)
+    if analysis['unexpected_errors']:
+        analysis['verdict'] = 'inconclusive'
+
+    return analysis
+
+
+def format_analysis(analysis):
+    """Formats an analysis as a single line, e.g. 'lost update (T1, T2) - Read Committed: pass'."""
+    anomalies = ', '.join(anomaly['type'] + ' (' + ', '.join(anomaly['transactions']) + ')'
+                          for anomaly in analysis['anomalies']) or 'no anomaly'
+    return anomalies + ' - ' + str(analysis['level'] or 'unknown level').title() + \
+        ': ' + analysis['verdict']
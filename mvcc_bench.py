@@ -0,0 +1,201 @@
+#!/usr/bin/python
+"""
+Benchmarks the end-to-end latency of the test scenarios:
+runs every selected scenario N times per dbms, over DB-API connections
+(see mvcc_headless.py) or on the in-memory engine (see mvcc_memory.py),
+and prints the timings of each phase as JSON:
+    connect - opening one connection per transaction (initiate_connection)
+    reset   - re-initializing the tables (initiate_panes)
+    steps   - executing the steps, and each step on its own (execute_steps)
+    total   - the whole run
+All timings are in milliseconds.
+
+To run:
+$ python mvcc_bench.py <yaml_file_path> <dbms> [<dbms> ...] [options]
+e.g.( python mvcc_bench.py "./mvcc_tests.yml" postgres mysql --runs=20 --output=bench.json )
+
+Options:
+--runs=<N>               runs of every scenario (default 10)
+--tests=<test1,test4>    scenarios to run (default every scenario of the dbms)
+--backend=memory         run on the in-memory engine instead of the dbms
+--output=<file>          also write the results to the file
+--baseline=<file>        compare with the results of a previous benchmark
+--threshold=<ratio>      median slowdown reported as a regression (default 0.2, i.e. 20%)
+--min-delta=<ms>         smaller slowdowns are noise, not regressions (default 1)
+The exit code is 1 if a regression was found.
+------------------------------------------------------------------------------
+"""
+import json
+import sys
+import time
+
+import mvcc_headless
+import mvcc_memory
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+from mvcc_index import test_numbers
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+PHASES = ['connect', 'reset', 'steps', 'total']
+OPTIONS = {'runs': 10, 'threshold': 0.2, 'min-delta': 1}
+
+
+def parse_options():
+    """Removes the options (e.g. --runs=20) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+def statistics(samples):
+    """
+    Summarizes a list of timings.
+
+    :param samples: seconds
+    :return: dict of milliseconds: min, median, mean, p95, max and the number of samples
+    """
+    if not samples:
+        return None
+    ordered = sorted(sample * 1000.0 for sample in samples)
+    middle = len(ordered) // 2
+    median = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+    return {'min': round(ordered[0], 3), 'median': round(median, 3),
+            'mean': round(sum(ordered) / len(ordered), 3),
+            'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+            'max': round(ordered[-1], 3), 'samples': len(ordered)}
+
+
+def benchmark_test(dbms, yaml_file, test_num, runs, backend):
+    """
+    Runs a scenario N times and summarizes its timings.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param yaml_file: yaml file path
+    :param test_num: e.g. 'test4'
+    :param runs: number of runs
+    :param backend: 'dbms' | 'memory'
+    :return: dict of phase to statistics, with the per step statistics in 'step_times',
+             only the status and the error when the backend cannot run the scenario
+    """
+    config = dict(get_section(yaml_file, dbms + '-config'))
+    table_initialization = get_section(yaml_file, 'table-initialization')
+    steps = get_test(yaml_file, dbms, test_num)
+    test_comment = get_comments(yaml_file, dbms).get(test_num, '')
+
+    samples = dict((phase, []) for phase in PHASES)
+    step_samples = {}
+    errors = []
+    for _ in range(runs):
+        connect_function = mvcc_memory.Engine().connect if backend == 'memory' else None
+        result = mvcc_headless.run_scenario(dbms, config, table_initialization, steps,
+                                            test_num, test_comment, connect_function)
+        if result['status'] == 'empty':
+            return None
+        if result['status'] == 'unsupported':
+            return {'comment': test_comment, 'status': 'unsupported', 'error': result['error']}
+        if result['status'] != 'ok':
+            errors.append(result.get('error', result['status']))
+            continue
+        for phase in PHASES:
+            samples[phase].append(result['timings'][phase])
+        for step in result['steps']:
+            step_samples.setdefault(step['step'], []).append(step['duration'])
+
+    summary = dict((phase, statistics(samples[phase])) for phase in PHASES)
+    summary['step_times'] = dict((step, statistics(step_samples[step]))
+                                 for step in step_samples)
+    summary['comment'] = test_comment
+    summary['errors'] = len(errors)
+    if errors:
+        summary['last_error'] = str(errors[-1])
+
+    return summary
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    Compares the median of every phase with the baseline's.
+
+    :param results: as built by main
+    :param baseline: the results of a previous benchmark
+    :param threshold: slowdown ratio reported as a regression (e.g. 0.2)
+    :param min_delta: milliseconds, smaller slowdowns are ignored
+    :return: list of dicts, one per phase that got slower or faster beyond the threshold
+    """
+    changes = []
+    for dbms, tests in results['dbms'].items():
+        for test_num, summary in tests.items():
+            previous = baseline.get('dbms', {}).get(dbms, {}).get(test_num)
+            if not summary or not previous:
+                continue
+            for phase in PHASES:
+                if not summary.get(phase) or not previous.get(phase):
+                    continue
+                current_median = summary[phase]['median']
+                baseline_median = previous[phase]['median']
+                delta = current_median - baseline_median
+                if abs(delta) < min_delta or not baseline_median:
+                    continue
+                ratio = delta / baseline_median
+                if abs(ratio) > threshold:
+                    changes.append({'dbms': dbms, 'test': test_num, 'phase': phase,
+                                    'baseline': baseline_median, 'current': current_median,
+                                    'change': round(ratio, 3),
+                                    'kind': 'regression' if ratio > 0 else 'improvement'})
+
+    return changes
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 3:
+        print('Argument error \n '
+              'Make sure you provide <yaml file path> and at least one <dbms>')
+        sys.exit(2)
+    for dbms in sys.argv[2:]:
+        if dbms not in SUPPORTED_DBMS:
+            print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+            sys.exit(2)
+
+    yaml_file = sys.argv[1]
+    runs = int(OPTIONS['runs'])
+    backend = OPTIONS.get('backend', 'dbms')
+    results = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'runs': runs,
+               'backend': backend, 'dbms': {}}
+
+    for dbms in sys.argv[2:]:
+        test_nums = test_numbers(yaml_file, dbms)
+        if OPTIONS.get('tests'):
+            test_nums = [test_num for test_num in OPTIONS['tests'].split(',')
+                         if test_num in test_nums]
+        results['dbms'][dbms] = {}
+        for test_num in test_nums:
+            summary = benchmark_test(dbms, yaml_file, test_num, runs, backend)
+            if summary:
+                results['dbms'][dbms][test_num] = summary
+
+    exit_code = 0
+    if OPTIONS.get('baseline'):
+        with open(OPTIONS['baseline'], 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        changes = compare(results, baseline, float(OPTIONS['threshold']),
+                          float(OPTIONS['min-delta']))
+        results['baseline'] = OPTIONS['baseline']
+        results['changes'] = changes
+        if [change for change in changes if change['kind'] == 'regression']:
+            exit_code = 1
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if OPTIONS.get('output'):
+        with open(OPTIONS['output'], 'w') as output_file:
+            output_file.write(output + '\n')
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
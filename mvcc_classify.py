@@ -0,0 +1,180 @@
+#!/usr/bin/python
+"""
+Classifies the output of a dbms CLI client as it arrives:
+connecting, connected and ready for the next statement, executing a statement
+or failed to connect (unknown database, unknown host, authentication).
+Whether an executing statement is blocked on a lock does not show in the output,
+the runners ask the dbms (see mvcc_locks.py).
+Also notes the errors statements fail with (serialization failure, deadlock,
+lock timeout, any other error).
+
+Every dbms gets a single compiled regular expression with a named group
+per outcome, each line of new output gets matched once, so a chunk of
+output costs the same no matter how much output came before it.
+------------------------------------------------------------------------------
+"""
+import re
+import threading
+
+from mvcc_headless import ERROR_KINDS
+from mvcc_stream import ESCAPE_SEQUENCES
+
+CONNECTING, READY, EXECUTING, ERROR = 'connecting', 'ready', 'executing', 'error'
+
+# the prompt each dbms CLI shows when it is ready for the next statement
+# sqlserver's counter goes back to 1 after every GO
+READY_PROMPTS = {
+    'postgres': re.compile(r'^\S*=[*!]?[#>]$'),
+    'mysql': re.compile(r'^(?:MariaDB \[.*\]|mysql)>$'),
+    'sqlserver': re.compile(r'^1>$'),
+    'oracle': re.compile(r'^SQL>$'),
+}
+
+# what the CLI clients print when they fail to connect, by reason
+CONNECTION_ERRORS = [
+    ('database', ['Unknown database',
+                  'FATAL:  database',
+                  'Cannot open database',
+                  'ORA-12514']),
+    ('host', ['Unknown MySQL server host',
+              'could not translate host name',
+              'Login timeout expired',
+              'could not connect',
+              'could not resolve',
+              'ORA-12541']),
+    ('authentication', ['Access denied',
+                        'authentication failed',
+                        'psql: warning: extra command',
+                        'Login failed',
+                        'invalid username/password']),
+]
+CONNECTION_REASONS = [reason for reason, _ in CONNECTION_ERRORS]
+
+# how the CLI clients print the error codes of ERROR_KINDS,
+# psql prints the messages only
+ERROR_CODE_FORMATS = {
+    'mysql': r'ERROR %s\b',
+    'sqlserver': r'Msg %s\b',
+    'oracle': r'ORA-%05d\b',
+}
+POSTGRES_ERRORS = {
+    'serialization_failure': r'could not serialize access',
+    'deadlock': r'deadlock detected',
+    'lock_timeout': r'canceling statement due to lock timeout|could not obtain lock',
+}
+# the start of any other error
+STATEMENT_ERROR = r'^(?:ERROR\b|Msg \d+|ORA-\d+)'
+
+# characters of an unfinished line kept, prompts never get longer
+MAX_PARTIAL_LINE = 1024
+
+
+def statement_errors(dbms):
+    """Returns the patterns of the errors statements fail with, by kind."""
+    if dbms == 'postgres':
+        return dict(POSTGRES_ERRORS)
+
+    patterns = {}
+    for code, kind in ERROR_KINDS[dbms].items():
+        pattern = ERROR_CODE_FORMATS[dbms] % (int(code) if dbms == 'oracle' else code)
+        patterns[kind] = patterns[kind] + '|' + pattern if kind in patterns else pattern
+    return patterns
+
+
+def compile_classifier(dbms):
+    """
+    Builds the dbms's regular expression, one named group per outcome:
+    prompt, database, host, authentication, each error kind and error.
+    The first message found in the line wins, the start of an error
+    only counts when no message with a known reason follows it.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: compiled regular expression, to be matched on one clean line
+    """
+    groups = []
+    for reason, messages in CONNECTION_ERRORS:
+        groups.append('(?P<' + reason + '>' + '|'.join(re.escape(message)
+                                                      for message in messages) + ')')
+    for kind, pattern in sorted(statement_errors(dbms).items()):
+        groups.append('(?P<' + kind + '>' + pattern + ')')
+
+    return re.compile('(?P<prompt>' + READY_PROMPTS[dbms].pattern + ')|' +
+                      '.*?(?:' + '|'.join(groups) + ')|' +
+                      '(?P<error>' + STATEMENT_ERROR + ')')
+
+
+CLASSIFIERS = dict((dbms, compile_classifier(dbms)) for dbms in READY_PROMPTS)
+
+
+def clean_line(line):
+    """Removes escape sequences and carriage return overwrites, see mvcc_stream.clean_output."""
+    return ESCAPE_SEQUENCES.sub('', line).rstrip('\r').split('\r')[-1].strip()
+
+
+class OutputClassifier(object):
+    """The :class:`OutputClassifier <OutputClassifier>` object
+
+    Fed with the output of one CLI client, chunk by chunk.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    """
+
+    def __init__(self, dbms):
+        self.dbms = dbms
+        self.pattern = CLASSIFIERS[dbms]
+        self.lock = threading.Lock()
+        self.partial = ''
+        self.connected = False
+        self.at_prompt = False
+        # the reason the client failed to connect: 'database' | 'host' | 'authentication'
+        self.error = None
+        # the kind of error the last statement failed with
+        self.statement_error = None
+
+    def classify_line(self, line, complete):
+        if not line:
+            return
+        match = self.pattern.match(line)
+        group = match.lastgroup if match else None
+        self.at_prompt = group == 'prompt'
+        if self.at_prompt:
+            self.connected = True
+        elif group in CONNECTION_REASONS and not self.connected:
+            self.error = group
+        elif group and complete:
+            self.statement_error = 'error' if group in CONNECTION_REASONS else group
+
+    def feed(self, text):
+        """
+        Classifies a chunk of newly arrived output.
+
+        :param text: decoded output
+        :return: the state after it, see state
+        """
+        with self.lock:
+            lines = (self.partial + text).split('\n')
+            self.partial = lines.pop()[-MAX_PARTIAL_LINE:]
+            for line in lines:
+                self.classify_line(clean_line(line), True)
+            # prompts are not followed by a new line
+            self.classify_line(clean_line(self.partial), False)
+
+        return self.state()
+
+    def expect(self):
+        """Notes that a statement is about to be sent, it executes until the next prompt."""
+        with self.lock:
+            self.at_prompt = False
+            self.statement_error = None
+
+    def state(self):
+        """
+        :return: CONNECTING | READY | EXECUTING | ERROR
+        """
+        if self.error:
+            return ERROR
+        if self.at_prompt:
+            return READY
+        if not self.connected:
+            return CONNECTING
+        return EXECUTING
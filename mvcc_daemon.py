@@ -0,0 +1,228 @@
+#!/usr/bin/python
+"""
+Long-lived local daemon that keeps authenticated DB-API sessions
+per dbms and transaction slot (T1, T2, ...), so that scenario runs
+skip the connection and login cost. Sessions are rolled back and
+reset between jobs instead of being re-established.
+
+MVCC_sim.py and mvcc_runner.py --daemon submit their scenario jobs
+to it over a Unix socket, one JSON line per request and response.
+
+To run:
+$ python mvcc_daemon.py [<yaml_file_path> <dbms> ...]
+e.g.( python mvcc_daemon.py "./mvcc_tests.yml" postgres mysql )
+The optional dbms names get their sessions connected at start up.
+
+To stop:
+$ python mvcc_daemon.py stop
+------------------------------------------------------------------------------
+"""
+import json
+import os
+import socket
+import sys
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+import mvcc_anomaly
+import mvcc_headless
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+
+SOCKET_PATH = os.environ.get(
+    'MVCC_DAEMON_SOCKET',
+    os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'),
+                 'mvcc_daemon_' + str(os.getuid()) + '.sock'))
+
+# sessions by dbms, each a dict of transaction name to Session
+SESSIONS = {}
+# one job at a time per dbms, they share the sessions and the tables
+DBMS_LOCKS = {}
+# the config each dbms's sessions were opened with
+SESSION_CONFIGS = {}
+LOCK = threading.Lock()
+
+
+def dbms_sessions(dbms, config):
+    """
+    Returns the pooled sessions of the provided dbms, dropping them
+    if the yaml config they were opened with has changed.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :return: dict of transaction name to Session
+    """
+    sessions = SESSIONS.setdefault(dbms, {})
+    if SESSION_CONFIGS.get(dbms) != config:
+        mvcc_headless.close_sessions(list(sessions.values()))
+        sessions.clear()
+        SESSION_CONFIGS[dbms] = config
+
+    return sessions
+
+
+def run_job(job):
+    """
+    Runs a scenario job with the pooled sessions of its dbms.
+
+    :param job: dict with 'dbms', 'test_num' and 'yaml_file'
+    :return: the result of mvcc_headless.run_scenario
+    """
+    dbms = job['dbms']
+    yaml_file = job['yaml_file']
+
+    config = dict(get_section(yaml_file, dbms + '-config'))
+    table_initialization = get_section(yaml_file, 'table-initialization')
+    steps = get_test(yaml_file, dbms, job['test_num'])
+    test_comment = get_comments(yaml_file, dbms).get(job['test_num'], '')
+
+    with LOCK:
+        dbms_lock = DBMS_LOCKS.setdefault(dbms, threading.Lock())
+
+    with dbms_lock:
+        result = mvcc_headless.run_scenario(dbms, config, table_initialization, steps,
+                                            job['test_num'], test_comment,
+                                            sessions=dbms_sessions(dbms, config))
+
+    result['analysis'] = mvcc_anomaly.analyze(result, table_initialization)
+
+    return result
+
+
+def warm_up(yaml_file, dbms):
+    """
+    Connects as many sessions as the dbms's biggest test has transactions.
+
+    :param yaml_file: yaml file path
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: None
+    """
+    config = dict(get_section(yaml_file, dbms + '-config'))
+    transactions = set()
+    for steps in get_section(yaml_file, dbms + '-tests').values():
+        for step_name in steps or []:
+            transactions.add(mvcc_headless.transaction_of(step_name))
+
+    sessions = dbms_sessions(dbms, config)
+    for transaction in sorted(transactions, key=mvcc_headless.transaction_order):
+        if transaction not in sessions:
+            sessions[transaction] = mvcc_headless.Session(
+                transaction, dbms, mvcc_headless.connect(dbms, config))
+            sessions[transaction].reset()
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Handles one JSON request per line, answers with one JSON line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                if request.get('command') == 'ping':
+                    response = {'status': 'ok', 'sessions': dict(
+                        (dbms, sorted(sessions)) for dbms, sessions in SESSIONS.items())}
+                elif request.get('command') == 'stop':
+                    response = {'status': 'ok'}
+                    threading.Thread(target=self.server.shutdown).start()
+                else:
+                    response = run_job(request)
+            except KeyError as err:
+                response = {'status': 'error',
+                            'error': 'reason "%s"' % str(err) + ' does not exist'}
+            except Exception as err:
+                response = {'status': 'error', 'error': str(err)}
+
+            self.wfile.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def request(message, socket_path=SOCKET_PATH, timeout=None):
+    """
+    Sends a request to the daemon and returns its response.
+
+    :param message: dict, e.g. {'dbms': 'mysql', 'test_num': 'test3', 'yaml_file': '...'}
+    :param socket_path: (optional) the daemon's socket
+    :param timeout: (optional) seconds
+    :return: response dict
+    """
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(socket_path)
+        client.sendall((json.dumps(message) + '\n').encode('utf-8'))
+        response = b''
+        while not response.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            response += chunk
+    finally:
+        client.close()
+
+    return json.loads(response.decode('utf-8'))
+
+
+def submit_job(dbms, test_num, yaml_file, socket_path=SOCKET_PATH):
+    """Submits a scenario job to the daemon and returns its result."""
+    return request({'dbms': dbms, 'test_num': test_num,
+                    'yaml_file': os.path.abspath(yaml_file)}, socket_path)
+
+
+def is_daemon_running(socket_path=SOCKET_PATH):
+    """Checks if a daemon is answering on the socket."""
+    try:
+        return request({'command': 'ping'}, socket_path, timeout=1)['status'] == 'ok'
+    except (socket.error, ValueError, KeyError):
+        return False
+
+
+def main():
+    if len(sys.argv) == 2 and sys.argv[1] == 'stop':
+        if is_daemon_running():
+            request({'command': 'stop'})
+        sys.exit(0)
+
+    if is_daemon_running():
+        print('A daemon is already running on ' + SOCKET_PATH)
+        sys.exit(0)
+    if os.path.exists(SOCKET_PATH):
+        # left over from a daemon that did not exit cleanly
+        os.remove(SOCKET_PATH)
+
+    if len(sys.argv) > 2:
+        for dbms in sys.argv[2:]:
+            try:
+                warm_up(sys.argv[1], dbms)
+            except Exception as err:
+                print('Could not connect to ' + dbms + ': ' + str(err))
+
+    # the socket gets created only accessible by the user, any client of the socket
+    # can run statements on the connected sessions
+    umask = os.umask(0o077)
+    try:
+        server = DaemonServer(SOCKET_PATH, JobHandler)
+    finally:
+        os.umask(umask)
+    print('Listening on ' + SOCKET_PATH)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(SOCKET_PATH)
+        for sessions in SESSIONS.values():
+            mvcc_headless.close_sessions(list(sessions.values()))
+
+
+if __name__ == "__main__":
+    main()
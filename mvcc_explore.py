@@ -0,0 +1,347 @@
+#!/usr/bin/python
+"""
+Explores the interleavings of a test scenario's steps: every order
+of the steps that keeps each transaction's own steps in their order,
+not only the one order written in the yaml file.
+
+Orders that only differ by swapping independent steps (steps of different
+transactions that touch different rows, or only read the same ones)
+give the same result, so only one order of every such group is run:
+the lexicographically smallest (partial-order reduction).
+The remaining orders run on a process pool, each on its own sessions,
+and get classified by mvcc_anomaly.py.
+
+To run:
+$ python mvcc_explore.py <dbms> <test_num> <yaml_file_path> [options]
+e.g.( python mvcc_explore.py mysql test4 "./mvcc_tests.yml" --backend=memory )
+
+Options:
+--backend=memory         run on the in-memory engine instead of the dbms
+--processes=<N>          worker processes (default the number of cpus), runs on
+                         the dbms share its tables, so they always use a single process
+--max-schedules=<N>      stop after N orders (default 10000)
+--all                    run every order, without the reduction
+------------------------------------------------------------------------------
+"""
+import json
+import multiprocessing
+import sys
+import time
+
+import mvcc_anomaly
+import mvcc_headless
+import mvcc_memory
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+OPTIONS = {'max-schedules': 10000}
+
+# a footprint key that stands for every row of a table
+ALL_ROWS = '*'
+
+
+def parse_options():
+    """Removes the options (e.g. --processes=4) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+class Footprint(object):
+    """What a step reads and writes, to tell whether two steps commute."""
+    __slots__ = ('transaction', 'reads', 'writes', 'assigned', 'boundary', 'everything')
+
+    def __init__(self, transaction):
+        self.transaction = transaction
+        # sets of (table, key or ALL_ROWS)
+        self.reads = set()
+        self.writes = set()
+        # (table, column) of every column the step's updates set
+        self.assigned = set()
+        # the step starts or ends a transaction (begin, commit, rollback, autocommit)
+        self.boundary = False
+        # the step does something that is not understood, or changes the tables
+        self.everything = False
+
+    def accesses(self):
+        return bool(self.reads or self.writes)
+
+    def widen(self, assigned):
+        """Makes the rows pinned by a column that some update sets stand for the whole table."""
+        self.reads = set((table, ALL_ROWS) if key != ALL_ROWS and (table, key[0]) in assigned
+                         else (table, key) for table, key in self.reads)
+        self.writes = set((table, ALL_ROWS) if key != ALL_ROWS and (table, key[0]) in assigned
+                          else (table, key) for table, key in self.writes)
+
+
+def footprint(dbms, step_name, statements):
+    """
+    Finds the rows a step reads and writes.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param step_name: e.g. 'step3_T1'
+    :param statements: the step's statements
+    :return: Footprint
+    """
+    step = Footprint(mvcc_headless.transaction_of(step_name))
+    for statement in statements or []:
+        translated = mvcc_headless.translate_statement(dbms, statement)
+        if translated is None or translated[0] in ('skip', 'variable', 'print'):
+            continue
+        if translated[0] in ('commit', 'rollback', 'autocommit'):
+            step.boundary = True
+            continue
+        try:
+            parsed = mvcc_memory.parse(translated[1])
+        except mvcc_memory.Error:
+            step.everything = True
+            continue
+
+        kind = parsed[0]
+        if kind in ('isolation', 'lock_timeout', 'discard', 'noop'):
+            continue
+        if kind in ('begin', 'commit', 'rollback'):
+            # where the snapshot is taken, or what the others see
+            step.boundary = True
+            continue
+        if kind in ('select', 'update', 'delete'):
+            where = parsed[3] if kind in ('select', 'update') else parsed[2]
+            rows = (parsed[1], ALL_ROWS)
+            if where is not None:
+                key = key_of(where)
+                if key is not None:
+                    rows = (parsed[1], key)
+            step.reads.add(rows)
+            if kind != 'select':
+                step.writes.add(rows)
+            if kind == 'update':
+                step.assigned.update((parsed[1], column) for column, _ in parsed[2])
+        elif kind == 'insert':
+            step.writes.add((parsed[1], ALL_ROWS))
+        elif kind == 'insert_select':
+            step.reads.add((parsed[3][1], ALL_ROWS))
+            step.writes.add((parsed[1], ALL_ROWS))
+        else:
+            # table definitions
+            step.everything = True
+
+    return step
+
+
+def key_of(where):
+    """Returns the value a where clause pins a column to with '=', as (column, value), or None."""
+    if where[0] == 'and':
+        return key_of(where[1]) or key_of(where[2])
+    if where[0] == 'compare' and where[1] == '=':
+        for column, value in ((where[2], where[3]), (where[3], where[2])):
+            if column[0] == 'column' and value[0] == 'value':
+                return (column[1], value[1])
+    return None
+
+
+def overlap(rows, other_rows):
+    for table, key in rows:
+        for other_table, other_key in other_rows:
+            if table == other_table and (key == other_key or ALL_ROWS in (key, other_key) or
+                                         key[0] != other_key[0]):
+                return True
+    return False
+
+
+def dependent(step, other):
+    """Checks if swapping two steps can change the outcome."""
+    if step.transaction == other.transaction or step.everything or other.everything:
+        return True
+    if step.boundary and (other.boundary or other.accesses()):
+        return True
+    if other.boundary and step.accesses():
+        return True
+
+    return overlap(step.writes, other.reads | other.writes) or \
+        overlap(other.writes, step.reads)
+
+
+def count_interleavings(steps):
+    """Returns the number of orders that keep each transaction's steps in order."""
+    sizes = {}
+    for step_name in steps:
+        transaction = mvcc_headless.transaction_of(step_name)
+        sizes[transaction] = sizes.get(transaction, 0) + 1
+
+    count, placed = 1, 0
+    for size in sizes.values():
+        for position in range(1, size + 1):
+            placed += 1
+            count = count * placed // position
+
+    return count
+
+
+def interleavings(dbms, steps, reduce=True, limit=None):
+    """
+    Generates the orders of the steps that keep each transaction's steps in order,
+    with reduce only the lexicographically smallest of every group of equivalent orders:
+    an order is skipped when a step is independent of a bigger step placed before it
+    and of every step in between, so that it could have been placed first.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param steps: the test's steps
+    :param reduce: (optional) skip the equivalent orders
+    :param limit: (optional) maximum number of orders
+    :return: generator of lists of step names
+    """
+    names = list(steps)
+    footprints = [footprint(dbms, name, steps[name]) for name in names]
+    # an update can move a row into (or out of) the rows another step pins by that column
+    assigned = set()
+    for step in footprints:
+        assigned |= step.assigned
+    for step in footprints:
+        step.widen(assigned)
+    queues = {}
+    for index, name in enumerate(names):
+        queues.setdefault(footprints[index].transaction, []).append(index)
+    transactions = list(queues)
+    produced = [0]
+
+    def extend(order, positions):
+        if limit and produced[0] >= limit:
+            return
+        if len(order) == len(names):
+            produced[0] += 1
+            yield [names[index] for index in order]
+            return
+
+        for transaction in transactions:
+            position = positions[transaction]
+            if position == len(queues[transaction]):
+                continue
+            candidate = queues[transaction][position]
+            if reduce and not in_normal_form(order, candidate):
+                continue
+            positions[transaction] += 1
+            for schedule in extend(order + [candidate], positions):
+                yield schedule
+            positions[transaction] -= 1
+
+    def in_normal_form(order, candidate):
+        # look back for a bigger step the candidate commutes with, as do all steps after it
+        for index in range(len(order) - 1, -1, -1):
+            if dependent(footprints[order[index]], footprints[candidate]):
+                return True
+            if order[index] > candidate:
+                return False
+        return True
+
+    return extend([], dict((transaction, 0) for transaction in transactions))
+
+
+def run_schedule(job):
+    """
+    Runs the steps in the order of a schedule and classifies the result,
+    the work of a pool process.
+
+    :param job: (dbms, config, table_initialization, steps, schedule, test_num, comment, backend)
+    :return: dict with the schedule, its status, anomalies and verdict
+    """
+    dbms, config, table_initialization, steps, schedule, test_num, comment, backend = job
+    connect_function = mvcc_memory.Engine().connect if backend == 'memory' else None
+    ordered_steps = dict((step_name, steps[step_name]) for step_name in schedule)
+    result = mvcc_headless.run_scenario(dbms, config, table_initialization, ordered_steps,
+                                        test_num, comment, connect_function)
+    analysis = mvcc_anomaly.analyze(result, table_initialization)
+
+    return {'schedule': schedule, 'status': result['status'],
+            'anomalies': sorted(set(anomaly['type'] for anomaly in analysis['anomalies'])),
+            'verdict': analysis['verdict']}
+
+
+def explore(dbms, config, table_initialization, steps, test_num=None, comment=None,
+            backend='dbms', processes=None, reduce=True, limit=10000):
+    """
+    Runs the interleavings of a scenario and collects the ones that produce anomalies.
+
+    :param processes: (optional) pool size, always 1 for the dbms backend
+    :return: dict with the counts and the schedules of every anomaly
+    """
+    started = time.time()
+    jobs = [(dbms, config, table_initialization, steps, schedule, test_num, comment, backend)
+            for schedule in interleavings(dbms, steps, reduce, limit)]
+    if backend != 'memory':
+        # the runs would share the dbms's tables
+        processes = 1
+
+    if processes == 1:
+        runs = [run_schedule(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunksize = max(1, len(jobs) // (8 * (processes or 4)))
+            runs = pool.map(run_schedule, jobs, chunksize=chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
+    written = [run for run in runs if run['schedule'] == list(steps)]
+    if not written:
+        # the reduction kept an equivalent order instead
+        written = [run_schedule((dbms, config, table_initialization, steps, list(steps),
+                                 test_num, comment, backend))]
+
+    anomalies = {}
+    for run in runs:
+        for anomaly in run['anomalies']:
+            anomalies.setdefault(anomaly, []).append(run['schedule'])
+
+    return {'dbms': dbms, 'test': test_num, 'comment': comment, 'backend': backend,
+            'interleavings': count_interleavings(steps), 'schedules_run': len(runs),
+            'reduced': reduce, 'written_order': list(steps),
+            'written_order_anomalies': written[0]['anomalies'],
+            'serializable_schedules': len([run for run in runs if not run['anomalies']]),
+            'failed_verdicts': len([run for run in runs if run['verdict'] == 'fail']),
+            'inconclusive_verdicts': len([run for run in runs
+                                          if run['verdict'] == 'inconclusive']),
+            'errors': len([run for run in runs
+                           if run['status'] not in ('ok', 'unsupported')]),
+            'unsupported': len([run for run in runs if run['status'] == 'unsupported']),
+            'anomalies': dict((anomaly, {'count': len(schedules), 'schedules': schedules})
+                              for anomaly, schedules in anomalies.items()),
+            'seconds': round(time.time() - started, 3)}
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 4:
+        print('Argument error \n '
+              'Make sure you provide <dbms>,  <testNum> and <yaml file path>')
+        sys.exit(2)
+    dbms, test_num, yaml_file = sys.argv[1:4]
+    if dbms not in SUPPORTED_DBMS:
+        print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+        sys.exit(2)
+
+    try:
+        config = dict(get_section(yaml_file, dbms + '-config'))
+        table_initialization = get_section(yaml_file, 'table-initialization')
+        steps = get_test(yaml_file, dbms, test_num)
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+    if not steps:
+        print('Test ' + test_num + ' has no steps')
+        sys.exit(2)
+
+    result = explore(dbms, config, table_initialization, steps, test_num,
+                     get_comments(yaml_file, dbms).get(test_num, ''),
+                     backend=OPTIONS.get('backend', 'dbms'),
+                     processes=int(OPTIONS['processes']) if OPTIONS.get('processes') else None,
+                     reduce=not OPTIONS.get('all'), limit=int(OPTIONS['max-schedules']))
+    print(json.dumps(result, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
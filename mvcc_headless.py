@@ -0,0 +1,769 @@
+#!/usr/bin/python
+"""
+Runs a test scenario's steps over native DB-API connections,
+one connection per transaction, without tmux or the dbms CLI clients.
+
+Used by mvcc_runner.py when it is started with --headless:
+$ python mvcc_runner.py --headless <dbms> <test_num|all> <yaml_file_path>
+e.g.( python mvcc_runner.py --headless postgres test4 "./mvcc_tests.yml" )
+
+The result of the run is printed as JSON.
+The DB-API driver of the selected dbms must be installed:
+postgres: psycopg2 (or psycopg) | mysql: pymysql (or MySQLdb)
+sqlserver: pyodbc (or pymssql) | oracle: oracledb (or cx_Oracle)
+------------------------------------------------------------------------------
+"""
+import importlib
+import re
+import threading
+import time
+
+import mvcc_locks
+import mvcc_reset
+import mvcc_trace
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class DriverError(Exception):
+    pass
+
+
+# DB-API modules tried in order for every dbms
+DRIVERS = {
+    'postgres': ['psycopg2', 'psycopg'],
+    'mysql': ['pymysql', 'MySQLdb'],
+    'sqlserver': ['pyodbc', 'pymssql'],
+    'oracle': ['oracledb', 'cx_Oracle'],
+}
+
+# the same commands prepare_connection() types into the CLI clients,
+# here they switch the autocommit mode of the DB-API connection
+AUTOCOMMIT_COMMANDS = {
+    'mysql': {'set autocommit=1': True, 'set autocommit=0': False},
+    'postgres': {'\\set autocommit on': True, '\\set autocommit off': False},
+    'sqlserver': {'set implicit_transactions off': True,
+                  'set implicit_transactions on': False},
+    'oracle': {'set autocommit on': True, 'set autocommit off': False},
+}
+
+# commands that only mean something to the CLI clients
+# (formatting, screen clearing, bind variables, batch separators)
+CLIENT_COMMANDS = {
+    'mysql': re.compile(r'^(delimiter|system)\b'),
+    'postgres': re.compile(r'^\\'),
+    'sqlserver': re.compile(r'^(go\b|:)'),
+    'oracle': re.compile(r'^(/$|column\b|clear\b)'),
+}
+
+# error codes (as returned by error_code) of the failures
+# that the isolation levels are expected to raise
+ERROR_KINDS = {
+    'postgres': {'40001': 'serialization_failure', '40P01': 'deadlock',
+                 '55P03': 'lock_timeout'},
+    'mysql': {'1213': 'deadlock', '1205': 'lock_timeout'},
+    'sqlserver': {'1205': 'deadlock', '3960': 'serialization_failure',
+                  '1222': 'lock_timeout'},
+    'oracle': {'8177': 'serialization_failure', '60': 'deadlock',
+               '30006': 'lock_timeout'},
+}
+
+# standard SQLSTATEs, for the connections that report them
+# whatever dbms they stand in for (e.g. mvcc_memory.py)
+SQLSTATE_KINDS = {'40001': 'serialization_failure', '40P01': 'deadlock',
+                  '55P03': 'lock_timeout'}
+
+# session settings that outlive a transaction, reset before a session gets reused
+RESET_STATEMENTS = {
+    'postgres': ['DISCARD ALL'],
+    'mysql': [],
+    'sqlserver': ['SET TRANSACTION ISOLATION LEVEL READ COMMITTED',
+                  'SET LOCK_TIMEOUT -1'],
+    'oracle': [],
+}
+
+# seconds a step may run before its transaction is considered blocked
+# and the next step gets executed
+STEP_BLOCK_TIMEOUT = 1
+
+# seconds to wait for blocked transactions after the last step
+SCENARIO_TIMEOUT = 30
+
+# seconds to wait for the sessions being closed to roll back
+CLOSE_TIMEOUT = 5
+
+# the transaction at the end of a step name, e.g. 'T12' from 'step7_T12'
+STEP_TRANSACTION = re.compile(r'_(T\d+)$')
+
+
+def load_driver(dbms):
+    """
+    Imports the first available DB-API module of the provided dbms.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: the imported module
+    """
+    for module_name in DRIVERS[dbms]:
+        try:
+            return importlib.import_module(module_name)
+        except ImportError:
+            continue
+
+    raise DriverError('No DB-API driver found for ' + dbms +
+                      ', install one of: ' + ', '.join(DRIVERS[dbms]))
+
+
+def connect(dbms, config):
+    """
+    Opens a new DB-API connection to the provided dbms.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :return: DB-API connection
+    """
+    driver = load_driver(dbms)
+    name = driver.__name__
+
+    if name in ('psycopg2', 'psycopg'):
+        return driver.connect(host=config['host'], dbname=config['db'],
+                              user=config['user'], password=config['password'])
+    if name in ('pymysql', 'MySQLdb'):
+        return driver.connect(host=config['host'], database=config['db'],
+                              user=config['user'], password=config['password'])
+    if name == 'pyodbc':
+        return driver.connect(
+            'DRIVER={' + config.get('odbc_driver', 'ODBC Driver 17 for SQL Server') + '};'
+            'SERVER=' + config['host'] + ';DATABASE=' + config['db'] +
+            ';UID=' + config['user'] + ';PWD=' + config['password'])
+    if name == 'pymssql':
+        return driver.connect(server=config['host'], database=config['db'],
+                              user=config['user'], password=config['password'])
+
+    # oracledb | cx_Oracle
+    return driver.connect(user=config['user'], password=config['password'],
+                          dsn=config['host'] + '/' + config['db'])
+
+
+def autocommit_command(dbms, autocommit):
+    """Returns the CLI command that turns autocommit on/off in the provided dbms."""
+    for command, value in AUTOCOMMIT_COMMANDS[dbms].items():
+        if value == autocommit:
+            return command
+
+
+def set_autocommit(connection, autocommit):
+    """Sets autocommit, which is a method in some drivers and an attribute in others."""
+    if callable(getattr(connection, 'autocommit', None)):
+        connection.autocommit(autocommit)
+    else:
+        connection.autocommit = autocommit
+
+
+def translate_statement(dbms, statement):
+    """
+    Translates a line of a test step, written for the dbms CLI client,
+    to an action on a DB-API connection.
+
+    Double semicolons (;;) are what the CLI receives as a single semicolon,
+    trailing semicolons are dropped except for the end of PL/SQL blocks.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param statement: a line from the test step (e.g. 'COMMIT;;')
+    :return: (action, sql) where action is one of 'sql' | 'commit' | 'rollback' |
+             'autocommit' | 'variable' | 'print' | 'skip',
+             or None for comments and empty lines
+    """
+    statement = str(statement).strip()
+    if not statement or statement.startswith('--'):
+        return None
+
+    command = statement.rstrip(';').strip()
+    lowered = command.lower()
+
+    if lowered in AUTOCOMMIT_COMMANDS[dbms]:
+        return 'autocommit', AUTOCOMMIT_COMMANDS[dbms][lowered]
+
+    if CLIENT_COMMANDS[dbms].match(lowered):
+        return 'skip', statement
+
+    if dbms == 'oracle':
+        # sqlplus bind variables, kept by the session
+        match = re.match(r'(var|variable|print|exec|execute)\s+:?(.+)$', command, re.IGNORECASE)
+        if match:
+            keyword = match.group(1).lower()
+            if keyword.startswith('var'):
+                return 'variable', match.group(2).split()[0]
+            if keyword == 'print':
+                return 'print', match.group(2).strip()
+            return 'sql', 'BEGIN ' + match.group(2).strip() + '; END;'
+
+    if lowered in ('commit', 'commit work', 'commit transaction'):
+        return 'commit', None
+    if lowered in ('rollback', 'rollback work', 'rollback transaction'):
+        return 'rollback', None
+
+    if dbms == 'mysql' and command.endswith('//'):
+        command = command[:-2]
+    if dbms == 'oracle' and re.search(r'\bEND$', command, re.IGNORECASE):
+        # PL/SQL blocks need their terminating semicolon
+        command += ';'
+
+    return 'sql', command
+
+
+def error_code(error):
+    """
+    Extracts the vendor error code of a DB-API exception.
+
+    :param error: the raised exception
+    :return: SQLSTATE for postgres/odbc, error number for the rest, or None
+    """
+    for attribute in ('pgcode', 'sqlstate'):
+        if getattr(error, attribute, None):
+            return str(getattr(error, attribute))
+
+    args = getattr(error, 'args', ())
+    if not args:
+        return None
+
+    # cx_Oracle / oracledb keep the error object in args[0]
+    code = getattr(args[0], 'code', args[0])
+    if isinstance(code, int):
+        return str(code)
+
+    # pyodbc puts the SQLSTATE in args[0] and the native error number
+    # in the message, e.g. '[SQL Server]...(1205) (SQLExecDirectW)'
+    match = re.search(r'\((\d{3,})\)', str(error))
+    if match:
+        return match.group(1)
+    if isinstance(code, str) and len(code) < 10:
+        return code
+
+    return None
+
+
+def classify_error(dbms, code):
+    """
+    Classifies an error code of the provided dbms.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param code: as returned by error_code
+    :return: 'serialization_failure' | 'deadlock' | 'lock_timeout' | 'error'
+    """
+    return ERROR_KINDS[dbms].get(str(code)) or SQLSTATE_KINDS.get(str(code), 'error')
+
+
+def not_supported(error):
+    """Checks if the error is a DB-API NotSupportedError (e.g. sql the driver cannot run)."""
+    return 'NotSupportedError' in [error_class.__name__ for error_class in type(error).__mro__]
+
+
+def aborts_transaction(dbms, kind):
+    """Returns True if an error of the provided kind rolls back the whole transaction."""
+    if dbms == 'postgres':
+        # any error leaves a postgres transaction aborted until it ends
+        return True
+    if dbms == 'oracle':
+        # oracle only rolls back the failed statement
+        return False
+    return kind in ('serialization_failure', 'deadlock')
+
+
+class Session(object):
+    """The :class:`Session <Session>` object
+
+    Executes the statements of one transaction on its own connection,
+    in its own worker thread, so that a statement blocked on a lock
+    does not stop the steps of the other transactions.
+    Once the session is created, its connection is only used from the worker,
+    what else needs the connection goes through call.
+
+    :param name: transaction name (e.g. 'T1')
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param connection: DB-API connection used only by this session
+    """
+
+    def __init__(self, name, dbms, connection):
+        self.name = name
+        self.dbms = dbms
+        self.connection = connection
+        self.outcomes = []
+        self.variables = {}
+        self.failed = False
+        # DB-API connections start with autocommit off
+        self.autocommit = False
+        self.jobs = queue.Queue()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.pending = 0
+        self.blocked = False
+        # the step being executed, for mvcc_locks.py
+        self.step = None
+        # mvcc_trace.TraceWriter that gets a record of every executed statement,
+        # with the run, scenario and dbms of trace_context
+        self.trace = None
+        self.trace_context = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.closed = threading.Event()
+        if hasattr(connection, 'on_block'):
+            # the connection reports its lock waits, no need to wait for a timeout
+            connection.on_block = self.set_blocked
+        self.thread = threading.Thread(target=self._work)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, statements, records, step=None):
+        """
+        Queues the statements of a step, results get appended to records.
+
+        :param statements: list of step lines
+        :param records: list that receives one dict per executed statement
+        :param step: (optional) the step's name, for the trace
+        :return: None
+        """
+        with self.lock:
+            self.pending += 1
+            self.idle.clear()
+        self.jobs.put(('steps', statements, records, step))
+
+    def call(self, function, *args):
+        """
+        Calls function(*args) from the worker, after the steps already submitted,
+        and waits for it.
+
+        :param function: e.g. a function that uses the session's connection
+        :return: what the function returns, raises what the function raised
+        """
+        answer = {}
+        done = threading.Event()
+        self.jobs.put(('call', function, args, answer, done))
+        done.wait()
+        if 'error' in answer:
+            raise answer['error']
+
+        return answer['value']
+
+    def wait(self, timeout=None):
+        """Returns True when every submitted step has finished."""
+        return self.idle.wait(timeout)
+
+    def wait_step(self, timeout):
+        """
+        Waits for the submitted steps, giving up as soon as
+        the connection reports that it waits on a lock.
+
+        :param timeout: seconds
+        :return: True when every submitted step has finished
+        """
+        deadline = time.time() + timeout
+        with self.changed:
+            while self.pending and not self.blocked:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+
+            return not self.pending
+
+    def set_blocked(self, blocked):
+        """Called by connections that report when a statement starts/stops waiting on a lock."""
+        with self.changed:
+            self.blocked = blocked
+            self.changed.notify_all()
+
+    def reset(self):
+        """
+        Rolls back and resets the session so that the next scenario
+        can reuse its connection.
+
+        :return: False if the session is still busy or its connection is broken
+        """
+        if not self.idle.is_set() or self.closed.is_set():
+            return False
+
+        self.outcomes = []
+        self.variables = {}
+        self.failed = False
+        self.blocked = False
+        try:
+            self.call(self._reset_connection)
+            self.autocommit = False
+        except Exception:
+            return False
+
+        return True
+
+    def _reset_connection(self):
+        self.connection.rollback()
+        set_autocommit(self.connection, True)
+        cursor = self.connection.cursor()
+        for statement in RESET_STATEMENTS[self.dbms]:
+            cursor.execute(statement)
+        cursor.close()
+        set_autocommit(self.connection, False)
+
+    def close(self):
+        """
+        Closes the session without waiting for it: the worker skips the steps
+        still queued, then rolls back and closes the connection, once the statement
+        it executes (e.g. blocked on a lock of another session) returns, see join.
+        Drivers that serialize on the connection would block the caller
+        if it rolled back itself.
+
+        :return: None
+        """
+        self.closed.set()
+        self.jobs.put(None)
+
+    def join(self, timeout=None):
+        """Returns True when the worker has closed the connection, see close."""
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                try:
+                    self.connection.rollback()
+                    self.connection.close()
+                except Exception:
+                    pass
+                return
+
+            if job[0] == 'call':
+                function, args, answer, done = job[1:]
+                try:
+                    answer['value'] = function(*args)
+                except Exception as err:
+                    answer['error'] = err
+                done.set()
+                continue
+
+            statements, records, step = job[1:]
+            self.step = step
+            for statement in statements:
+                if self.closed.is_set():
+                    break
+                record = self.execute(statement)
+                if record is not None:
+                    records.append(record)
+                    if self.trace:
+                        self.trace.write(mvcc_trace.statement_record(self.trace_context,
+                                                                     step, record))
+
+            with self.lock:
+                self.pending -= 1
+                if not self.pending:
+                    self.idle.set()
+                    self.changed.notify_all()
+
+    def execute(self, statement):
+        """
+        Executes a single step line.
+
+        :param statement: a line from the test step
+        :return: dict describing the execution, or None for comments
+        """
+        translated = translate_statement(self.dbms, statement)
+        if translated is None:
+            return None
+
+        action, sql = translated
+        record = {'transaction': self.name, 'statement': statement,
+                  'action': action, 'start': time.time()}
+        try:
+            if action == 'sql':
+                record['autocommit'] = self.autocommit
+                cursor = self.connection.cursor()
+                binds = self.bind_variables(cursor, sql)
+                if binds:
+                    cursor.execute(sql, binds)
+                    for name, variable in binds.items():
+                        self.variables[name] = variable.getvalue()
+                else:
+                    cursor.execute(sql)
+                record['rowcount'] = cursor.rowcount
+                if cursor.description:
+                    record['columns'] = [column[0] for column in cursor.description]
+                    record['rows'] = [list(row) for row in cursor.fetchall()]
+                cursor.close()
+            elif action == 'commit':
+                self.connection.commit()
+                # committing an aborted transaction only rolls it back
+                self.outcomes.append('aborted' if self.failed else 'committed')
+                self.failed = False
+                record['outcome'] = self.outcomes[-1]
+            elif action == 'rollback':
+                self.connection.rollback()
+                self.outcomes.append('rolled back')
+                self.failed = False
+                record['outcome'] = self.outcomes[-1]
+            elif action == 'autocommit':
+                set_autocommit(self.connection, sql)
+                self.autocommit = sql
+            elif action == 'variable':
+                self.variables[sql] = None
+            elif action == 'print':
+                record['columns'] = [sql]
+                record['rows'] = [[self.variables.get(sql)]]
+        except Exception as err:
+            code = error_code(err)
+            kind = 'unsupported' if not_supported(err) else classify_error(self.dbms, code)
+            record['error'] = {'code': code, 'kind': kind, 'message': str(err).strip()}
+            if action == 'commit':
+                self.outcomes.append('aborted')
+                self.failed = False
+                record['outcome'] = 'aborted'
+            elif not self.autocommit and aborts_transaction(self.dbms, kind):
+                self.failed = True
+        record['end'] = time.time()
+
+        return record
+
+    def bind_variables(self, cursor, sql):
+        """
+        Creates the driver variables for the bind variables (e.g. :doctors_on_call)
+        the sql uses, so that procedures can set them and queries can read them.
+
+        :param cursor: cursor the sql will be executed with
+        :param sql: the sql to be executed
+        :return: dict of variable name to driver variable
+        """
+        binds = {}
+        for name in re.findall(r':(\w+)', sql):
+            if name in self.variables and hasattr(cursor, 'var'):
+                binds[name] = cursor.var(float)
+                binds[name].setvalue(0, self.variables[name])
+
+        return binds
+
+
+def close_sessions(sessions, timeout=CLOSE_TIMEOUT):
+    """
+    Closes the sessions, all of them before waiting for any: a session blocked
+    on a lock of another one gets unblocked by the other one's rollback.
+
+    :param sessions: list of Session
+    :param timeout: (optional) seconds to wait for every session to have rolled back
+    :return: True if every session has rolled back and closed its connection
+    """
+    for session in sessions:
+        session.close()
+
+    deadline = time.time() + timeout
+    return all([session.join(max(0, deadline - time.time())) for session in sessions])
+
+
+def transaction_of(step_name):
+    """
+    Returns the transaction of a step name.
+
+    :param step_name: e.g. 'step2_T2' | 'step7_T12'
+    :return: e.g. 'T2' | 'T12'
+    """
+    match = STEP_TRANSACTION.search(step_name)
+    if not match:
+        raise ValueError('step "' + step_name + '" does not end with its transaction, '
+                         'e.g. step1_T1')
+
+    return match.group(1)
+
+
+def transaction_order(transaction):
+    """Sort key that puts T2 before T10."""
+    return int(transaction[1:])
+
+
+def run_scenario(dbms, config, table_initialization, steps,
+                 test_num=None, test_comment=None, connect_function=None,
+                 sessions=None, trace=None, observe_locks=False):
+    """
+    Re-initializes the tables and executes the steps of a test scenario,
+    one DB-API connection per transaction.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :param steps: the test's steps (e.g. {'step1_T1': [...], 'step2_T2': [...]})
+    :param test_num: e.g. 'test4', copied to the result
+    :param test_comment: the test's comment, copied to the result
+    :param connect_function: called as connect_function(dbms, config), defaults to connect
+    :param sessions: (optional) dict of transaction name to Session, kept open and
+                     reset after the run, missing transactions get added to it
+    :param trace: (optional) mvcc_trace.TraceWriter, gets a record of every statement
+    :param observe_locks: (optional) True watches the lock waits over one more connection,
+                          see mvcc_locks.py, their report goes in 'locks'
+    :return: dict with the results of every executed statement and the
+             seconds each phase took ('timings': connect, reset, steps, total),
+             when every connection it opened started and ended ('connections'),
+             its status is 'unsupported' when a statement raised NotSupportedError
+    """
+    connect_function = connect_function or connect
+    result = {'dbms': dbms, 'test': test_num, 'comment': test_comment,
+              'status': 'ok', 'initialization': [], 'steps': [], 'transactions': {},
+              'timings': {}, 'connections': {}}
+    started = time.time()
+
+    if not steps:
+        result['status'] = 'empty'
+        return result
+
+    transactions = []
+    for step_name in steps:
+        if transaction_of(step_name) not in transactions:
+            transactions.append(transaction_of(step_name))
+
+    keep_sessions = sessions is not None
+    sessions = sessions if keep_sessions else {}
+    observer = None
+    connecting = True
+    try:
+        for transaction in transactions:
+            if transaction not in sessions:
+                connect_started = time.time()
+                sessions[transaction] = Session(transaction, dbms,
+                                                connect_function(dbms, config))
+                result['connections'][transaction] = {'start': connect_started,
+                                                      'end': time.time()}
+        result['timings']['connect'] = time.time() - started
+        monitor = connect_function(dbms, config) if observe_locks else None
+        connecting = False
+        trace_context = {'run': mvcc_trace.new_run_id(), 'scenario': test_num, 'dbms': dbms}
+        for transaction in transactions:
+            sessions[transaction].trace = trace
+            sessions[transaction].trace_context = trace_context
+        if monitor:
+            set_autocommit(monitor, True)
+            observer = mvcc_locks.LockObserver(
+                dbms, dict((transaction, sessions[transaction]) for transaction in transactions),
+                monitor)
+            observer.start()
+
+        phase_started = time.time()
+        initialize_tables(sessions[transactions[0]], dbms, config,
+                          table_initialization, result['initialization'])
+        if trace:
+            trace.write(mvcc_trace.statement_record(trace_context, None,
+                                                    result['initialization'][0]))
+        for transaction in transactions[1:]:
+            sessions[transaction].submit([autocommit_command(dbms, False)], [])
+        result['timings']['reset'] = time.time() - phase_started
+
+        phase_started = time.time()
+        for step_name in steps:
+            # steps of a blocked transaction get queued behind the blocked one
+            session = sessions[transaction_of(step_name)]
+            step = {'step': step_name, 'transaction': session.name,
+                    'blocked': False, 'statements': [], 'start': time.time()}
+            result['steps'].append(step)
+            session.submit(steps[step_name] or [], step['statements'], step_name)
+            if not session.wait_step(STEP_BLOCK_TIMEOUT):
+                step['blocked'] = True
+
+        deadline = time.time() + SCENARIO_TIMEOUT
+        for transaction in transactions:
+            if not sessions[transaction].wait(max(0, deadline - time.time())):
+                result['status'] = 'timeout'
+        result['timings']['steps'] = time.time() - phase_started
+        for step in result['steps']:
+            ends = [record['end'] for record in step['statements'] if 'end' in record]
+            step['duration'] = max(ends) - step['start'] if ends else 0
+        unsupported = [record['error'] for step in result['steps']
+                       for record in step['statements']
+                       if record.get('error', {}).get('kind') == 'unsupported']
+        if unsupported and result['status'] == 'ok':
+            # the scenario did not run as written, its outcome means nothing
+            result['status'] = 'unsupported'
+            result['error'] = unsupported[0]['message']
+
+        for transaction in transactions:
+            outcomes = sessions[transaction].outcomes
+            result['transactions'][transaction] = outcomes[-1] if outcomes else 'open'
+    except DriverError as err:
+        result['status'] = 'error'
+        result['error'] = str(err)
+    except Exception as err:
+        result['status'] = 'error'
+        result['error'] = ('Connection error: ' if connecting else type(err).__name__ + ': ') + \
+            str(err).strip()
+    finally:
+        if observer:
+            observer.stop()
+            result['locks'] = observer.report()
+        closed = []
+        for transaction, session in list(sessions.items()):
+            session.trace = None
+            if keep_sessions and session.reset():
+                continue
+            closed.append(session)
+            del sessions[transaction]
+        close_sessions(closed)
+
+    result['duration'] = result['timings']['total'] = time.time() - started
+
+    return result
+
+
+def initialize_tables(session, dbms, config, table_initialization, records):
+    """
+    Re-initializes the tables as per the table initialization
+    section in the yaml file, restoring them from their baseline
+    when it is still valid (see mvcc_reset.py).
+
+    :param session: the first transaction's session, must be idle
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: list of SQL commands
+    :param records: list that receives the reset's record
+    :return: None
+    """
+    record = {'transaction': session.name, 'statement': 'table-initialization',
+              'action': 'reset', 'start': time.time()}
+    record['mode'] = session.call(mvcc_reset.reset_tables, session.connection, dbms, config,
+                                  table_initialization)
+    record['end'] = time.time()
+    session.autocommit = False
+    records.append(record)
+
+
+def format_result(result):
+    """
+    Formats a scenario result the way the statements and
+    their output would read in the dbms CLI clients.
+
+    :param result: as returned by run_scenario
+    :return: str
+    """
+    lines = [result['dbms'].upper() + ' - ' + str(result['test']).upper() +
+             ' - ' + str(result['comment'] or '')]
+
+    for step in result['steps']:
+        lines.append('')
+        lines.append('-- ' + step['step'] + (' (blocked)' if step['blocked'] else ''))
+        for record in step['statements']:
+            lines.append(record['transaction'] + '> ' + record['statement'])
+            if 'columns' in record:
+                lines.append('    ' + ' | '.join(str(column) for column in record['columns']))
+                for row in record['rows']:
+                    lines.append('    ' + ' | '.join(str(value) for value in row))
+            if 'error' in record:
+                lines.append('    ERROR ' + str(record['error']['code']) +
+                             ': ' + record['error']['message'])
+
+    lines.append('')
+    for transaction in sorted(result['transactions'], key=transaction_order):
+        lines.append(transaction + ': ' + result['transactions'][transaction])
+    if 'analysis' in result:
+        analysis = result['analysis']
+        lines.append('Anomalies: ' + (', '.join(anomaly['type'] for anomaly in
+                                                analysis['anomalies']) or 'none') +
+                     ' - Verdict: ' + analysis['verdict'])
+    lines.append('Status: ' + result['status'] +
+                 (' - ' + result['error'] if 'error' in result else ''))
+
+    return '\n'.join(lines)
@@ -0,0 +1,396 @@
+#!/usr/bin/python
+"""
+Indexes the yaml test file in a single pass over its lines: where every top
+level section (the config sections, the table initialization, every dbms's tests)
+and every test starts and ends, and the comment next to each test
+(e.g. # Anomaly|Lost Update - Isolation|Serializable).
+
+Nothing gets parsed up front: a section, or a single test, is read from
+the file and parsed the first time it is asked for, so running one test
+costs the same whether the file holds ten tests or ten thousand.
+
+The tests can also be split into a directory of yaml files, e.g. one for the
+configs and the table initialization and one per dbms, or one per anomaly
+(see split_file), every function taking a yaml file path also takes
+the directory's path. A section found in more than one file is the one of
+the first file (in file name order), except for the '<dbms>-tests' sections
+whose tests get merged.
+
+The index of a file is cached next to it (.<yaml file name>.index)
+and is reused as long as the file's modification time and size,
+or its content, stay the same.
+
+To split a yaml file:
+$ python mvcc_index.py split <yaml_file_path> <directory> [--by=dbms|anomaly]
+e.g.( python mvcc_index.py split "./mvcc_tests.yml" ./scenarios --by=anomaly )
+------------------------------------------------------------------------------
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+INDEX_VERSION = 2
+
+# top level keys (e.g. 'mysql-config:', 'oracle-tests:') start at the first column
+SECTION_LINE = re.compile(r'^([A-Za-z0-9_-]+):')
+# e.g. '    test4:    # Anomaly|Lost Update - Isolation|Serializable'
+TEST_LINE = re.compile(r'^\s+(test\w*):\s*(#.*)?$')
+# the yaml files of a directory of tests, hidden files (e.g. the caches) are not
+SCENARIO_FILE = re.compile(r'^[^.].*\.ya?ml$')
+# e.g. 'lost update' from '# Anomaly|Lost Update - Isolation|Serializable'
+ANOMALY = re.compile(r'Anomaly\|(.+?)\s+-\s+Isolation\|', re.IGNORECASE)
+
+# indexes already loaded by this process, by absolute yaml file path
+LOADED_INDEXES = {}
+
+
+def cache_path(file_path):
+    """Returns the path of the index cache of the provided yaml file."""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, '.' + name + '.index')
+
+
+def scan_sections(data):
+    """
+    Finds the top level sections of the yaml file, the tests of
+    the '<dbms>-tests' sections and the comment next to every test,
+    in one pass over the lines.
+
+    :param data: content of the yaml file, bytes
+    :return: list of (section name, [start, end], {test: [start, end]}, {test: comment}),
+             start and end are byte offsets in the file
+    """
+    sections = []
+    name, start, tests, comments, test = None, 0, {}, {}, None
+    offset = 0
+
+    for raw_line in data.splitlines(True):
+        line = raw_line.decode('utf-8')
+        match = SECTION_LINE.match(line)
+        if match:
+            if name:
+                if test:
+                    tests[test][1] = offset
+                sections.append((name, [start, offset], tests, comments))
+            name, start, tests, comments, test = match.group(1), offset, {}, {}, None
+        elif name and name.endswith('-tests'):
+            test_match = TEST_LINE.match(line)
+            if test_match:
+                if test:
+                    tests[test][1] = offset
+                test = test_match.group(1)
+                tests[test] = [offset, None]
+                comments[test] = (test_match.group(2) or '').strip()
+        offset += len(raw_line)
+
+    if name:
+        if test:
+            tests[test][1] = offset
+        sections.append((name, [start, offset], tests, comments))
+
+    return sections
+
+
+def build_index(data):
+    """
+    Builds the index of the yaml file.
+
+    :param data: content of the yaml file, bytes
+    :return: index dict
+    """
+    index = {'version': INDEX_VERSION, 'hash': hashlib.sha1(data).hexdigest(),
+             'order': [], 'sections': {}}
+
+    for name, span, tests, comments in scan_sections(data):
+        index['order'].append(name)
+        index['sections'][name] = {'hash': hashlib.sha1(data[span[0]:span[1]]).hexdigest(),
+                                   'span': span, 'tests': tests, 'comments': comments}
+
+    return index
+
+
+def read_cache(file_path):
+    try:
+        with open(cache_path(file_path), 'r') as cache_file:
+            index = json.load(cache_file)
+        if index.get('version') == INDEX_VERSION:
+            return index
+    except (IOError, OSError, ValueError):
+        pass
+
+    return None
+
+
+def write_cache(file_path, index):
+    """Writes the cache atomically, a read-only directory just means no cache."""
+    path = cache_path(file_path)
+    try:
+        with open(path + '.' + str(os.getpid()), 'w') as cache_file:
+            json.dump(index, cache_file)
+        os.rename(path + '.' + str(os.getpid()), path)
+    except (IOError, OSError):
+        pass
+
+
+def load_index(file_path):
+    """
+    Returns the index of a yaml file, from memory, from the cache
+    or by (re-)indexing the file, whichever is still valid.
+
+    :param file_path: yaml file path
+    :return: index dict
+    """
+    absolute_path = os.path.abspath(file_path)
+    stat = os.stat(absolute_path)
+    signature = [stat.st_mtime, stat.st_size]
+
+    index = LOADED_INDEXES.get(absolute_path)
+    if index and index.get('signature') == signature:
+        return index
+
+    index = read_cache(absolute_path)
+    if index and index.get('signature') == signature:
+        LOADED_INDEXES[absolute_path] = index
+        return index
+
+    with open(absolute_path, 'rb') as ymlfile:
+        data = ymlfile.read()
+
+    if not index or index['hash'] != hashlib.sha1(data).hexdigest():
+        index = build_index(data)
+
+    index['signature'] = signature
+    write_cache(absolute_path, index)
+    LOADED_INDEXES[absolute_path] = index
+
+    return index
+
+
+def scenario_files(path):
+    """
+    :param path: yaml file path or directory of yaml files
+    :return: the yaml files, in file name order
+    """
+    if not os.path.isdir(path):
+        return [path]
+
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if SCENARIO_FILE.match(name)]
+
+
+def find_section(path, name):
+    """
+    :param path: yaml file path or directory of yaml files
+    :param name: e.g. 'mysql-config' | 'table-initialization' | 'oracle-tests'
+    :return: list of (yaml file path, the section's index entry), raises KeyError
+             if no file has the section
+    """
+    entries = []
+    for file_path in scenario_files(path):
+        sections = load_index(file_path)['sections']
+        if name in sections:
+            entries.append((file_path, sections[name]))
+    if not entries:
+        raise KeyError(name)
+
+    return entries
+
+
+def parse_span(file_path, span):
+    """
+    Reads a part of the yaml file and parses it.
+
+    :param file_path: yaml file path
+    :param span: [start, end] byte offsets of a section or a test
+    :return: the value of its only key
+    """
+    with open(file_path, 'rb') as ymlfile:
+        ymlfile.seek(span[0])
+        parsed = yaml.load(ymlfile.read(span[1] - span[0]).decode('utf-8'), Loader=SafeLoader)
+
+    return list(parsed.values())[0] if parsed else None
+
+
+def section_data(file_path, entry):
+    """Parses a section of the yaml file the first time it is asked for."""
+    if 'data' not in entry:
+        entry['data'] = parse_span(file_path, entry['span'])
+
+    return entry['data']
+
+
+def load_sections(path):
+    """
+    Returns every top level section, in file order,
+    the way yaml.load would return the whole file.
+
+    :param path: yaml file path or directory of yaml files
+    :return: dict of section name to section value
+    """
+    names = []
+    for file_path in scenario_files(path):
+        names.extend(name for name in load_index(file_path)['order'] if name not in names)
+
+    return dict((name, get_section(path, name)) for name in names)
+
+
+def get_section(path, name):
+    """
+    Returns a top level section.
+
+    :param path: yaml file path or directory of yaml files
+    :param name: e.g. 'mysql-config' | 'table-initialization' | 'oracle-tests'
+    :return: the section's value, raises KeyError if it does not exist
+    """
+    entries = find_section(path, name)
+    if len(entries) == 1 or not name.endswith('-tests'):
+        return section_data(*entries[0])
+
+    tests = {}
+    for file_path, entry in entries:
+        for test_num, steps in (section_data(file_path, entry) or {}).items():
+            tests.setdefault(test_num, steps)
+    return tests
+
+
+def get_test(path, dbms, test_num):
+    """
+    Returns the steps of a test, parsing only the test itself.
+
+    :param path: yaml file path or directory of yaml files
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param test_num: e.g. 'test4'
+    :return: the test's steps, raises KeyError if the test does not exist
+    """
+    for file_path, entry in find_section(path, dbms + '-tests'):
+        if test_num in entry['tests']:
+            if 'data' in entry:
+                return entry['data'][test_num]
+            parsed = entry.setdefault('parsed_tests', {})
+            if test_num not in parsed:
+                parsed[test_num] = parse_span(file_path, entry['tests'][test_num])
+            return parsed[test_num]
+
+    raise KeyError(test_num)
+
+
+def test_numbers(path, dbms):
+    """
+    Returns the tests of a dbms in file order, without parsing them.
+
+    :param path: yaml file path or directory of yaml files
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: e.g. ['test1', 'test2']
+    """
+    tests = []
+    for _, entry in find_section(path, dbms + '-tests'):
+        tests.extend(test_num for test_num in entry['tests'] if test_num not in tests)
+
+    return tests
+
+
+def get_comments(path, dbms):
+    """
+    Returns the comment next to each test of the provided dbms.
+
+    :param path: yaml file path or directory of yaml files
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: dict of test number to comment (e.g. {'test1': '# Anomaly|...'})
+    """
+    comments = {}
+    for _, entry in find_section(path, dbms + '-tests'):
+        for test_num, comment in entry['comments'].items():
+            comments.setdefault(test_num, comment)
+
+    return comments
+
+
+def section_hash(path, name):
+    """
+    Identifies the content of a section, it changes whenever the section's text does.
+
+    :param path: yaml file path or directory of yaml files
+    :param name: e.g. 'mysql-config' | 'table-initialization' | 'oracle-tests'
+    :return: hex digest, raises KeyError if the section does not exist
+    """
+    entries = find_section(path, name)
+    if len(entries) == 1:
+        return entries[0][1]['hash']
+
+    return hashlib.sha1(''.join(os.path.basename(file_path) + entry['hash']
+                                for file_path, entry in entries).encode('utf-8')).hexdigest()
+
+
+def split_file(file_path, directory, by='dbms'):
+    """
+    Splits a yaml file into a directory of yaml files, copying the text
+    of the sections and the tests as it is, comments included:
+    config.yml with every section that holds no tests, and either
+    a <dbms>.yml per '<dbms>-tests' section or a <anomaly>.yml per
+    anomaly (e.g. lost_update.yml) with every dbms's tests of the anomaly.
+
+    :param file_path: yaml file path
+    :param directory: where the files get written, created if it does not exist
+    :param by: (optional) 'dbms' | 'anomaly'
+    :return: the written files
+    """
+    with open(file_path, 'rb') as ymlfile:
+        data = ymlfile.read()
+
+    # file name to the text of every section it gets, in file order
+    files = {}
+    for name, span, tests, comments in scan_sections(data):
+        text = data[span[0]:span[1]]
+        if not name.endswith('-tests'):
+            files.setdefault('config.yml', {})[name] = text
+        elif by == 'dbms' or not tests:
+            files.setdefault(name[:-len('-tests')] + '.yml', {})[name] = text
+        else:
+            # the section's own line (and what precedes its first test) heads every file
+            header = data[span[0]:min(start for start, _ in tests.values())]
+            for test_num, (start, end) in tests.items():
+                match = ANOMALY.search(comments[test_num])
+                file_name = re.sub(r'\W+', '_', match.group(1).strip().lower()) + '.yml' \
+                    if match else 'other.yml'
+                sections = files.setdefault(file_name, {})
+                sections[name] = sections.get(name, header) + data[start:end]
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    written = []
+    for file_name, sections in sorted(files.items()):
+        path = os.path.join(directory, file_name)
+        with open(path, 'wb') as ymlfile:
+            ymlfile.write(b''.join(text if text.endswith(b'\n') else text + b'\n'
+                                   for text in sections.values()))
+        written.append(path)
+
+    return written
+
+
+def main():
+    by = 'dbms'
+    for argument in sys.argv[1:]:
+        if argument.startswith('--by='):
+            by = argument[len('--by='):]
+            sys.argv.remove(argument)
+    if len(sys.argv) < 4 or sys.argv[1] != 'split' or by not in ('dbms', 'anomaly'):
+        print('Argument error \n '
+              'Make sure you provide split <yaml file path> <directory> [--by=dbms|anomaly]')
+        sys.exit(2)
+
+    for path in split_file(sys.argv[2], sys.argv[3], by):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
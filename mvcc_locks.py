@@ -0,0 +1,353 @@
+#!/usr/bin/python
+"""
+Watches the lock waits of a scenario's transactions while it runs:
+a thread polls the dbms's own catalog views over a separate connection
+(pg_stat_activity/pg_blocking_pids, performance_schema.data_lock_waits,
+sys.dm_tran_locks/sys.dm_os_waiting_tasks, v$lock), or the lock table
+of the in-memory engine (see mvcc_memory.py), and records
+    - every wait: which transaction waited on which, in which step,
+      on what and for how long
+    - the wait-for graph every time it changed
+    - the deadlocks (cycles in the graph) at the moment they formed
+It also tells the sessions (see mvcc_headless.Session) when they wait
+on a lock, so that the runner moves on to the next step as soon as
+a step blocks instead of after STEP_BLOCK_TIMEOUT.
+The sessions of the CLI clients (see mvcc_runner.py) get watched the same way,
+as a ClientSession each, their ids read from the output of SESSION_ID_QUERIES.
+
+A report:
+    {"interval": 0.02, "polls": 143, "error": null,
+     "waits": [{"waiter": "T2", "blocker": "T1", "step": "step4_T2", "lock": "tuple",
+                "start": 0.012, "end": 0.871, "seconds": 0.859}],
+     "graph": [{"time": 0.012, "edges": [["T2", "T1"]]}, {"time": 0.871, "edges": []}],
+     "deadlocks": [{"time": 1.05, "transactions": ["T1", "T2"]}]}
+All times are seconds since the observer started.
+------------------------------------------------------------------------------
+"""
+import re
+import threading
+import time
+
+# seconds between two polls
+POLL_INTERVAL = 0.02
+# the entries of a report that are times
+TIMES = ('time', 'start', 'end', 'seconds')
+
+# the query that returns the id of a connection's session, as the wait queries report it
+SESSION_ID_QUERIES = {
+    'postgres': 'SELECT pg_backend_pid()',
+    'mysql': 'SELECT CONNECTION_ID()',
+    'sqlserver': 'SELECT @@SPID',
+    'oracle': "SELECT SYS_CONTEXT('USERENV', 'SID') FROM DUAL",
+}
+
+# the line of a CLI client's output that holds the result of a session id query,
+# e.g. '   12345' | '| 12345 |'
+SESSION_ID_LINE = re.compile(r'^\|?\s*(\d+)\s*\|?$')
+
+# queries that return a row per lock wait:
+# (waiting session, blocking session, seconds waited, what is waited on),
+# tried in order until one works (e.g. MariaDB has no data_lock_waits)
+WAIT_QUERIES = {
+    'postgres': [
+        "SELECT a.pid, b.pid, EXTRACT(EPOCH FROM clock_timestamp() - a.state_change), "
+        "a.wait_event "
+        "FROM pg_stat_activity a CROSS JOIN LATERAL unnest(pg_blocking_pids(a.pid)) AS b(pid) "
+        "WHERE a.wait_event_type = 'Lock'",
+    ],
+    'mysql': [
+        "SELECT rt.PROCESSLIST_ID, bt.PROCESSLIST_ID, "
+        "TIMESTAMPDIFF(MICROSECOND, t.trx_wait_started, NOW(6)) / 1000000, "
+        "CONCAT(l.OBJECT_NAME, ' ', l.LOCK_TYPE, ' ', l.LOCK_MODE) "
+        "FROM performance_schema.data_lock_waits w "
+        "JOIN performance_schema.threads rt ON rt.THREAD_ID = w.REQUESTING_THREAD_ID "
+        "JOIN performance_schema.threads bt ON bt.THREAD_ID = w.BLOCKING_THREAD_ID "
+        "JOIN performance_schema.data_locks l ON l.ENGINE_LOCK_ID = w.REQUESTING_ENGINE_LOCK_ID "
+        "LEFT JOIN information_schema.innodb_trx t ON t.trx_mysql_thread_id = rt.PROCESSLIST_ID",
+        "SELECT r.trx_mysql_thread_id, b.trx_mysql_thread_id, "
+        "TIMESTAMPDIFF(SECOND, r.trx_wait_started, NOW()), r.trx_state "
+        "FROM information_schema.innodb_lock_waits w "
+        "JOIN information_schema.innodb_trx r ON r.trx_id = w.requesting_trx_id "
+        "JOIN information_schema.innodb_trx b ON b.trx_id = w.blocking_trx_id",
+    ],
+    'sqlserver': [
+        "SELECT l.request_session_id, w.blocking_session_id, w.wait_duration_ms / 1000.0, "
+        "l.resource_type + ' ' + l.request_mode "
+        "FROM sys.dm_tran_locks l "
+        "JOIN sys.dm_os_waiting_tasks w ON w.resource_address = l.lock_owner_address "
+        "WHERE l.request_status = 'WAIT'",
+    ],
+    'oracle': [
+        "SELECT w.sid, h.sid, w.ctime, w.type "
+        "FROM v$lock w JOIN v$lock h ON h.id1 = w.id1 AND h.id2 = w.id2 "
+        "AND h.type = w.type AND h.block > 0 AND h.sid != w.sid "
+        "WHERE w.request > 0",
+    ],
+}
+
+
+def find_deadlocks(edges):
+    """
+    Finds the cycles of a wait-for graph.
+
+    :param edges: (waiter, blocker) pairs
+    :return: set of cycles, each a sorted tuple of its transactions
+    """
+    blockers = {}
+    for waiter, blocker in edges:
+        blockers.setdefault(waiter, []).append(blocker)
+
+    cycles = set()
+
+    def visit(start, node, path):
+        for blocker in blockers.get(node, []):
+            if blocker == start:
+                cycles.add(tuple(sorted(path)))
+            elif blocker not in path and blocker > start:
+                visit(start, blocker, path + [blocker])
+
+    for waiter in blockers:
+        visit(waiter, waiter, [waiter])
+
+    return cycles
+
+
+def session_id_from_output(lines):
+    """
+    Finds the session id in the output of a CLI client
+    that executed the dbms's SESSION_ID_QUERIES.
+
+    :param lines: clean output lines
+    :return: the session id as a string, or None
+    """
+    for line in lines:
+        match = SESSION_ID_LINE.match(line.strip())
+        if match:
+            return match.group(1)
+
+    return None
+
+
+def rounded(entry):
+    """Rounds the times of a report entry to 0.1 milliseconds."""
+    return dict((name, round(value, 4) if name in TIMES else value)
+                for name, value in entry.items())
+
+
+class ClientSession(object):
+    """The :class:`ClientSession <ClientSession>` object
+
+    The session of a CLI client, as the observer sees the sessions:
+    the client has no connection to ask, its session id is known already.
+
+    :param name: transaction name (e.g. 'T1')
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.connection = None
+        # the dbms's id of the session, as the wait queries report it
+        self.session_id = None
+        # the step being executed
+        self.step = None
+        self.blocked = False
+
+    def set_blocked(self, blocked):
+        """Called by the observer when the session starts/stops waiting on a lock."""
+        self.blocked = blocked
+
+
+class LockObserver(object):
+    """The :class:`LockObserver <LockObserver>` object
+
+    Polls the lock waits of a scenario's sessions from its own thread.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param sessions: dict of transaction name to mvcc_headless.Session (or ClientSession)
+    :param connection: DB-API connection used only by the observer, with autocommit on,
+                       closed by stop
+    :param interval: (optional) seconds between two polls
+    :param names: (optional) session id (as a string) to transaction name,
+                  for sessions whose ids are known already (e.g. ClientSession)
+    """
+
+    def __init__(self, dbms, sessions, connection, interval=POLL_INTERVAL, names=None):
+        self.dbms = dbms
+        self.sessions = sessions
+        self.connection = connection
+        # the in-memory engine keeps its lock waits in a dict
+        self.engine = getattr(connection, 'engine', None)
+        # the engine's sessions poll too, holding the engine's condition
+        self.lock = self.engine.condition if self.engine is not None else threading.Lock()
+        # (connection, its on_block before start)
+        self.hooks = []
+        self.interval = interval
+        # session id (as a string) to transaction name
+        self.names = dict(names or {})
+        self.query = None
+        self.started = time.time()
+        self.open_waits = {}
+        self.waits = []
+        self.graph = []
+        self.deadlocks = []
+        self.open_deadlocks = set()
+        self.polls = 0
+        self.error = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._observe)
+        self.thread.daemon = True
+
+    def start(self):
+        """
+        Finds the sessions' ids, from the sessions' workers, and starts polling,
+        to be called while the sessions are idle.
+        """
+        try:
+            if self.engine is None and not self.names:
+                for name, session in self.sessions.items():
+                    self.names[session.call(self.session_id, session.connection)] = name
+        except Exception as err:
+            self.error = 'session ids: ' + str(err).strip()
+            return
+        self.started = time.time()
+        for session in self.sessions.values():
+            if hasattr(session.connection, 'on_block'):
+                # the engine's waits can be shorter than a poll interval
+                self.hooks.append((session.connection, session.connection.on_block))
+                session.connection.on_block = self.hook(session.connection.on_block)
+        self.thread.start()
+
+    def session_id(self, connection):
+        """Returns the dbms's id of the session of the provided connection."""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(SESSION_ID_QUERIES[self.dbms])
+            return str(cursor.fetchone()[0]).strip()
+        finally:
+            cursor.close()
+
+    def hook(self, on_block):
+        """Wraps a connection's on_block, every lock wait that starts or ends gets polled."""
+        def notify(blocked):
+            if on_block is not None:
+                on_block(blocked)
+            self.poll_now()
+        return notify
+
+    def stop(self):
+        """Stops polling, closes the connection and ends the waits still open."""
+        if self.thread.is_alive():
+            self.stopping.set()
+            self.thread.join()
+        for connection, on_block in self.hooks:
+            connection.on_block = on_block
+        for key in list(self.open_waits):
+            self.end_wait(key, time.time())
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+    def engine_waits(self):
+        names = dict((session.connection.txn.id, name)
+                     for name, session in self.sessions.items()
+                     if session.connection.txn is not None)
+        return [(names[waiter], names.get(holder, str(holder)), None, 'row')
+                for waiter, holder in self.engine.waits.items() if waiter in names]
+
+    def dbms_waits(self):
+        queries = [self.query] if self.query else WAIT_QUERIES[self.dbms]
+        for number, query in enumerate(queries):
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(query)
+                rows = cursor.fetchall()
+                self.query = query
+                break
+            except Exception:
+                if self.query or number == len(queries) - 1:
+                    raise
+            finally:
+                cursor.close()
+
+        waits = []
+        for waiter, blocker, seconds, lock in rows:
+            waiter = self.names.get(str(waiter).strip())
+            if waiter:
+                waits.append((waiter, self.names.get(str(blocker).strip(), str(blocker)),
+                              float(seconds) if seconds is not None else None, lock))
+        return waits
+
+    def poll(self, now):
+        """
+        Polls the lock waits once and records what changed, holding self.lock.
+
+        :param now: time.time() of the poll
+        :return: None
+        """
+        waits = self.engine_waits() if self.engine is not None else self.dbms_waits()
+        self.polls += 1
+        current = {}
+        for waiter, blocker, seconds, lock in waits:
+            current[(waiter, blocker)] = (seconds, lock)
+
+        for key, (seconds, lock) in current.items():
+            if key not in self.open_waits:
+                session = self.sessions.get(key[0])
+                self.open_waits[key] = {
+                    'waiter': key[0], 'blocker': key[1],
+                    'step': getattr(session, 'step', None), 'lock': lock,
+                    'start': (now - seconds if seconds else now) - self.started}
+        ended = [key for key in self.open_waits if key not in current]
+        for key in ended:
+            self.end_wait(key, now)
+
+        edges = sorted(current)
+        if not self.graph or self.graph[-1]['edges'] != [list(edge) for edge in edges]:
+            self.graph.append({'time': now - self.started,
+                               'edges': [list(edge) for edge in edges]})
+            self.set_blocked(set(waiter for waiter, _ in edges))
+
+        cycles = find_deadlocks(edges)
+        for cycle in cycles - self.open_deadlocks:
+            self.deadlocks.append({'time': now - self.started, 'transactions': list(cycle)})
+        self.open_deadlocks = cycles
+
+    def end_wait(self, key, now):
+        wait = self.open_waits.pop(key)
+        wait['end'] = now - self.started
+        wait['seconds'] = wait['end'] - wait['start']
+        self.waits.append(wait)
+
+    def set_blocked(self, waiters):
+        """Tells the sessions whose connections do not report their lock waits if they wait."""
+        for name, session in self.sessions.items():
+            if not hasattr(session.connection, 'on_block') and \
+                    session.blocked != (name in waiters):
+                session.set_blocked(name in waiters)
+
+    def poll_now(self):
+        """Polls once, unless polling failed before, see poll."""
+        with self.lock:
+            if self.error:
+                return False
+            try:
+                self.poll(time.time())
+            except Exception as err:
+                self.error = str(err).strip()
+                return False
+        return True
+
+    def _observe(self):
+        while not self.stopping.is_set() and self.poll_now():
+            self.stopping.wait(self.interval)
+
+    def report(self):
+        """
+        :return: dict with the waits, the wait-for graph over time and the deadlocks
+        """
+        return {'interval': self.interval, 'polls': self.polls, 'error': self.error,
+                'waits': [rounded(wait) for wait in
+                          sorted(self.waits, key=lambda wait: wait['start'])],
+                'graph': [rounded(change) for change in self.graph],
+                'deadlocks': [rounded(deadlock) for deadlock in self.deadlocks]}
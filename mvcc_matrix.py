@@ -0,0 +1,238 @@
+#!/usr/bin/python
+"""
+Runs every dbms's version of the same anomaly side by side:
+the tests of every dbms are matched by their comment
+(e.g. # Anomaly|Lost Update - Isolation|Serializable) to an anomaly and
+an isolation level, the dbms run at the same time, each in its own worker
+process (its tests one after the other, they share the tables), and the
+results are put together in one anomaly x isolation level x dbms table:
+the anomalies every run showed (see mvcc_anomaly.py), the verdict,
+the transactions' outcomes, the errors and how long the run took.
+
+To run:
+$ python mvcc_matrix.py <yaml_file_path> [<dbms> ...] [--backend=memory]
+                        [--anomalies="lost update,write skew"] [--table]
+e.g.( python mvcc_matrix.py "./mvcc_tests.yml" --backend=memory --table )
+
+Prints the matrix as JSON, --table prints it as a text table instead.
+------------------------------------------------------------------------------
+"""
+import json
+import multiprocessing
+import sys
+import time
+
+import mvcc_anomaly
+import mvcc_headless
+import mvcc_memory
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+SUPPORTED_BACKENDS = ['dbms', 'memory']
+OPTIONS = {}
+
+# the isolation levels from the weakest to the strongest, the rows of the table follow it
+LEVEL_ORDER = ['read uncommitted', 'read committed', 'repeatable read', 'snapshot', 'serializable']
+
+
+def parse_options():
+    """Removes the options (e.g. --table) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+def scenario_keys(yaml_file, dbms):
+    """
+    Maps the tests of a dbms to the anomaly and isolation level of their comment.
+
+    :param yaml_file: yaml file path
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: dict of test number to (anomaly, isolation level), lowercased,
+             tests without such a comment are left out
+    """
+    keys = {}
+    for test_num, comment in get_comments(yaml_file, dbms).items():
+        anomaly, level = mvcc_anomaly.scenario_info(comment)
+        if anomaly:
+            keys[test_num] = (anomaly, level)
+    return keys
+
+
+def summarize(result, analysis):
+    """
+    Reduces a scenario's result and its analysis to a cell of the matrix.
+
+    :param result: as returned by mvcc_headless.run_scenario
+    :param analysis: as returned by mvcc_anomaly.analyze
+    :return: dict
+    """
+    errors = set()
+    for step in result['steps']:
+        for record in step['statements']:
+            if record.get('error'):
+                errors.add(record['error'].get('kind') or 'error')
+
+    cell = {'test': result['test'], 'status': result['status'],
+            'anomalies': sorted(set(anomaly['type'] for anomaly in analysis['anomalies'])),
+            'verdict': analysis['verdict'], 'outcomes': result['transactions'],
+            'errors': sorted(errors),
+            'blocked_steps': len([step for step in result['steps'] if step['blocked']]),
+            'ms': round(result['timings'].get('total', result.get('duration', 0)) * 1000.0, 3)}
+    if result.get('error'):
+        cell['error'] = result['error']
+
+    return cell
+
+
+def run_dbms(job):
+    """
+    Runs the matched tests of a dbms one after the other, the work of a pool process.
+
+    :param job: (yaml_file, dbms, {test number: (anomaly, isolation level)}, backend)
+    :return: (dbms, list of (anomaly, isolation level, cell))
+    """
+    yaml_file, dbms, keys, backend = job
+    config = dict(get_section(yaml_file, dbms + '-config'))
+    table_initialization = get_section(yaml_file, 'table-initialization')
+    comments = get_comments(yaml_file, dbms)
+
+    cells = []
+    for test_num, (anomaly, level) in keys.items():
+        connect_function = mvcc_memory.Engine().connect if backend == 'memory' else None
+        result = mvcc_headless.run_scenario(dbms, config, table_initialization,
+                                            get_test(yaml_file, dbms, test_num),
+                                            test_num, comments[test_num], connect_function)
+        analysis = mvcc_anomaly.analyze(result, table_initialization)
+        cells.append((anomaly, level, summarize(result, analysis)))
+
+    return dbms, cells
+
+
+def level_order(level):
+    return LEVEL_ORDER.index(level) if level in LEVEL_ORDER else len(LEVEL_ORDER)
+
+
+def run_matrix(yaml_file, dbms_list, backend='dbms', anomalies=None, processes=None):
+    """
+    Runs the matched tests of every dbms, one worker process per dbms.
+
+    :param yaml_file: yaml file path
+    :param dbms_list: e.g. ['postgres', 'mysql']
+    :param backend: (optional) 'dbms' | 'memory'
+    :param anomalies: (optional) the anomalies to run (e.g. ['lost update']), default all
+    :param processes: (optional) pool size, default one process per dbms
+    :return: dict with a row per anomaly and isolation level,
+             with the cells of every dbms, one per test in the order of the tests
+    """
+    started = time.time()
+    jobs = []
+    for dbms in dbms_list:
+        keys = scenario_keys(yaml_file, dbms)
+        if anomalies:
+            keys = dict((test_num, key) for test_num, key in keys.items()
+                        if key[0] in anomalies)
+        jobs.append((yaml_file, dbms, keys, backend))
+
+    processes = min(processes or len(jobs), len(jobs))
+    if processes <= 1:
+        results = [run_dbms(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(run_dbms, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    rows = {}
+    for dbms, cells in results:
+        for anomaly, level, cell in cells:
+            rows.setdefault((anomaly, level), {}).setdefault(dbms, []).append(cell)
+
+    return {'backend': backend, 'dbms': list(dbms_list),
+            'rows': [{'anomaly': anomaly, 'level': level, 'dbms': rows[(anomaly, level)]}
+                     for anomaly, level in sorted(rows, key=lambda key: (key[0],
+                                                                         level_order(key[1])))],
+            'seconds': round(time.time() - started, 3)}
+
+
+def format_cell(cell, with_test=False):
+    """
+    Formats a cell, e.g. 'lost update (fail) 3.2ms' | 'error (inconclusive) 2.5ms'.
+
+    :param cell: as returned by summarize, None for no test
+    :param with_test: (optional) True starts it with the test number, e.g. 'test3: ...'
+    :return: string
+    """
+    if not cell:
+        return '-'
+    if cell['status'] != 'ok':
+        shown = cell['status']
+    else:
+        shown = ', '.join(cell['anomalies'] + cell['errors']) or 'no anomaly'
+        shown += ' (' + cell['verdict'] + ') ' + str(round(cell['ms'], 1)) + 'ms'
+    return cell['test'] + ': ' + shown if with_test else shown
+
+
+def format_matrix(matrix):
+    """
+    Formats the matrix as a text table: a line per anomaly and level, a column per dbms.
+    A dbms with several tests of the anomaly and level gets a line per test,
+    its cells start with the test numbers.
+    """
+    header = ['anomaly', 'isolation'] + matrix['dbms']
+    lines = []
+    for row in matrix['rows']:
+        runs = max(len(row['dbms'].get(dbms, [])) for dbms in matrix['dbms'])
+        for run in range(runs):
+            line = [row['anomaly'].title(), row['level'].title()] if run == 0 else ['', '']
+            for dbms in matrix['dbms']:
+                cells = row['dbms'].get(dbms, [])
+                line.append(format_cell(cells[run] if run < len(cells) else None, runs > 1))
+            lines.append(line)
+    widths = [max(len(line[column]) for line in [header] + lines)
+              for column in range(len(header))]
+
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(line, widths)).rstrip()
+                     for line in [header] + lines)
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 2:
+        print('Argument error \n '
+              'Make sure you provide <yaml file path> [<dbms> ...]')
+        sys.exit(2)
+    yaml_file = sys.argv[1]
+    dbms_list = sys.argv[2:] or SUPPORTED_DBMS
+    for dbms in dbms_list:
+        if dbms not in SUPPORTED_DBMS:
+            print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+            sys.exit(2)
+    backend = OPTIONS.get('backend', 'dbms')
+    if backend not in SUPPORTED_BACKENDS:
+        print('Invalid backend!\nSupported backends are: ' + str(SUPPORTED_BACKENDS))
+        sys.exit(2)
+    anomalies = [anomaly.strip().lower() for anomaly in OPTIONS['anomalies'].split(',')] \
+        if OPTIONS.get('anomalies') else None
+
+    try:
+        matrix = run_matrix(yaml_file, dbms_list, backend, anomalies,
+                            int(OPTIONS['processes']) if OPTIONS.get('processes') else None)
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+
+    if OPTIONS.get('table'):
+        print(format_matrix(matrix))
+    else:
+        print(json.dumps(matrix, indent=2, sort_keys=True, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1181 @@
+#!/usr/bin/python
+"""
+Pure-python in-memory multiversion row store, used as an offline
+backend for the test scenarios: no dbms needs to be installed.
+
+It implements the isolation levels the scenarios set up:
+Read Committed (statement snapshots, writers wait on row locks and
+re-check the latest version), Repeatable Read and Snapshot (transaction
+snapshots, first updater wins), Serializable (Serializable Snapshot
+Isolation, rw-antidependency tracking) and the locking levels
+(reads take shared locks held until the transaction ends, the writers
+wait for them). Every dbms maps its isolation level names to these modes
+the way it implements them (see DIALECT_LEVELS).
+
+It exposes a DB-API like connection, so mvcc_headless.py runs the
+scenarios on it the same way it runs them on the real dbms drivers:
+$ python mvcc_runner.py --backend=memory <dbms> <test_num|all> <yaml_file_path>
+
+Only the SQL the scenarios use is understood: SELECT / INSERT / UPDATE /
+DELETE with simple expressions, CREATE / DROP / TRUNCATE TABLE and the
+transaction statements. Procedures, functions and variables are not.
+------------------------------------------------------------------------------
+"""
+import re
+import threading
+import time
+
+# isolation level modes:
+# 'rc'  - read committed, a new snapshot for every statement
+# 'si'  - snapshot isolation, first updater wins
+# 'ssi' - serializable snapshot isolation
+# 'cr'  - innodb repeatable read, snapshot reads but writes on the latest version
+# 'lk'  - locking reads of the latest version, shared locks on the rows read
+# 'lks' - locking reads that also lock the missing keys and the scanned tables
+DIALECT_LEVELS = {
+    'postgres': {'read uncommitted': 'rc', 'read committed': 'rc',
+                 'repeatable read': 'si', 'serializable': 'ssi'},
+    # innodb serializable turns the plain reads into locking reads (next-key locks)
+    'mysql': {'read uncommitted': 'rc', 'read committed': 'rc',
+              'repeatable read': 'cr', 'serializable': 'lks'},
+    'oracle': {'read committed': 'rc', 'serializable': 'si'},
+    # read committed as set up by the runner (READ_COMMITTED_SNAPSHOT ON),
+    # repeatable read and serializable hold shared (key-range) locks
+    'sqlserver': {'read uncommitted': 'rc', 'read committed': 'rc',
+                  'repeatable read': 'lk', 'snapshot': 'si', 'serializable': 'lks'},
+    None: {'read uncommitted': 'rc', 'read committed': 'rc', 'repeatable read': 'si',
+           'snapshot': 'si', 'serializable': 'ssi'},
+}
+DEFAULT_LEVELS = {'mysql': 'repeatable read'}
+
+# the modes whose reads take shared locks
+LOCKING_MODES = ('lk', 'lks')
+
+# statements parsed so far, by sql text
+PARSED_STATEMENTS = {}
+
+
+class Error(Exception):
+    """DB-API style error, sqlstate is what mvcc_headless.error_code reads."""
+
+    def __init__(self, sqlstate, message):
+        Exception.__init__(self, message)
+        self.sqlstate = sqlstate
+
+
+class NotSupportedError(Error):
+
+    def __init__(self, message):
+        Error.__init__(self, '0A000', message)
+
+
+def serialization_failure(message='could not serialize access due to concurrent update'):
+    return Error('40001', message)
+
+
+# ------------------------------------------------------------------------------
+# storage
+# ------------------------------------------------------------------------------
+
+class Version(object):
+    """One version of a row, values is None for a deleted row.
+    commit_ts is None while the creating transaction has not committed."""
+    __slots__ = ('values', 'txn', 'commit_ts', 'prev')
+
+    def __init__(self, values, txn, commit_ts, prev):
+        self.values = values
+        self.txn = txn
+        self.commit_ts = commit_ts
+        self.prev = prev
+
+
+class Table(object):
+    """Rows by primary key, each the newest version of a version chain."""
+    __slots__ = ('name', 'columns', 'key_index', 'rows', 'next_rowid')
+
+    def __init__(self, name, columns, key_index):
+        self.name = name
+        self.columns = columns
+        self.key_index = key_index
+        self.rows = {}
+        self.next_rowid = 0
+
+    def key_of(self, values):
+        if self.key_index is None:
+            self.next_rowid += 1
+            return ('rowid', self.next_rowid)
+        return values[self.key_index]
+
+
+class Transaction(object):
+    __slots__ = ('id', 'mode', 'snapshot', 'commit_ts', 'status', 'failed',
+                 'writes', 'reads', 'read_tables', 'conflicts_in', 'conflicts_out', 'locks')
+
+    def __init__(self, txn_id, mode):
+        self.id = txn_id
+        self.mode = mode
+        self.snapshot = None
+        self.commit_ts = None
+        self.status = 'active'
+        self.failed = False
+        self.writes = []
+        self.reads = set()
+        self.read_tables = set()
+        self.conflicts_in = set()
+        self.conflicts_out = set()
+        # the shared locks it holds, see Engine.share
+        self.locks = []
+
+
+def visible_version(head, txn, snapshot):
+    """
+    Walks the version chain to the version the transaction sees.
+
+    :param head: newest version of the row
+    :param txn: reading Transaction
+    :param snapshot: commit timestamp of the snapshot
+    :return: Version or None
+    """
+    version = head
+    while version is not None:
+        if version.txn == txn.id or (version.commit_ts is not None and
+                                     version.commit_ts <= snapshot):
+            return version
+        version = version.prev
+
+    return None
+
+
+# ------------------------------------------------------------------------------
+# sql parsing
+# ------------------------------------------------------------------------------
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>\d+(?:\.\d+)?) |
+    (?P<string>'(?:[^']|'')*') |
+    (?P<quoted>"[^"]*") |
+    (?P<name>[A-Za-z_@:$][\w$.]*) |
+    (?P<op><>|!=|<=|>=|\|\||[-+*/%=<>(),;])
+)""", re.VERBOSE)
+
+
+def tokenize(sql):
+    tokens = []
+    position = 0
+    sql = sql.strip().rstrip(';')
+    while position < len(sql):
+        match = TOKEN.match(sql, position)
+        if not match or match.end() == position:
+            if sql[position:].strip():
+                raise Error('42601', 'syntax error at or near "' +
+                            sql[position:position + 10] + '"')
+            break
+        position = match.end()
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'number':
+            tokens.append(('value', float(text) if '.' in text else int(text)))
+        elif kind == 'string':
+            tokens.append(('value', text[1:-1].replace("''", "'")))
+        elif kind == 'quoted':
+            tokens.append(('quoted', text[1:-1]))
+        elif kind == 'name':
+            if text[0] in '@:$':
+                raise NotSupportedError('variables are not supported: ' + text)
+            tokens.append(('name', text.lower()))
+        else:
+            tokens.append(('op', text))
+
+    return tokens
+
+
+class Parser(object):
+    """Recursive descent parser for the SQL the scenarios use."""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.tokens = tokenize(sql)
+        self.position = 0
+
+    def peek(self, offset=0):
+        if self.position + offset < len(self.tokens):
+            return self.tokens[self.position + offset]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, *words):
+        """Consumes the words (keywords or operators) if they come next."""
+        for offset, word in enumerate(words):
+            if self.peek(offset)[1] != word:
+                return False
+        self.position += len(words)
+        return True
+
+    def expect(self, *words):
+        if not self.accept(*words):
+            raise Error('42601', 'syntax error, expected "' + ' '.join(words) +
+                        '" in: ' + self.sql)
+
+    def name(self):
+        kind, value = self.next()
+        if kind not in ('name', 'quoted'):
+            raise Error('42601', 'syntax error, expected a name in: ' + self.sql)
+        return value.lower()
+
+    def at_end(self):
+        return self.position >= len(self.tokens)
+
+    # statements
+
+    def statement(self):
+        kind, word = self.peek()
+        handler = getattr(self, 'parse_' + str(word), None)
+        if kind != 'name' or handler is None:
+            raise NotSupportedError('statement not supported: ' + self.sql)
+        self.next()
+        statement = handler()
+        if not self.at_end():
+            raise NotSupportedError('statement not supported: ' + self.sql)
+        return statement
+
+    def parse_begin(self):
+        self.accept('transaction') or self.accept('work')
+        return ('begin',)
+
+    def parse_start(self):
+        self.expect('transaction')
+        return ('begin',)
+
+    def parse_commit(self):
+        self.accept('transaction') or self.accept('work')
+        return ('commit',)
+
+    def parse_rollback(self):
+        self.accept('transaction') or self.accept('work')
+        return ('rollback',)
+
+    def parse_discard(self):
+        self.expect('all')
+        return ('discard',)
+
+    def parse_alter(self):
+        # database options (e.g. ALLOW_SNAPSHOT_ISOLATION) need no setting up here
+        self.expect('database')
+        self.position = len(self.tokens)
+        return ('noop',)
+
+    def parse_set(self):
+        session = self.accept('session')
+        if self.accept('transaction', 'isolation', 'level'):
+            words = []
+            while not self.at_end():
+                words.append(self.name())
+            return ('isolation', ' '.join(words), session)
+        if self.accept('lock_timeout'):
+            return ('lock_timeout', self.expression())
+        raise NotSupportedError('statement not supported: ' + self.sql)
+
+    def parse_truncate(self):
+        self.accept('table')
+        return ('truncate', self.name())
+
+    def parse_drop(self):
+        if not self.accept('table'):
+            raise NotSupportedError('statement not supported: ' + self.sql)
+        if_exists = self.accept('if', 'exists')
+        return ('drop', self.name(), if_exists)
+
+    def parse_create(self):
+        if not self.accept('table'):
+            raise NotSupportedError('statement not supported: ' + self.sql)
+        table = self.name()
+        if self.accept('as'):
+            self.expect('select')
+            return ('create_as', table, self.parse_select())
+
+        self.expect('(')
+        columns, key = [], None
+        while True:
+            if self.accept('primary', 'key'):
+                self.expect('(')
+                key = self.name()
+                self.expect(')')
+            else:
+                columns.append(self.name())
+                depth = 0
+                # skip the column's type and constraints
+                while not (depth == 0 and self.peek()[1] in (',', ')')):
+                    if self.accept('primary', 'key'):
+                        key = columns[-1]
+                        continue
+                    token = self.next()[1]
+                    if token is None:
+                        raise Error('42601', 'syntax error in: ' + self.sql)
+                    depth += {'(': 1, ')': -1}.get(token, 0)
+            if self.accept(')'):
+                break
+            self.expect(',')
+
+        return ('create', table, columns, key)
+
+    def parse_insert(self):
+        self.expect('into')
+        table = self.name()
+        columns = None
+        if self.accept('('):
+            columns = [self.name()]
+            while self.accept(','):
+                columns.append(self.name())
+            self.expect(')')
+        if self.accept('select'):
+            return ('insert_select', table, columns, self.parse_select())
+
+        self.expect('values')
+        rows = [self.tuple()]
+        while self.accept(','):
+            rows.append(self.tuple())
+
+        return ('insert', table, columns, rows)
+
+    def tuple(self):
+        self.expect('(')
+        values = [self.expression()]
+        while self.accept(','):
+            values.append(self.expression())
+        self.expect(')')
+        return values
+
+    def parse_update(self):
+        table = self.name()
+        self.expect('set')
+        assignments = []
+        while True:
+            column = self.name()
+            self.expect('=')
+            assignments.append((column, self.expression()))
+            if not self.accept(','):
+                break
+        where = self.expression() if self.accept('where') else None
+
+        return ('update', table, assignments, where)
+
+    def parse_delete(self):
+        self.expect('from')
+        table = self.name()
+        where = self.expression() if self.accept('where') else None
+
+        return ('delete', table, where)
+
+    def parse_select(self):
+        columns = []
+        if self.accept('*'):
+            columns = None
+        else:
+            while True:
+                start = self.position
+                expression = self.expression()
+                label = ' '.join(str(token[1]) for token in self.tokens[start:self.position])
+                if self.accept('as'):
+                    label = self.name()
+                elif expression[0] == 'column':
+                    label = expression[1]
+                columns.append((label, expression))
+                if not self.accept(','):
+                    break
+
+        into = self.name() if self.accept('into') else None
+        self.expect('from')
+        table = self.name()
+        where = self.expression() if self.accept('where') else None
+        order = []
+        if self.accept('order', 'by'):
+            while True:
+                expression = self.expression()
+                descending = self.accept('desc')
+                if not descending:
+                    self.accept('asc')
+                order.append((expression, descending))
+                if not self.accept(','):
+                    break
+
+        select = ('select', table, columns, where, order)
+        if into:
+            return ('create_as', into, select)
+        return select
+
+    # expressions, lowest precedence first
+
+    def expression(self):
+        left = self.conjunction()
+        while self.accept('or'):
+            left = ('or', left, self.conjunction())
+        return left
+
+    def conjunction(self):
+        left = self.negation()
+        while self.accept('and'):
+            left = ('and', left, self.negation())
+        return left
+
+    def negation(self):
+        if self.accept('not'):
+            return ('not', self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        left = self.additive()
+        operator = self.peek()[1]
+        if operator in ('=', '<>', '!=', '<', '>', '<=', '>='):
+            self.next()
+            return ('compare', operator, left, self.additive())
+        if self.accept('is', 'not', 'null'):
+            return ('not', ('is_null', left))
+        if self.accept('is', 'null'):
+            return ('is_null', left)
+        return left
+
+    def additive(self):
+        left = self.term()
+        while self.peek()[1] in ('+', '-', '||'):
+            left = ('arithmetic', self.next()[1], left, self.term())
+        return left
+
+    def term(self):
+        left = self.factor()
+        while self.peek()[1] in ('*', '/', '%'):
+            left = ('arithmetic', self.next()[1], left, self.factor())
+        return left
+
+    def factor(self):
+        kind, value = self.next()
+        if kind == 'value':
+            return ('value', value)
+        if kind == 'quoted':
+            # a column in standard sql, a string in mysql
+            return ('quoted', value)
+        if value == '(':
+            expression = self.expression()
+            self.expect(')')
+            return expression
+        if value == '-':
+            return ('arithmetic', '-', ('value', 0), self.factor())
+        if kind == 'name':
+            if value == 'null':
+                return ('value', None)
+            if self.peek()[1] == '(':
+                raise NotSupportedError('functions are not supported: ' + value)
+            if value in ('case', 'select', 'exists'):
+                raise NotSupportedError(value.upper() + ' expressions are not supported')
+            return ('column', value.split('.')[-1])
+        raise Error('42601', 'syntax error in: ' + self.sql)
+
+
+def parse(sql):
+    """Parses the sql into a statement tuple, caching it by sql text."""
+    statement = PARSED_STATEMENTS.get(sql)
+    if statement is None:
+        statement = Parser(sql).statement()
+        PARSED_STATEMENTS[sql] = statement
+
+    return statement
+
+
+def evaluate(expression, values, columns):
+    """
+    Evaluates a parsed expression against a row.
+
+    :param expression: expression tuple from the Parser
+    :param values: the row's values
+    :param columns: the table's column names
+    :return: the expression's value
+    """
+    kind = expression[0]
+    if kind == 'value':
+        return expression[1]
+    if kind == 'column':
+        try:
+            return values[columns.index(expression[1])]
+        except ValueError:
+            raise Error('42703', 'column "' + expression[1] + '" does not exist')
+    if kind == 'quoted':
+        if expression[1].lower() in columns:
+            return values[columns.index(expression[1].lower())]
+        return expression[1]
+    if kind == 'and':
+        return bool(evaluate(expression[1], values, columns)) and \
+            bool(evaluate(expression[2], values, columns))
+    if kind == 'or':
+        return bool(evaluate(expression[1], values, columns)) or \
+            bool(evaluate(expression[2], values, columns))
+    if kind == 'not':
+        return not evaluate(expression[1], values, columns)
+    if kind == 'is_null':
+        return evaluate(expression[1], values, columns) is None
+
+    left = evaluate(expression[2], values, columns)
+    right = evaluate(expression[3], values, columns)
+    if left is None or right is None:
+        return None
+    operator = expression[1]
+    if kind == 'compare':
+        if operator == '=':
+            return left == right
+        if operator in ('<>', '!='):
+            return left != right
+        if operator == '<':
+            return left < right
+        if operator == '>':
+            return left > right
+        if operator == '<=':
+            return left <= right
+        return left >= right
+
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '*':
+        return left * right
+    if operator == '/':
+        return left // right if isinstance(left, int) and isinstance(right, int) else left / right
+    if operator == '%':
+        return left % right
+    return str(left) + str(right)
+
+
+def key_lookup(where, table):
+    """Returns the primary key value if the where clause pins it with '=', else None."""
+    if where is None or table.key_index is None:
+        return None
+    if where[0] == 'and':
+        return key_lookup(where[1], table) or key_lookup(where[2], table)
+    if where[0] == 'compare' and where[1] == '=':
+        key_column = table.columns[table.key_index]
+        for column, value in ((where[2], where[3]), (where[3], where[2])):
+            if column == ('column', key_column) and value[0] == 'value':
+                return (value[1],)
+    return None
+
+
+# ------------------------------------------------------------------------------
+# engine
+# ------------------------------------------------------------------------------
+
+class Engine(object):
+    """The :class:`Engine <Engine>` object
+
+    Holds the tables and the transactions of one in-memory database.
+    All its state is guarded by a single condition, writers blocked
+    on a row lock wait on it until the lock holder ends.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.clock = 0
+        self.next_txn_id = 0
+        self.active = {}
+        # committed serializable transactions that can still be in a conflict
+        self.recent_serializable = []
+        # rows with more than one version, for vacuum
+        self.dirty = set()
+        # waiting transaction id -> id of the transaction holding the lock
+        self.waits = {}
+        # (table, key) -> ids of the transactions holding a shared lock on the row,
+        # the key is None for a lock on the whole table
+        self.shared = {}
+        self.condition = threading.Condition()
+
+    def connect(self, dbms=None, config=None):
+        """Opens a new connection, the signature of mvcc_headless.connect."""
+        return Connection(self, dbms)
+
+    def table(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise Error('42P01', 'relation "' + name + '" does not exist')
+
+    # transactions
+
+    def begin(self, mode):
+        self.next_txn_id += 1
+        txn = Transaction(self.next_txn_id, mode)
+        self.active[txn.id] = txn
+        return txn
+
+    def commit(self, txn):
+        if txn.mode == 'ssi' and self.live(txn.conflicts_in) and self.live(txn.conflicts_out):
+            self.abort(txn)
+            raise serialization_failure(
+                'could not serialize access due to read/write dependencies among transactions')
+
+        self.clock += 1
+        txn.commit_ts = self.clock
+        txn.status = 'committed'
+        for table, key in txn.writes:
+            version = table.rows.get(key)
+            while version is not None and version.txn == txn.id:
+                version.commit_ts = txn.commit_ts
+                version = version.prev
+        self.finish(txn)
+
+    def abort(self, txn):
+        txn.status = 'aborted'
+        for table, key in reversed(txn.writes):
+            head = table.rows.get(key)
+            if head is not None and head.txn == txn.id and head.commit_ts is None:
+                if head.prev is None:
+                    del table.rows[key]
+                else:
+                    table.rows[key] = head.prev
+        self.finish(txn)
+
+    def finish(self, txn):
+        self.active.pop(txn.id, None)
+        for lock in txn.locks:
+            holders = self.shared[lock]
+            holders.discard(txn.id)
+            if not holders:
+                del self.shared[lock]
+        txn.locks = []
+        if txn.mode == 'ssi' and txn.status == 'committed':
+            self.recent_serializable.append(txn)
+        if not self.active:
+            self.recent_serializable = []
+            self.vacuum()
+        self.condition.notify_all()
+
+    def live(self, txn_ids):
+        """Returns the transactions of the ids that have not aborted."""
+        return [txn for txn in self.all_serializable()
+                if txn.id in txn_ids and txn.status != 'aborted']
+
+    def all_serializable(self):
+        return [txn for txn in self.active.values() if txn.mode == 'ssi'] + \
+            self.recent_serializable
+
+    def concurrent(self, txn, other):
+        """Checks if the lifetimes of two transactions overlap."""
+        if other.commit_ts is not None and other.commit_ts <= txn.snapshot:
+            return False
+        if txn.commit_ts is not None and txn.commit_ts <= other.snapshot:
+            return False
+        return True
+
+    def vacuum(self):
+        """
+        Drops the versions no snapshot can see any more,
+        only the newest version of every row is kept while nothing is active.
+
+        :return: number of versions removed
+        """
+        removed = 0
+        for table, key in self.dirty:
+            head = table.rows.get(key)
+            if head is None:
+                continue
+            while head.prev is not None:
+                head.prev = head.prev.prev
+                removed += 1
+            if head.values is None:
+                del table.rows[key]
+        self.dirty = set()
+
+        return removed
+
+    def version_count(self):
+        """Returns the number of row versions currently stored."""
+        count = 0
+        for table in self.tables.values():
+            for head in table.rows.values():
+                version = head
+                while version is not None:
+                    count += 1
+                    version = version.prev
+        return count
+
+    # serializable conflicts
+
+    def read_conflict(self, reader, head, visible):
+        """
+        A serializable reader did not see the newer versions of a row,
+        each of their writers gets an rw-antidependency from the reader.
+        """
+        version = head
+        while version is not None and version is not visible:
+            if version.txn != reader.id:
+                writer = self.serializable_txn(version.txn)
+                if writer is not None:
+                    self.add_conflict(reader, writer, reader)
+            version = version.prev
+
+    def write_conflict(self, writer, table, key):
+        """Every serializable reader of the row gets an rw-antidependency to the writer."""
+        for reader in self.all_serializable():
+            if reader is writer or reader.status == 'aborted':
+                continue
+            if (table, key) in reader.reads or table in reader.read_tables:
+                if self.concurrent(reader, writer):
+                    self.add_conflict(reader, writer, writer)
+
+    def serializable_txn(self, txn_id):
+        for txn in self.all_serializable():
+            if txn.id == txn_id:
+                return txn
+        return None
+
+    def add_conflict(self, reader, writer, current):
+        reader.conflicts_out.add(writer.id)
+        writer.conflicts_in.add(reader.id)
+        # a committed transaction with conflicts on both sides is a pivot
+        # that can no longer be aborted, the current transaction is
+        for txn in (reader, writer):
+            if txn.status == 'committed' and self.live(txn.conflicts_in) and \
+                    self.live(txn.conflicts_out):
+                self.abort(current)
+                raise serialization_failure(
+                    'could not serialize access due to read/write dependencies among transactions')
+
+    # row access
+
+    def scan(self, txn, table, where, snapshot, connection=None):
+        """
+        Returns (key, version) of the rows the transaction sees that match the where clause.
+
+        :param txn: Transaction
+        :param table: Table
+        :param where: parsed where clause or None
+        :param snapshot: commit timestamp the rows are read at
+        :param connection: (optional) Connection, the locking modes lock the rows with it
+        :return: list of (key, Version)
+        """
+        rows = []
+        locking = txn.mode in LOCKING_MODES and connection is not None
+        key = key_lookup(where, table)
+        if key is not None:
+            candidates = [(key[0], table.rows.get(key[0]))]
+        else:
+            candidates = list(table.rows.items())
+            if txn.mode == 'ssi':
+                txn.read_tables.add(table)
+            if locking and txn.mode == 'lks':
+                # no other transaction inserts into the table until this one ends
+                self.share(txn, (table, None))
+
+        for row_key, head in candidates:
+            if txn.mode == 'ssi':
+                txn.reads.add((table, row_key))
+            if locking and (head is not None or txn.mode == 'lks'):
+                # waits for the row's writer, then reads its latest version
+                head = self.lock_row(txn, table, row_key, connection, shared=True)
+                snapshot = self.clock
+            if head is None:
+                continue
+            version = visible_version(head, txn, snapshot)
+            if txn.mode == 'ssi':
+                self.read_conflict(txn, head, version)
+            if version is None or version.values is None:
+                continue
+            if where is None or evaluate(where, version.values, table.columns):
+                rows.append((row_key, version))
+
+        return rows
+
+    def lock_row(self, txn, table, key, connection, shared=False):
+        """
+        Waits until no other transaction has an uncommitted version of the row
+        and, unless the lock is shared, until no other transaction holds
+        a shared lock on the row or on its table.
+
+        :param shared: (optional) True takes a shared lock on the row, see share
+        :return: the newest version of the row, or None if it does not exist
+        """
+        blocked = False
+        deadline = None
+        if connection.lock_timeout is not None and connection.lock_timeout >= 0:
+            deadline = time.time() + connection.lock_timeout / 1000.0
+        try:
+            while True:
+                head = table.rows.get(key)
+                holder = self.lock_holder(txn, table, key, head, shared)
+                if holder is None:
+                    if shared:
+                        self.share(txn, (table, key))
+                    return head
+
+                deadlock = False
+                waiting_for = holder
+                while waiting_for in self.waits and not deadlock:
+                    waiting_for = self.waits[waiting_for]
+                    deadlock = waiting_for == txn.id
+
+                remaining = None if deadline is None else deadline - time.time()
+                if not deadlock and remaining is not None and remaining <= 0:
+                    raise Error('55P03', 'lock request time out period exceeded')
+
+                # in waits before it reports the block, for mvcc_locks.py,
+                # also the wait that closes a deadlock so that the cycle gets seen
+                self.waits[txn.id] = holder
+                if not blocked:
+                    blocked = True
+                    connection.blocked(True)
+                if deadlock:
+                    del self.waits[txn.id]
+                    self.abort(txn)
+                    raise Error('40P01', 'deadlock detected')
+                self.condition.wait(remaining)
+                del self.waits[txn.id]
+        finally:
+            if blocked:
+                connection.blocked(False)
+
+    def lock_holder(self, txn, table, key, head, shared):
+        """Returns the id of a transaction the row lock has to be waited for, or None."""
+        if head is not None and head.commit_ts is None and head.txn != txn.id:
+            return head.txn
+        if shared:
+            return None
+        for lock in ((table, key), (table, None)):
+            for holder in sorted(self.shared.get(lock, ())):
+                if holder != txn.id:
+                    return holder
+        return None
+
+    def share(self, txn, lock):
+        """Takes a shared lock, held until the transaction ends."""
+        holders = self.shared.setdefault(lock, set())
+        if txn.id not in holders:
+            holders.add(txn.id)
+            txn.locks.append(lock)
+
+    def write(self, txn, table, key, values):
+        head = table.rows.get(key)
+        if head is not None and head.txn == txn.id and head.commit_ts is None:
+            head.values = values
+        else:
+            table.rows[key] = Version(values, txn.id, None, head)
+            txn.writes.append((table, key))
+            if head is not None:
+                self.dirty.add((table, key))
+
+        if txn.mode == 'ssi':
+            txn.reads.discard((table, key))
+            self.write_conflict(txn, table, key)
+
+    def modify(self, txn, table, where, snapshot, connection, assignments=None):
+        """
+        Updates (or deletes, when assignments is None) the rows matching the where clause.
+
+        :return: number of rows modified
+        """
+        count = 0
+        for key, seen in self.scan(txn, table, where, snapshot, connection):
+            latest = self.lock_row(txn, table, key, connection)
+            if latest is not seen:
+                if txn.mode in ('si', 'ssi'):
+                    self.abort(txn)
+                    raise serialization_failure()
+                # read committed: re-check the latest version of the row
+                if latest is None or latest.values is None or \
+                        (where is not None and not evaluate(where, latest.values, table.columns)):
+                    continue
+
+            if assignments is None:
+                values = None
+            else:
+                values = list(latest.values)
+                for column, expression in assignments:
+                    values[table.columns.index(column)] = evaluate(expression, latest.values,
+                                                                   table.columns)
+                values = tuple(values)
+            self.write(txn, table, key, values)
+            count += 1
+
+        return count
+
+    def insert(self, txn, table, columns, rows, connection):
+        for row in rows:
+            if columns:
+                values = [None] * len(table.columns)
+                for column, value in zip(columns, row):
+                    values[table.columns.index(column)] = value
+            else:
+                values = list(row) + [None] * (len(table.columns) - len(row))
+            values = tuple(values)
+            key = table.key_of(values)
+
+            latest = self.lock_row(txn, table, key, connection)
+            if latest is not None and latest.values is not None:
+                raise Error('23505', 'duplicate key value violates unique constraint "' +
+                            table.name + '_pkey"')
+            self.write(txn, table, key, values)
+
+        return len(rows)
+
+    def select(self, txn, statement, snapshot, connection=None):
+        _, table_name, columns, where, order = statement
+        table = self.table(table_name)
+        rows = [version.values for _, version in self.scan(txn, table, where, snapshot,
+                                                            connection)]
+
+        for expression, descending in reversed(order):
+            rows.sort(key=lambda values: evaluate(expression, values, table.columns),
+                      reverse=descending)
+
+        if columns is None:
+            return list(table.columns), rows
+        return ([label for label, _ in columns],
+                [tuple(evaluate(expression, values, table.columns) for _, expression in columns)
+                 for values in rows])
+
+    def execute(self, txn, statement, connection):
+        """
+        Executes a parsed data statement in the transaction.
+
+        :return: (column names or None, rows, rowcount)
+        """
+        kind = statement[0]
+        if txn.snapshot is None or txn.mode == 'rc' or txn.mode in LOCKING_MODES:
+            # read committed takes a new snapshot for every statement,
+            # the locking reads read the latest versions anyway
+            txn.snapshot = self.clock
+        snapshot = txn.snapshot
+        # innodb repeatable read writes see the latest committed rows
+        write_snapshot = self.clock if txn.mode == 'cr' else snapshot
+
+        if kind == 'select':
+            columns, rows = self.select(txn, statement, snapshot, connection)
+            return columns, rows, len(rows)
+        if kind == 'update':
+            return None, [], self.modify(txn, self.table(statement[1]), statement[3],
+                                         write_snapshot, connection, statement[2])
+        if kind == 'delete':
+            return None, [], self.modify(txn, self.table(statement[1]), statement[2],
+                                         write_snapshot, connection)
+        if kind == 'insert':
+            rows = [[evaluate(value, (), []) for value in row] for row in statement[3]]
+            return None, [], self.insert(txn, self.table(statement[1]), statement[2],
+                                         rows, connection)
+        if kind == 'insert_select':
+            _, rows = self.select(txn, statement[3], snapshot, connection)
+            return None, [], self.insert(txn, self.table(statement[1]), statement[2],
+                                         rows, connection)
+
+        raise NotSupportedError('statement not supported: ' + kind)
+
+    def execute_ddl(self, txn, statement):
+        """Executes a parsed table statement, these are not transactional."""
+        kind = statement[0]
+        if kind == 'create':
+            _, name, columns, key = statement
+            if name in self.tables:
+                raise Error('42P07', 'relation "' + name + '" already exists')
+            self.tables[name] = Table(name, columns, columns.index(key) if key else None)
+        elif kind == 'create_as':
+            _, name, select = statement
+            if name in self.tables:
+                raise Error('42P07', 'relation "' + name + '" already exists')
+            columns, rows = self.select(txn, select, self.clock)
+            table = self.tables[name] = Table(name, columns, None)
+            for values in rows:
+                table.rows[table.key_of(values)] = Version(tuple(values), 0, 0, None)
+            return len(rows)
+        elif kind == 'drop':
+            if statement[1] not in self.tables:
+                if statement[2]:
+                    return 0
+                raise Error('42P01', 'table "' + statement[1] + '" does not exist')
+            del self.tables[statement[1]]
+        elif kind == 'truncate':
+            self.table(statement[1]).rows.clear()
+
+        return 0
+
+
+# ------------------------------------------------------------------------------
+# DB-API
+# ------------------------------------------------------------------------------
+
+class Connection(object):
+    """The :class:`Connection <Connection>` object
+
+    DB-API like connection to an Engine. Like the DB-API drivers,
+    autocommit is off and transactions begin with the first statement.
+
+    :param engine: Engine
+    :param dbms: (optional) the dbms whose isolation levels are emulated
+    """
+
+    def __init__(self, engine, dbms=None):
+        self.engine = engine
+        self.dbms = dbms if dbms in DIALECT_LEVELS else None
+        self.autocommit = False
+        self.txn = None
+        self.explicit = False
+        self.aborted = False
+        self.session_level = DEFAULT_LEVELS.get(self.dbms, 'read committed')
+        self.next_level = None
+        # milliseconds, None waits forever
+        self.lock_timeout = None
+        # called with True/False when a statement starts/stops waiting on a lock
+        self.on_block = None
+
+    def blocked(self, is_blocked):
+        if self.on_block is not None:
+            self.on_block(is_blocked)
+
+    def mode(self, level):
+        try:
+            return DIALECT_LEVELS[self.dbms][level]
+        except KeyError:
+            raise NotSupportedError('isolation level "' + level + '" is not supported')
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        with self.engine.condition:
+            txn, self.txn, self.explicit = self.txn, None, False
+            # like the drivers, committing an aborted transaction only rolls it back
+            self.aborted = False
+            if txn is not None and txn.status == 'active':
+                if txn.failed:
+                    self.engine.abort(txn)
+                else:
+                    self.engine.commit(txn)
+
+    def rollback(self):
+        with self.engine.condition:
+            txn, self.txn, self.explicit = self.txn, None, False
+            self.aborted = False
+            if txn is not None and txn.status == 'active':
+                self.engine.abort(txn)
+
+    def close(self):
+        self.rollback()
+
+    def transaction(self):
+        if self.txn is None:
+            self.txn = self.engine.begin(self.mode(self.next_level or self.session_level))
+            self.next_level = None
+        return self.txn
+
+    def execute(self, sql):
+        """
+        Executes a statement.
+
+        :return: (column names or None, rows, rowcount)
+        """
+        statement = parse(sql)
+        kind = statement[0]
+
+        with self.engine.condition:
+            if kind == 'begin':
+                self.transaction()
+                self.explicit = True
+                return None, [], -1
+            if kind in ('commit', 'rollback'):
+                return None, [], -1
+            if kind == 'isolation':
+                self.set_isolation(statement[1], statement[2])
+                return None, [], -1
+            if kind == 'lock_timeout':
+                self.lock_timeout = evaluate(statement[1], (), [])
+                return None, [], -1
+            if kind == 'discard':
+                self.session_level = DEFAULT_LEVELS.get(self.dbms, 'read committed')
+                self.next_level, self.lock_timeout = None, None
+                return None, [], -1
+            if kind == 'noop':
+                return None, [], -1
+
+            if self.aborted:
+                raise Error('25P02', 'current transaction is aborted, '
+                                     'commands ignored until end of transaction block')
+            txn = self.transaction()
+            if txn.failed:
+                raise Error('25P02', 'current transaction is aborted, '
+                                     'commands ignored until end of transaction block')
+            try:
+                if kind in ('create', 'create_as', 'drop', 'truncate'):
+                    result = None, [], self.engine.execute_ddl(txn, statement)
+                else:
+                    result = self.engine.execute(txn, statement, self)
+            except Error as err:
+                if txn.status == 'aborted':
+                    # serialization failures and deadlocks roll the transaction back,
+                    # postgres refuses statements until it ends, the others start a new one
+                    self.aborted = self.dbms in (None, 'postgres') and \
+                        not (self.autocommit and not self.explicit)
+                    self.txn, self.explicit = None, False
+                elif self.dbms in (None, 'postgres'):
+                    txn.failed = True
+                if self.autocommit and not self.explicit:
+                    self.end_statement()
+                raise err
+
+            if self.autocommit and not self.explicit:
+                self.end_statement()
+
+            return result
+
+    def end_statement(self):
+        txn, self.txn = self.txn, None
+        if txn is not None and txn.status == 'active':
+            if txn.failed:
+                self.engine.abort(txn)
+            else:
+                self.engine.commit(txn)
+
+    def set_isolation(self, level, session):
+        mode = self.mode(level)
+        if self.dbms == 'sqlserver':
+            # sql server keeps the isolation level for the session,
+            # a running transaction keeps the one it started with
+            self.session_level = level
+            if self.txn is not None and self.txn.snapshot is not None:
+                return
+        if self.txn is not None and self.txn.snapshot is not None:
+            raise Error('25001', 'SET TRANSACTION ISOLATION LEVEL must be called '
+                                 'before any query')
+        if self.txn is not None:
+            self.txn.mode = mode
+        else:
+            self.next_level = level
+        if session:
+            self.session_level = level
+
+
+class Cursor(object):
+    """DB-API like cursor of a Connection."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.rows = []
+
+    def execute(self, sql, parameters=None):
+        if parameters:
+            raise NotSupportedError('bind variables are not supported')
+        columns, self.rows, self.rowcount = self.connection.execute(sql)
+        self.description = None
+        if columns is not None:
+            self.description = [(column, None, None, None, None, None, None)
+                                for column in columns]
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+def connect(dbms=None, config=None):
+    """Opens a connection to a new, empty, in-memory database."""
+    return Engine().connect(dbms, config)
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+"""
+Keeps counters and histograms of the runner's activity in process
+and writes them in the Prometheus text format to a file, again and again,
+so that node_exporter's textfile collector picks them up during
+long unattended runs:
+    mvcc_scenarios_total{dbms,status}         scenarios run, by how they ended
+    mvcc_steps_total{dbms}                    steps executed
+    mvcc_connection_attempts_total{dbms}      dbms connections attempted
+    mvcc_errors_total{dbms,class}             errors, by class: the connection error reasons
+                                              of mvcc_classify.py (host, database, authentication),
+                                              timeout and the statement error kinds
+                                              (e.g. serialization_failure, deadlock)
+    mvcc_step_seconds{dbms}                   histogram of the steps' latency
+    mvcc_connection_seconds{dbms}             histogram of the connections' latency
+
+The file is replaced atomically, node_exporter never reads half of it.
+------------------------------------------------------------------------------
+"""
+import bisect
+import os
+import threading
+
+# seconds between two writes of the file
+WRITE_INTERVAL = 15.0
+# upper bounds of the histograms' buckets, in seconds
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+
+# name: (type, help), in the order they get written
+METRICS = [
+    ('mvcc_scenarios_total', ('counter', 'Test scenarios run, by status.')),
+    ('mvcc_steps_total', ('counter', 'Test steps executed.')),
+    ('mvcc_connection_attempts_total', ('counter', 'DBMS connections attempted.')),
+    ('mvcc_errors_total', ('counter', 'Connection and statement errors, by class.')),
+    ('mvcc_step_seconds', ('histogram', 'Latency of the test steps.')),
+    ('mvcc_connection_seconds', ('histogram', 'Latency of the DBMS connections.')),
+]
+
+
+def escape(value):
+    """Escapes a label value, see the Prometheus text format."""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(labels):
+    """
+    :param labels: tuple of (name, value) pairs
+    :return: e.g. '{class="host",dbms="postgres"}' | ''
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join(name + '="' + escape(value) + '"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics(object):
+    """The :class:`Metrics <Metrics>` object
+
+    The counters and histograms of a process, safe to update from any thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) to value
+        self.counters = {}
+        # (name, labels) to [count per bucket (the last one is +Inf), sum, count]
+        self.histograms = {}
+
+    def inc(self, name, labels=None, value=1):
+        """
+        Adds to a counter.
+
+        :param name: e.g. 'mvcc_steps_total'
+        :param labels: (optional) dict, e.g. {'dbms': 'postgres'}
+        :param value: (optional) how much to add
+        :return: None
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, labels=None):
+        """
+        Adds a sample to a histogram.
+
+        :param name: e.g. 'mvcc_step_seconds'
+        :param seconds: the sample
+        :param labels: (optional) dict, e.g. {'dbms': 'postgres'}
+        :return: None
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def render(self):
+        """
+        :return: every metric in the Prometheus text format
+        """
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = dict((key, [list(value[0]), value[1], value[2]])
+                              for key, value in self.histograms.items())
+
+        lines = []
+        for name, (metric_type, help_text) in METRICS:
+            lines.append('# HELP ' + name + ' ' + help_text)
+            lines.append('# TYPE ' + name + ' ' + metric_type)
+            if metric_type == 'counter':
+                for key in sorted(key for key in counters if key[0] == name):
+                    lines.append(name + format_labels(key[1]) + ' ' + format_value(counters[key]))
+                continue
+            for key in sorted(key for key in histograms if key[0] == name):
+                buckets, total, count = histograms[key]
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS + [float('inf')], buckets):
+                    cumulative += bucket_count
+                    lines.append(name + '_bucket' +
+                                 format_labels(key[1] + (('le', format_value(bound)),)) +
+                                 ' ' + str(cumulative))
+                lines.append(name + '_sum' + format_labels(key[1]) + ' ' + format_value(total))
+                lines.append(name + '_count' + format_labels(key[1]) + ' ' + str(count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Replaces the file atomically with the rendered metrics."""
+        with open(path + '.' + str(os.getpid()), 'w') as metrics_file:
+            metrics_file.write(self.render())
+        os.rename(path + '.' + str(os.getpid()), path)
+
+
+def observe_result(metrics, result):
+    """
+    Counts a scenario run over DB-API connections, on the in-memory engine
+    or in the dbms CLI clients.
+
+    :param metrics: Metrics
+    :param result: as returned by mvcc_headless.run_scenario or mvcc_pty.run_scenario
+    :return: None
+    """
+    labels = {'dbms': result['dbms']}
+    metrics.inc('mvcc_scenarios_total', {'dbms': result['dbms'], 'status': result['status']})
+    if result['status'] == 'empty':
+        return
+
+    connections = result.get('connections', {})
+    for transaction in sorted(connections):
+        metrics.inc('mvcc_connection_attempts_total', labels)
+        metrics.observe('mvcc_connection_seconds',
+                        connections[transaction]['end'] - connections[transaction]['start'],
+                        labels)
+    if 'connect' not in result['timings'] and result['status'] == 'error':
+        # a connection failed
+        metrics.inc('mvcc_connection_attempts_total', labels)
+        metrics.inc('mvcc_errors_total', {'dbms': result['dbms'], 'class': 'connection'})
+
+    for step in result['steps']:
+        metrics.inc('mvcc_steps_total', labels)
+        metrics.observe('mvcc_step_seconds', step.get('duration', 0), labels)
+        for record in step.get('statements', []):
+            if record.get('error'):
+                metrics.inc('mvcc_errors_total', {'dbms': result['dbms'],
+                                                  'class': record['error'].get('kind') or 'error'})
+        # the dbms CLI clients only tell the kind of the errors
+        for kind in step.get('errors', []):
+            metrics.inc('mvcc_errors_total', {'dbms': result['dbms'], 'class': kind})
+    if result['status'] == 'timeout':
+        metrics.inc('mvcc_errors_total', {'dbms': result['dbms'], 'class': 'timeout'})
+
+
+class TextfileWriter(object):
+    """The :class:`TextfileWriter <TextfileWriter>` object
+
+    Writes the metrics to a file from a writer thread, every interval and once more when closed.
+
+    :param metrics: Metrics
+    :param path: the file, e.g. /var/lib/node_exporter/textfile/mvcc.prom
+    :param interval: (optional) seconds between two writes
+    """
+
+    def __init__(self, metrics, path, interval=WRITE_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.error = None
+        self.closing = threading.Event()
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self):
+        try:
+            self.metrics.write(self.path)
+            self.error = None
+        except (IOError, OSError) as err:
+            # a missing directory must not stop the runs, the next write tries again
+            self.error = str(err)
+
+    def _write(self):
+        while not self.closing.wait(self.interval):
+            self.write()
+
+    def close(self):
+        """Stops the writer thread and writes the metrics one last time."""
+        if self.thread.is_alive():
+            self.closing.set()
+            self.thread.join()
+        self.write()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,210 @@
+#!/usr/bin/python
+"""
+Compiles the tests of a dbms in the yaml test file into an execution plan,
+once, so that running a scenario (again and again) does no parsing
+or string work:
+the transactions of every test get integer ids (T1 is 0, T2 is 1, ...),
+every statement is the list of lines typed in the CLI client with
+the dbms's batch terminator already in place (GO for sqlserver),
+and the table initialization is already filtered for the dbms.
+The database settings (sqlserver's row versioning) come apart from the
+table initialization, they need the database to themselves.
+
+The plans are cached next to the yaml file (.<yaml file name>.<dbms>.plan),
+or in the directory of yaml files (.<dbms>.plan), and get compiled again
+when the sections they come from change, see mvcc_index.py.
+
+A plan:
+    {"version": 2, "hash": "...", "dbms": "sqlserver",
+     "database": [["IF NOT EXISTS (...) ALTER DATABASE ...;;", "GO"], ...],
+     "initialization": [["CREATE TABLE ...;;", "GO"], ...],
+     "tests": {"test4": {"comment": "# Anomaly|...", "transactions": ["T1", "T2"],
+                         "steps": [["step1_T1", 0, [["BEGIN TRAN;;", "GO"], ...]], ...]}}}
+
+To run (prints the plan):
+$ python mvcc_plan.py <dbms> <yaml_file_path | directory>
+------------------------------------------------------------------------------
+"""
+import hashlib
+import json
+import os
+import sys
+
+from mvcc_headless import transaction_of
+from mvcc_headless import transaction_order
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+from mvcc_index import section_hash
+from mvcc_index import test_numbers
+from mvcc_reset import database_statements
+
+PLAN_VERSION = 2
+
+# the line that executes the lines typed before it, by dbms
+BATCH_TERMINATORS = {'sqlserver': 'GO'}
+
+# plans already loaded by this process, by (absolute yaml file or directory path, dbms)
+LOADED_PLANS = {}
+
+
+def cache_path(file_path, dbms):
+    """Returns the path of the plan cache of the provided yaml file (or directory) and dbms."""
+    if os.path.isdir(file_path):
+        return os.path.join(os.path.abspath(file_path), '.' + dbms + '.plan')
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, '.' + name + '.' + dbms + '.plan')
+
+
+def batch(dbms, statement):
+    """
+    Returns the lines typed in the dbms CLI client for a statement,
+    the last one executes it.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param statement: a line from the test step (e.g. 'COMMIT;;')
+    :return: e.g. ['COMMIT;;'] | ['COMMIT;;', 'GO']
+    """
+    statement = str(statement)
+    terminator = BATCH_TERMINATORS.get(dbms)
+    if terminator and statement.strip().upper() != terminator:
+        return [statement, terminator]
+
+    return [statement]
+
+
+def table_initialization_statements(dbms, table_initialization):
+    """
+    Returns the statements that re-initialize the tables in the dbms CLI,
+    when they cannot be reset over a DB-API connection.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :return: list of statements
+    """
+    statements = []
+    for create_table_instructions in table_initialization:
+        if dbms == 'sqlserver':
+            if create_table_instructions == 'COMMIT;;':
+                continue
+
+        statements.append(create_table_instructions)
+
+    return statements
+
+
+def compile_test(dbms, steps, comment=''):
+    """
+    Compiles the steps of a test.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param steps: the test's steps (e.g. {'step1_T1': [...], 'step2_T2': [...]})
+    :param comment: (optional) the test's comment
+    :return: dict with the comment, the transactions ordered by id and the steps
+             as [step name, transaction id, [lines of every statement]]
+    """
+    steps = steps or {}
+    transactions = sorted(set(transaction_of(step_name) for step_name in steps),
+                          key=transaction_order)
+    ids = dict((transaction, number) for number, transaction in enumerate(transactions))
+
+    return {'comment': comment, 'transactions': transactions,
+            'steps': [[step_name, ids[transaction_of(step_name)],
+                       [batch(dbms, statement) for statement in statements or []]]
+                      for step_name, statements in steps.items()]}
+
+
+def sections_hash(file_path, dbms):
+    """Hashes what a dbms's plan is compiled from: config, tests and table initialization."""
+    names = [dbms + '-config', 'table-initialization', dbms + '-tests']
+    text = str(PLAN_VERSION) + ''.join(section_hash(file_path, name) for name in names)
+
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def compile_plan(file_path, dbms):
+    """
+    Compiles the plan of a dbms.
+
+    :param file_path: yaml file path or directory of yaml files
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: plan dict
+    """
+    comments = get_comments(file_path, dbms)
+    initialization = table_initialization_statements(
+        dbms, get_section(file_path, 'table-initialization'))
+    database = database_statements(dbms, get_section(file_path, dbms + '-config')['db'])
+
+    return {'version': PLAN_VERSION, 'hash': sections_hash(file_path, dbms), 'dbms': dbms,
+            'database': [batch(dbms, statement + ';;') for statement in database],
+            'initialization': [batch(dbms, statement) for statement in initialization],
+            'tests': dict((test_num, compile_test(dbms, get_test(file_path, dbms, test_num),
+                                                  comments.get(test_num, '')))
+                          for test_num in test_numbers(file_path, dbms))}
+
+
+def read_cache(file_path, dbms):
+    try:
+        with open(cache_path(file_path, dbms), 'r') as cache_file:
+            plan = json.load(cache_file)
+        if plan.get('version') == PLAN_VERSION:
+            return plan
+    except (IOError, OSError, ValueError):
+        pass
+
+    return None
+
+
+def write_cache(file_path, dbms, plan):
+    """Writes the cache atomically, a read-only directory just means no cache."""
+    path = cache_path(file_path, dbms)
+    try:
+        with open(path + '.' + str(os.getpid()), 'w') as cache_file:
+            json.dump(plan, cache_file)
+        os.rename(path + '.' + str(os.getpid()), path)
+    except (IOError, OSError):
+        pass
+
+
+def load_plan(file_path, dbms):
+    """
+    Returns the plan of a dbms, from memory, from the cache
+    or by compiling it, whichever is still valid.
+
+    :param file_path: yaml file path or directory of yaml files
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: plan dict, raises KeyError if the dbms's sections do not exist
+             and ValueError if a step name has no transaction
+    """
+    absolute_path = os.path.abspath(file_path)
+    plan_hash = sections_hash(absolute_path, dbms)
+
+    plan = LOADED_PLANS.get((absolute_path, dbms))
+    if plan and plan['hash'] == plan_hash:
+        return plan
+
+    plan = read_cache(absolute_path, dbms)
+    if not plan or plan['hash'] != plan_hash:
+        plan = compile_plan(absolute_path, dbms)
+        write_cache(absolute_path, dbms, plan)
+    LOADED_PLANS[(absolute_path, dbms)] = plan
+
+    return plan
+
+
+def main():
+    if len(sys.argv) < 3:
+        print('Argument error \n '
+              'Make sure you provide <dbms> and <yaml file path or directory>')
+        sys.exit(2)
+    try:
+        plan = load_plan(sys.argv[2], sys.argv[1])
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+
+    print(json.dumps(plan, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/python
+"""
+Checks that a dbms is ready to accept connections by probing its host
+directly: a TCP connection followed by the start of the dbms's own protocol
+(postgres SSLRequest, mysql server greeting, sqlserver TDS pre-login,
+a plain TCP connection for oracle), instead of asking systemctl about
+the service. Works with any server the yaml file points to, local,
+in a container or on another host.
+
+Failed probes are retried with an exponential backoff, results are cached
+for a few seconds, in memory and in a small file shared by the processes
+(MVCC_sim.py checks the dbms and then starts mvcc_runner.py which checks it again).
+
+To run:
+$ python mvcc_probe.py <yaml_file_path> [<dbms> ...]
+e.g.( python mvcc_probe.py "./mvcc_tests.yml" postgres mysql )
+------------------------------------------------------------------------------
+"""
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+from mvcc_index import get_section
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+DEFAULT_PORTS = {'postgres': 5432, 'mysql': 3306, 'sqlserver': 1433, 'oracle': 1521}
+# seconds to connect and to get the handshake's answer
+PROBE_TIMEOUT = 1.0
+# retries of a failed probe, the first after BACKOFF seconds, doubling after every retry
+RETRIES = 2
+BACKOFF = 0.2
+# seconds a result is trusted, failures are trusted for less
+READY_TTL = 5.0
+FAILED_TTL = 1.0
+CACHE_FILE = os.environ.get(
+    'MVCC_PROBE_CACHE',
+    os.path.join(os.environ.get('XDG_RUNTIME_DIR', '/tmp'),
+                 'mvcc_probe_' + str(os.getuid()) + '.json'))
+
+# (dbms, host, port) to probe result
+CACHE = {}
+CACHE_LOCK = threading.Lock()
+
+
+class ProbeError(Exception):
+    pass
+
+
+def address_of(dbms, config):
+    """
+    Finds the host and port of a dbms's configuration:
+    a 'port' entry, a port after the host ('127.0.0.1:5433', or '127.0.0.1,1434' for sqlserver)
+    or the dbms's default port.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :return: (host, port)
+    """
+    host = str(config.get('host') or 'localhost').strip()
+    port = config.get('port')
+    separator = ',' if dbms == 'sqlserver' and ',' in host else ':'
+    if host.count(':') <= 1 and separator in host:
+        host, _, host_port = host.partition(separator)
+        port = port or host_port
+    if host.startswith('tcp:'):
+        host = host[4:]
+
+    return host, int(port or DEFAULT_PORTS[dbms])
+
+
+def receive(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ProbeError('connection closed after ' + str(len(data)) + ' bytes')
+        data += chunk
+    return data
+
+
+def postgres_handshake(sock):
+    """Sends an SSLRequest, a postgres server answers 'S' or 'N'."""
+    sock.sendall(struct.pack('!ii', 8, 80877103))
+    answer = receive(sock, 1)
+    if answer not in (b'S', b'N'):
+        raise ProbeError('unexpected answer to SSLRequest: ' + repr(answer))
+
+
+def mysql_handshake(sock):
+    """Reads the server greeting (protocol version 10) or an error packet (host not allowed)."""
+    header = receive(sock, 4)
+    length = struct.unpack('<I', header[:3] + b'\x00')[0]
+    payload = receive(sock, min(length, 1))
+    if payload not in (b'\x0a', b'\xff'):
+        raise ProbeError('unexpected server greeting: ' + repr(payload))
+
+
+def sqlserver_handshake(sock):
+    """Sends a TDS pre-login with the version option only, a server answers with its own."""
+    # option VERSION at offset 6 (after itself and the terminator), 6 bytes long
+    payload = struct.pack('!BHH', 0, 6, 6) + b'\xff' + b'\x00' * 6
+    sock.sendall(struct.pack('!BBHHBB', 0x12, 0x01, 8 + len(payload), 0, 1, 0) + payload)
+    answer = receive(sock, 1)
+    if answer != b'\x04':
+        raise ProbeError('unexpected answer to pre-login: ' + repr(answer))
+
+
+HANDSHAKES = {
+    'postgres': postgres_handshake,
+    'mysql': mysql_handshake,
+    'sqlserver': sqlserver_handshake,
+    # the TNS handshake needs the service name, an accepted connection is enough
+    'oracle': None,
+}
+
+
+def probe(dbms, host, port, timeout=PROBE_TIMEOUT):
+    """
+    Probes a dbms once.
+
+    :return: dict with ready, host, port, seconds and the error if not ready
+    """
+    started = time.time()
+    result = {'dbms': dbms, 'host': host, 'port': port, 'ready': False}
+    try:
+        sock = socket.create_connection((host, port), timeout)
+        try:
+            sock.settimeout(timeout)
+            if HANDSHAKES[dbms]:
+                HANDSHAKES[dbms](sock)
+        finally:
+            sock.close()
+        result['ready'] = True
+    except (socket.error, ProbeError) as err:
+        result['error'] = str(err) or type(err).__name__
+    result['seconds'] = round(time.time() - started, 4)
+
+    return result
+
+
+def load_cache_file():
+    try:
+        with open(CACHE_FILE, 'r') as cache_file:
+            return json.load(cache_file)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_cache_file(key, result):
+    cached = load_cache_file()
+    now = time.time()
+    # drop the stale entries while at it
+    cached = dict((name, entry) for name, entry in cached.items()
+                  if now - entry.get('checked', 0) < READY_TTL)
+    cached[key] = result
+    try:
+        temporary_file = CACHE_FILE + '.' + str(os.getpid())
+        with open(temporary_file, 'w') as cache_file:
+            json.dump(cached, cache_file)
+        os.rename(temporary_file, CACHE_FILE)
+    except (IOError, OSError):
+        pass
+
+
+def is_fresh(result, now):
+    ttl = READY_TTL if result.get('ready') else FAILED_TTL
+    return now - result.get('checked', 0) < ttl
+
+
+def check(dbms, config, retries=RETRIES, backoff=BACKOFF, timeout=PROBE_TIMEOUT, use_cache=True):
+    """
+    Checks that a dbms accepts connections, with the cached result when it is fresh,
+    probing (and retrying with backoff) otherwise.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param retries: (optional) retries of a failed probe
+    :param backoff: (optional) seconds before the first retry, doubling after every retry
+    :param timeout: (optional) seconds of every probe
+    :param use_cache: (optional) False always probes
+    :return: the probe's result dict
+    """
+    host, port = address_of(dbms, config)
+    key = dbms + '|' + host + '|' + str(port)
+    now = time.time()
+    if use_cache:
+        with CACHE_LOCK:
+            result = CACHE.get(key)
+        if not result or not is_fresh(result, now):
+            result = load_cache_file().get(key)
+        if result and is_fresh(result, now):
+            result = dict(result, cached=True)
+            with CACHE_LOCK:
+                CACHE[key] = result
+            return result
+
+    for attempt in range(retries + 1):
+        result = probe(dbms, host, port, timeout)
+        if result['ready']:
+            break
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+    result['attempts'] = attempt + 1
+    result['checked'] = time.time()
+
+    with CACHE_LOCK:
+        CACHE[key] = result
+    save_cache_file(key, result)
+
+    return result
+
+
+def is_running(dbms, config, **kwargs):
+    """Checks if the dbms accepts connections, see check."""
+    return check(dbms, config, **kwargs)['ready']
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Argument error \n '
+              'Make sure you provide <yaml file path> [<dbms> ...]')
+        sys.exit(2)
+    yaml_file = sys.argv[1]
+    dbms_list = sys.argv[2:] or SUPPORTED_DBMS
+    for dbms in dbms_list:
+        if dbms not in SUPPORTED_DBMS:
+            print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+            sys.exit(2)
+
+    results = [check(dbms, dict(get_section(yaml_file, dbms + '-config')), use_cache=False)
+               for dbms in dbms_list]
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if all(result['ready'] for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,525 @@
+#!/usr/bin/python
+"""
+Runs the test scenarios in the dbms CLI clients (psql, mysql, sqlplus, sqlcmd)
+without tmux: every transaction's client runs on its own pseudo terminal
+and a single asyncio event loop reads all of them, noticing the prompts
+(see mvcc_classify.py) as soon as the output arrives.
+Statements are typed the way tmux would type them, so the clients behave
+as in MVCC_sim.py, and many scenarios can run from one process.
+
+To run:
+$ python mvcc_pty.py <dbms>[,<dbms>...] <test_num|all> <yaml_file_path>
+                     [--concurrency=N] [--trace=<file>] [--blocked-after=<seconds>]
+e.g.( python mvcc_pty.py postgres,mysql all "./mvcc_tests.yml" )
+
+The scenarios of every dbms run one after the other (they share the tables),
+the dbms run at the same time. --concurrency=N runs up to N scenarios of
+a dbms at the same time, for scenarios that do not share tables: it is refused
+when the yaml file has a table-initialization, which every scenario re-runs.
+Prints the transcript of every transaction's client as JSON,
+--trace=<file> appends a record of every statement to the file (see mvcc_trace.py).
+
+A statement is blocked when the dbms reports its client's session waiting on a lock,
+the lock waits get polled over a DB-API connection (see mvcc_locks.py).
+Without the dbms's DB-API driver a statement that printed nothing for
+--blocked-after seconds (see mvcc_runner.BLOCKED_AFTER) is considered blocked.
+------------------------------------------------------------------------------
+"""
+import asyncio
+import codecs
+import fcntl
+import json
+import os
+import pty
+import struct
+import sys
+import termios
+import time
+
+import mvcc_headless
+import mvcc_locks
+import mvcc_runner
+import mvcc_trace
+from mvcc_classify import ERROR
+from mvcc_classify import OutputClassifier
+from mvcc_classify import READY
+from mvcc_index import get_section
+from mvcc_plan import batch
+from mvcc_plan import load_plan
+from mvcc_stream import MAX_BUFFER
+from mvcc_stream import clean_output
+
+OPTIONS = {'concurrency': 1}
+# rows and columns of every pseudo terminal, wide enough for the result sets
+TERMINAL_SIZE = (52, 200)
+# seconds a scenario's blocked statements get to finish after its last step
+FINISH_TIMEOUT = 5
+
+
+def parse_options():
+    """Removes the options (e.g. --concurrency=4) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+def as_typed(statement):
+    """
+    Returns what the client receives when tmux types the statement:
+    tmux takes a semicolon at the end of an argument as a command separator,
+    which is why the yaml file ends the statements with two.
+    """
+    statement = str(statement)
+    if statement.endswith(';'):
+        statement = statement[:-1]
+    return statement
+
+
+class PtyClient(object):
+    """The :class:`PtyClient <PtyClient>` object
+
+    A dbms CLI client on its own pseudo terminal, read by the event loop.
+
+    :param name: the transaction (e.g. 'T1')
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param max_buffer: (optional) bytes of output kept in memory
+    """
+
+    def __init__(self, name, dbms, max_buffer=MAX_BUFFER):
+        self.name = name
+        self.dbms = dbms
+        self.max_buffer = max_buffer
+        self.buffer = bytearray()
+        # total bytes received, used as a position in the stream
+        self.position = 0
+        self.closed = False
+        self.blocked = False
+        self.process = None
+        self.master = None
+        self.changed = asyncio.Event()
+        self.classifier = OutputClassifier(dbms)
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        # the client's session as the lock observer sees it
+        self.session = mvcc_locks.ClientSession(name)
+        # mvcc_locks.LockObserver of the scenario, see start_lock_observer
+        self.observer = None
+
+    async def start(self, command):
+        """Spawns the client's command (a shell command line) on a new pseudo terminal."""
+        self.master, slave = pty.openpty()
+        fcntl.ioctl(slave, termios.TIOCSWINSZ, struct.pack('HHHH', TERMINAL_SIZE[0],
+                                                          TERMINAL_SIZE[1], 0, 0))
+        environment = dict(os.environ, PAGER='cat')
+        try:
+            self.process = await asyncio.create_subprocess_exec(
+                '/bin/sh', '-c', command, stdin=slave, stdout=slave, stderr=slave,
+                env=environment, start_new_session=True)
+        finally:
+            os.close(slave)
+        os.set_blocking(self.master, False)
+        asyncio.get_event_loop().add_reader(self.master, self._read)
+
+    def _read(self):
+        try:
+            chunk = os.read(self.master, 4096)
+        except OSError:
+            # EIO once the client exited
+            chunk = b''
+        if not chunk:
+            asyncio.get_event_loop().remove_reader(self.master)
+            self.closed = True
+        else:
+            self.buffer += chunk
+            del self.buffer[:-self.max_buffer]
+            self.position += len(chunk)
+            self.classifier.feed(self.decoder.decode(chunk))
+        self.changed.set()
+
+    def text(self, since=0):
+        """Returns the output received after the position, as much as is still buffered."""
+        new_bytes = max(0, self.position - since)
+        if new_bytes >= len(self.buffer):
+            data = bytes(self.buffer)
+        else:
+            data = bytes(self.buffer[-new_bytes:]) if new_bytes else b''
+
+        return data.decode('utf-8', 'replace')
+
+    def lines(self, since=0):
+        return clean_output(self.text(since))
+
+    async def wait_for_output(self, since, timeout):
+        """
+        Waits until output arrives after the provided position.
+
+        :return: True if output arrived, False on timeout or if the client exited
+        """
+        deadline = time.time() + timeout
+        while self.position <= since:
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.closed:
+                return False
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+
+        return True
+
+    async def wait_for_state(self, states, timeout):
+        """
+        Waits until the classifier's state is one of the provided ones.
+
+        :param states: e.g. [mvcc_classify.READY, mvcc_classify.ERROR]
+        :param timeout: seconds
+        :return: the state, or None on timeout or if the client exited
+        """
+        deadline = time.time() + timeout
+        while True:
+            state = self.classifier.state()
+            if state in states:
+                return state
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.closed:
+                return None
+            await self.wait_for_output(self.position, remaining)
+
+    def type(self, statement):
+        """Types the statement followed by Enter, the way tmux's send-keys does."""
+        os.write(self.master, (as_typed(statement) + '\r').encode('utf-8'))
+
+    async def wait_for_statement(self, since):
+        """
+        Waits until the statement has finished (new output ending with the prompt)
+        or is blocked, see mvcc_runner.wait_for_statement: the lock observer sees
+        the client's session wait on a lock, or, without a lock observer,
+        no output has arrived for BLOCKED_AFTER seconds and there is no prompt.
+
+        :return: 'done' | 'blocked'
+        """
+        observer = self.observer if self.observer and not self.observer.error else None
+        blocked_after = mvcc_runner.OBSERVED_BLOCKED_AFTER if observer \
+            else mvcc_runner.BLOCKED_AFTER
+        # the session's blocked counts once a whole poll ran after the statement was sent
+        polls = observer.polls + 2 if observer else 0
+        position = since
+        last_output = time.time()
+
+        while True:
+            if await self.wait_for_output(position, min(mvcc_runner.BLOCKED_CHECK_INTERVAL,
+                                                        blocked_after)):
+                position = self.position
+                last_output = time.time()
+                if self.classifier.state() == READY:
+                    return 'done'
+            elif observer and self.session.blocked and observer.polls >= polls:
+                return 'blocked'
+            elif self.closed or time.time() - last_output >= blocked_after:
+                return 'blocked'
+
+    async def send_statement(self, lines):
+        """
+        Sends a statement, as the lines typed for it (see mvcc_plan.batch),
+        and waits for it, see mvcc_runner.send_statement.
+
+        :return: 'done' | 'blocked'
+        """
+        if self.blocked:
+            if self.classifier.state() != READY:
+                for line in lines:
+                    self.type(line)
+                return 'blocked'
+            self.blocked = False
+
+        for line in lines[:-1]:
+            self.type(line)
+
+        position = self.position
+        self.classifier.expect()
+        self.type(lines[-1])
+        state = await self.wait_for_statement(position)
+        self.blocked = state == 'blocked'
+
+        return state
+
+    async def read_session_id(self):
+        """
+        Reads the id of the client's dbms session (see mvcc_locks.SESSION_ID_QUERIES)
+        from its output, for the lock observer. The client must be connected,
+        with autocommit on so that the query starts no transaction.
+        """
+        position = self.position
+        await self.send_statement(batch(self.dbms,
+                                        mvcc_locks.SESSION_ID_QUERIES[self.dbms] + ';;'))
+        self.session.session_id = mvcc_locks.session_id_from_output(self.lines(position))
+
+    async def connect(self, connection_string):
+        """
+        Starts the client and waits for its prompt.
+
+        :return: True once connected, False on timeout
+        :raises mvcc_runner.HostError, DatabaseError, AuthenticationError: when the client
+                prints why it could not connect
+        """
+        await self.start(connection_string)
+        state = await self.wait_for_state([READY, ERROR], mvcc_runner.CONNECTION_TIMEOUT)
+        if state == ERROR:
+            raise mvcc_runner.CONNECTION_ERRORS[self.classifier.error](connection_string)
+
+        return state == READY
+
+    async def close(self):
+        if self.master is not None and not self.closed:
+            asyncio.get_event_loop().remove_reader(self.master)
+        if self.process is not None and self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, 15)
+            except OSError:
+                pass
+            try:
+                await asyncio.wait_for(self.process.wait(), 1)
+            except asyncio.TimeoutError:
+                self.process.kill()
+        if self.master is not None:
+            os.close(self.master)
+            self.master = None
+
+
+def can_observe_locks(dbms):
+    """Checks if the lock waits can be watched, which takes the dbms's DB-API driver."""
+    try:
+        mvcc_headless.load_driver(dbms)
+        return True
+    except mvcc_headless.DriverError:
+        return False
+
+
+def start_lock_observer(dbms, config, clients):
+    """
+    Starts watching the lock waits of the clients' sessions over a DB-API connection,
+    so that their wait_for_statement knows when a statement waits on a lock.
+    Blocks, to be run in an executor.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param clients: the scenario's PtyClients, their session ids read
+    :return: mvcc_locks.LockObserver, or None if a session id is missing
+             or the connection failed
+    """
+    names = dict((client.session.session_id, client.name) for client in clients)
+    if None in names:
+        return None
+    try:
+        connection = mvcc_headless.connect(dbms, config)
+        mvcc_headless.set_autocommit(connection, True)
+    except Exception:
+        return None
+
+    observer = mvcc_locks.LockObserver(dbms, dict((client.name, client.session)
+                                                  for client in clients),
+                                       connection, names=names)
+    observer.start()
+    return observer
+
+
+async def run_scenario(dbms, config, table_initialization, plan, test_num, trace=None):
+    """
+    Runs a test scenario, one client per transaction, on the running event loop.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :param plan: the dbms's plan, see mvcc_plan.load_plan
+    :param test_num: e.g. 'test4'
+    :param trace: (optional) mvcc_trace.TraceWriter, gets a record of every statement
+    :return: result dict, with the transcript of every transaction's client,
+             when every client started connecting and got its prompt
+             and, when the lock waits were watched, their report in 'locks'
+    """
+    test = plan['tests'][test_num]
+    result = {'dbms': dbms, 'test': test_num, 'comment': test['comment'], 'status': 'ok',
+              'steps': [], 'transactions': {}, 'timings': {}, 'connections': {}}
+    if not test['steps']:
+        result['status'] = 'empty'
+        return result
+
+    connection_string, clear_command, autocommit_on, autocommit_off = \
+        mvcc_runner.connection_commands(dbms, config['user'], config['password'],
+                                        config['db'], config['host'])
+    transactions = test['transactions']
+    clients = dict((transaction, PtyClient(transaction, dbms)) for transaction in transactions)
+    # the clients by transaction id
+    ordered_clients = [clients[transaction] for transaction in transactions]
+    transcript_start = {}
+    trace_context = {'run': mvcc_trace.new_run_id(), 'scenario': test_num, 'dbms': dbms}
+    observer = None
+
+    async def connect(transaction):
+        connect_started = time.time()
+        connected = await clients[transaction].connect(connection_string)
+        result['connections'][transaction] = {'start': connect_started, 'end': time.time(),
+                                              'connected': connected}
+        return connected
+
+    started = time.time()
+    try:
+        # changing the database settings (sqlserver) needs the database to itself,
+        # the first client sets them before the others connect
+        connected = [await connect(transactions[0])] if plan['database'] else []
+        if connected and connected[0]:
+            for lines in plan['database']:
+                await clients[transactions[0]].send_statement(lines)
+        connected += await asyncio.gather(*[connect(transaction)
+                                            for transaction in transactions[len(connected):]])
+        result['timings']['connect'] = time.time() - started
+        if not all(connected):
+            result['status'] = 'timeout'
+            result['error'] = 'no prompt after ' + str(mvcc_runner.CONNECTION_TIMEOUT) + ' seconds'
+            return result
+
+        reset_started = time.time()
+        first = clients[transactions[0]]
+        # terminate any left over transactions
+        await first.send_statement(batch(dbms, autocommit_on))
+        reset = await asyncio.get_event_loop().run_in_executor(
+            None, mvcc_runner.reset_tables, dbms, config, table_initialization)
+        if not reset:
+            for lines in plan['initialization']:
+                await first.send_statement(lines)
+        if can_observe_locks(dbms):
+            for client in ordered_clients:
+                await client.read_session_id()
+            observer = await asyncio.get_event_loop().run_in_executor(
+                None, start_lock_observer, dbms, config, ordered_clients)
+            for client in ordered_clients:
+                client.observer = observer
+        autocommit_off = batch(dbms, autocommit_off)
+        for transaction in transactions:
+            await clients[transaction].send_statement(autocommit_off)
+            clients[transaction].type(clear_command)
+            transcript_start[transaction] = clients[transaction].position
+        result['timings']['reset'] = time.time() - reset_started
+
+        steps_started = time.time()
+        for step_name, transaction_id, statements in test['steps']:
+            client = ordered_clients[transaction_id]
+            client.session.step = step_name
+            step_started = time.time()
+            states, errors = [], []
+            for lines in statements:
+                statement_started = time.time()
+                states.append(await client.send_statement(lines))
+                if client.classifier.statement_error:
+                    errors.append(client.classifier.statement_error)
+                if trace:
+                    trace.write(mvcc_trace.statement_record(
+                        trace_context, step_name,
+                        mvcc_trace.cli_record(client.name, lines[0], statement_started,
+                                              states[-1], client.classifier.statement_error)))
+            result['steps'].append({'step': step_name, 'transaction': client.name,
+                                    'start': step_started,
+                                    'duration': time.time() - step_started,
+                                    'blocked': 'blocked' in states, 'errors': errors})
+
+        # give the statements still blocked the chance to finish
+        for client in clients.values():
+            if client.blocked:
+                await client.wait_for_state([READY], FINISH_TIMEOUT)
+        result['timings']['steps'] = time.time() - steps_started
+    except (mvcc_runner.HostError, mvcc_runner.DatabaseError,
+            mvcc_runner.AuthenticationError) as err:
+        result['status'] = 'error'
+        result['error'] = type(err).__name__ + ': ' + str(err)
+    finally:
+        if observer:
+            await asyncio.get_event_loop().run_in_executor(None, observer.stop)
+            result['locks'] = observer.report()
+        for transaction, client in clients.items():
+            result['transactions'][transaction] = \
+                client.lines(transcript_start.get(transaction, 0))
+        await asyncio.gather(*[client.close() for client in clients.values()])
+        result['timings']['total'] = time.time() - started
+
+    return result
+
+
+async def run_scenarios(yaml_file, dbms_list, test_num, concurrency=1, trace=None):
+    """
+    Runs the scenarios of every dbms, the dbms at the same time
+    and up to concurrency scenarios of each dbms at the same time.
+    With a trace (mvcc_trace.TraceWriter), every statement gets recorded in it.
+
+    :return: list of result dicts
+    :raises ValueError: when scenarios sharing the table initialization
+                        would run at the same time
+    """
+    table_initialization = get_section(yaml_file, 'table-initialization')
+
+    async def run_dbms(dbms):
+        config = dict(get_section(yaml_file, dbms + '-config'))
+        plan = load_plan(yaml_file, dbms)
+        test_nums = list(plan['tests']) if test_num == 'all' else [test_num]
+        if concurrency > 1 and len(test_nums) > 1 and table_initialization:
+            # every scenario re-initializes the same tables, the runs would mix their rows
+            raise ValueError('--concurrency=' + str(concurrency) + ' needs scenarios that '
+                             'do not share tables, every ' + dbms + ' scenario re-runs '
+                             'the table-initialization')
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_test(scenario):
+            async with semaphore:
+                return await run_scenario(dbms, config, table_initialization, plan,
+                                          scenario, trace)
+
+        return await asyncio.gather(*[run_test(scenario) for scenario in test_nums])
+
+    results = []
+    for dbms_results in await asyncio.gather(*[run_dbms(dbms) for dbms in dbms_list]):
+        results.extend(dbms_results)
+
+    return results
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 4:
+        print('Argument error \n '
+              'Make sure you provide <dbms>,  <testNum> and <yaml file path>')
+        sys.exit(2)
+    dbms_list = sys.argv[1].split(',')
+    test_num, yaml_file = sys.argv[2:4]
+    for dbms in dbms_list:
+        if dbms not in mvcc_runner.SUPPORTED_DBMS:
+            print('Invalid DBMS name!\nSupported DBMSs are: ' + str(mvcc_runner.SUPPORTED_DBMS))
+            sys.exit(2)
+
+    if OPTIONS.get('blocked-after'):
+        try:
+            mvcc_runner.BLOCKED_AFTER = float(OPTIONS['blocked-after'])
+        except ValueError:
+            print('Invalid --blocked-after!\nIt is a number of seconds, e.g. 0.5')
+            sys.exit(2)
+
+    trace = mvcc_trace.TraceWriter(OPTIONS['trace']) if OPTIONS.get('trace') else None
+    try:
+        results = asyncio.get_event_loop().run_until_complete(
+            run_scenarios(yaml_file, dbms_list, test_num, int(OPTIONS['concurrency']), trace))
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+    except ValueError as err:
+        print(str(err))
+        sys.exit(2)
+    finally:
+        if trace:
+            trace.close()
+
+    print(json.dumps(results[0] if len(results) == 1 else results, indent=2, default=str))
+    sys.exit(0 if all(result['status'] in ('ok', 'empty') for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+"""
+Resets the tables of the table initialization section
+without replaying it statement by statement on every run.
+
+The first run replays the section once and copies every created table
+to a baseline table (<table>_mvcc_baseline), recording a fingerprint
+of the section in the mvcc_baseline table. The following runs restore
+each table from its baseline with a TRUNCATE and a single INSERT ... SELECT,
+so the reset cost stays the same no matter how many runs go back to back.
+A changed table initialization section gets a new baseline.
+------------------------------------------------------------------------------
+"""
+import hashlib
+import json
+import re
+
+import mvcc_headless
+
+BASELINE_SUFFIX = '_mvcc_baseline'
+FINGERPRINT_TABLE = 'mvcc_baseline'
+
+CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(\w+)', re.IGNORECASE)
+
+
+def fingerprint(dbms, table_initialization):
+    """Identifies a table initialization section, for the provided dbms."""
+    return hashlib.sha1(json.dumps([dbms, list(table_initialization or [])])
+                        .encode('utf-8')).hexdigest()
+
+
+def created_tables(table_initialization):
+    """Returns the tables the table initialization section creates, in order."""
+    tables = []
+    for statement in table_initialization or []:
+        match = CREATE_TABLE.match(str(statement))
+        if match and match.group(1) not in tables:
+            tables.append(match.group(1))
+
+    return tables
+
+
+def execute(connection, dbms, statements, ignore_errors=False):
+    """
+    Executes the statements with a new cursor.
+
+    :param connection: DB-API connection
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param statements: statements as written in the yaml file
+    :param ignore_errors: (optional) carry on after a failed statement
+    :return: the rows of the last statement that returned any
+    """
+    rows = None
+    cursor = connection.cursor()
+    try:
+        for statement in statements:
+            translated = mvcc_headless.translate_statement(dbms, statement)
+            if translated is None or translated[0] != 'sql':
+                continue
+            try:
+                cursor.execute(translated[1])
+                if cursor.description:
+                    rows = cursor.fetchall()
+            except Exception:
+                if not ignore_errors:
+                    raise
+    finally:
+        cursor.close()
+
+    return rows
+
+
+def restore_statements(tables):
+    """Returns the statements that restore the tables from their baselines."""
+    statements = []
+    for table in tables:
+        statements.append('TRUNCATE TABLE ' + table)
+        statements.append('INSERT INTO ' + table + ' SELECT * FROM ' + table + BASELINE_SUFFIX)
+
+    return statements
+
+
+def baseline_statements(dbms, tables, table_fingerprint):
+    """Returns the statements that (re-)create the baselines of the tables."""
+    statements = []
+    for table in tables:
+        statements.append('DROP TABLE ' + table + BASELINE_SUFFIX)
+        if dbms == 'sqlserver':
+            statements.append('SELECT * INTO ' + table + BASELINE_SUFFIX + ' FROM ' + table)
+        else:
+            statements.append('CREATE TABLE ' + table + BASELINE_SUFFIX +
+                              ' AS SELECT * FROM ' + table)
+
+    statements.append('DROP TABLE ' + FINGERPRINT_TABLE)
+    statements.append('CREATE TABLE ' + FINGERPRINT_TABLE + ' (fingerprint VARCHAR(40))')
+    statements.append("INSERT INTO " + FINGERPRINT_TABLE + " VALUES ('" + table_fingerprint + "')")
+
+    return statements
+
+
+def database_statements(dbms, db):
+    """
+    Returns the statements that set up the database itself, sqlserver's row versioning
+    for its read committed and snapshot isolation levels.
+    Changing a setting needs the database to itself, so each statement
+    only changes one that is not on yet.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param db: the database name
+    :return: list of statements
+    """
+    if dbms != 'sqlserver':
+        return []
+
+    return ["IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = '" + db + "'"
+            " AND is_read_committed_snapshot_on = 1)"
+            " ALTER DATABASE " + db + " SET READ_COMMITTED_SNAPSHOT ON",
+            "IF NOT EXISTS (SELECT * FROM sys.databases WHERE name = '" + db + "'"
+            " AND snapshot_isolation_state = 1)"
+            " ALTER DATABASE " + db + " SET ALLOW_SNAPSHOT_ISOLATION ON"]
+
+
+def set_up_database(connection, dbms, config):
+    """
+    Executes the database_statements, with autocommit on.
+
+    :param connection: DB-API connection, left with autocommit off
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :return: None
+    """
+    mvcc_headless.set_autocommit(connection, True)
+    try:
+        execute(connection, dbms, database_statements(dbms, config['db']), ignore_errors=True)
+    finally:
+        mvcc_headless.set_autocommit(connection, False)
+
+
+def reset_tables(connection, dbms, config, table_initialization):
+    """
+    Brings the tables of the table initialization section back
+    to their initial rows, from the baseline if it is still valid.
+
+    :param connection: DB-API connection, left with autocommit off
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :return: 'restored' if the baseline was used, 'rebuilt' otherwise
+    """
+    table_fingerprint = fingerprint(dbms, table_initialization)
+    tables = created_tables(table_initialization)
+
+    mvcc_headless.set_autocommit(connection, True)
+    try:
+        try:
+            rows = execute(connection, dbms,
+                           ['SELECT fingerprint FROM ' + FINGERPRINT_TABLE])
+            if rows and rows[0][0] == table_fingerprint:
+                execute(connection, dbms, restore_statements(tables))
+                return 'restored'
+        except Exception:
+            # no baseline yet, or a table was dropped since it was made
+            pass
+
+        execute(connection, dbms, table_initialization, ignore_errors=True)
+        execute(connection, dbms, database_statements(dbms, config['db']), ignore_errors=True)
+        execute(connection, dbms, baseline_statements(dbms, tables, table_fingerprint),
+                ignore_errors=True)
+
+        return 'rebuilt'
+    finally:
+        mvcc_headless.set_autocommit(connection, False)
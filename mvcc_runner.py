@@ -6,20 +6,45 @@ and executes the test scenario's steps.
 To run:
 $ python mvcc_runner.py <dbms> <test_num> <yaml_file_path>
 e.g.( python mvcc_runner.py oracle test1 "./mvcc_tests.yml" )
+
+To run without tmux, over DB-API connections, printing a JSON result:
+$ python mvcc_runner.py --headless <dbms> <test_num|all> <yaml_file_path>
+e.g.( python mvcc_runner.py --headless postgres all "./mvcc_tests.yml" )
+
+To run on the warm sessions of a running mvcc_daemon.py:
+$ python mvcc_runner.py --daemon <dbms> <test_num> <yaml_file_path>
+
+To run on the in-memory MVCC engine (mvcc_memory.py), no dbms needed:
+$ python mvcc_runner.py --backend=memory <dbms> <test_num|all> <yaml_file_path>
+
+Any run also writes its counters and latency histograms, in the Prometheus
+text format, with --metrics=<file.prom> [--metrics-interval=<seconds>], see mvcc_metrics.py,
+its timeline as Chrome trace-event JSON with --timeline=<file.json>, see mvcc_timeline.py,
+and its cProfile stats with --profile=<file.prof>.
 ------------------------------------------------------------------------------
 Author: Konstantinos Diamantidis - March 2020
 ------------------------------------------------------------------------------
 """
-import os
-import termios
+import json
 import sys
 import threading
 import time
 
-import libtmux
-from libtmux.exc import BadSessionName
-import yamlordereddictloader
-import yaml
+import mvcc_locks
+import mvcc_metrics
+import mvcc_probe
+import mvcc_timeline
+import mvcc_trace
+from mvcc_classify import ERROR
+from mvcc_classify import OutputClassifier
+from mvcc_classify import READY
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+from mvcc_index import test_numbers
+from mvcc_plan import batch
+from mvcc_plan import load_plan
+from mvcc_stream import PaneStream
 from yaml.scanner import ScannerError
 from yaml.parser import ParserError
 
@@ -36,15 +61,70 @@ class HostError(Exception):
     pass
 
 
+# the error raised for every reason mvcc_classify.py finds a connection failed for
+CONNECTION_ERRORS = {'database': DatabaseError,
+                     'host': HostError,
+                     'authentication': AuthenticationError}
+
+
 DBMS, CONNECTION_STRING, USER, PASSWORD, DB, HOST, \
     CONFIG_TABLE_INITIALIZATION, CONFIG_DBMS_STEPS, \
     CLEAR_COMMAND, AUTOCOMMIT_ON, AUTOCOMMIT_OFF, \
     YAML_FILE, TEST_NUM, TEST_COMMENT, NUMBER_OF_TRANSACTIONS, \
-    TMUX_SERVER, TMUX_SESSION_NAME = (None,) * 17
+    TMUX_SERVER, TMUX_SESSION_NAME, TEST_PLAN, INITIALIZATION, DATABASE = (None,) * 20
+# the test's transactions (e.g. ['T1', 'T2', 'T12']), their position is their id in TEST_PLAN
+TRANSACTIONS = []
+# the pane of every transaction, by id
+TRANSACTION_PANES = []
 SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+# where the scenarios run, 'memory' emulates the dbms's isolation levels in process,
+# 'pty' runs the dbms CLI clients on pseudo terminals instead of tmux panes
+SUPPORTED_BACKENDS = ['dbms', 'memory', 'pty']
+OPTIONS = {}
 KEEP_PRINTING_DOTS = False
-FILE_DESCRIPTOR = sys.stdin.fileno()
-NORMAL_TERMINAL = termios.tcgetattr(FILE_DESCRIPTOR)
+
+# seconds without new output and without a prompt after which a statement
+# is considered blocked when there is no lock observer to tell (no DB-API driver):
+# a heuristic, a slower statement gets the next step typed in behind it.
+# --blocked-after=<seconds> changes it
+BLOCKED_AFTER = 0.5
+# seconds without new output after which a statement is considered blocked
+# although the lock observer does not see it waiting on a lock
+OBSERVED_BLOCKED_AFTER = 30
+# seconds between two looks at the lock observer's verdict while a statement executes
+BLOCKED_CHECK_INTERVAL = 0.02
+# watches the lock waits of the panes' sessions, see start_lock_observer
+LOCK_OBSERVER = None
+# mvcc_locks.ClientSession of every pane, by pane id
+PANE_SESSIONS = {}
+# seconds to wait for the dbms CLI to connect
+CONNECTION_TIMEOUT = 16
+# panes whose last statement is blocked, the following steps get typed ahead
+BLOCKED_PANES = set()
+# PaneStream of every pane, by pane id
+PANE_STREAMS = {}
+# the runs' counters and histograms, written to OPTIONS['metrics'] (see mvcc_metrics.py)
+METRICS = mvcc_metrics.Metrics()
+# the runs' spans and instants, written to OPTIONS['timeline'] (see mvcc_timeline.py)
+TIMELINE = None
+# the terminal's attributes before hide_user_input changed them,
+# None when stdin is not a terminal (e.g. headless runs from a script)
+NORMAL_TERMINAL = None
+
+
+def parse_options():
+    """
+    Removes the options (e.g. --headless) from the arguments
+    and stores them in OPTIONS, so that the positional
+    arguments keep their places.
+
+    :return: None
+    """
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
 
 
 def validate_arguments():
@@ -52,7 +132,9 @@ def validate_arguments():
     and that the dbms argument provided is one of the supported ones.
     Test number and yaml file path validation will occur in the parse_yaml function
     """
-    global DBMS, TEST_NUM, YAML_FILE
+    global DBMS, TEST_NUM, YAML_FILE, BLOCKED_AFTER
+
+    parse_options()
 
     if len(sys.argv) < 4:
         input('Argument error \n '
@@ -67,48 +149,61 @@ def validate_arguments():
         input('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
         sys.exit(0)
 
+    if OPTIONS.get('backend', 'dbms') not in SUPPORTED_BACKENDS:
+        input('Invalid backend!\nSupported backends are: ' + str(SUPPORTED_BACKENDS))
+        sys.exit(0)
+
+    if OPTIONS.get('blocked-after'):
+        try:
+            BLOCKED_AFTER = float(OPTIONS['blocked-after'])
+        except ValueError:
+            input('Invalid --blocked-after!\nIt is a number of seconds, e.g. 0.5')
+            sys.exit(0)
+
 
 def parse_yaml(file_path):
     """
     Will load the provided yaml file.
     Will set some global variables based on the parsed yaml file.
 
-    :param file_path: path of the yaml file
-    :return: the loaded yaml file
+    :param file_path: path of the yaml file or of a directory of yaml files
+    :return: None
     """
     try:
-        with open(file_path, 'r') as ymlfile:
-            # yamlordereddictloader is needed so as to
-            # be sure that tests and steps are parsed sorted
-            # so that they get printed in the terminal window sorted
-            yaml_file = yaml.load(ymlfile, Loader=yamlordereddictloader.Loader)
+        # only the sections (and the test) in use get parsed,
+        # the index keeps the steps in the order of the file
+        # so that they get printed in the terminal window sorted
+        config = get_section(file_path, DBMS + '-config')
 
         global USER, PASSWORD, DB, HOST, \
                 CONFIG_TABLE_INITIALIZATION, CONFIG_DBMS_STEPS, \
-                TEST_COMMENT, NUMBER_OF_TRANSACTIONS
-
-        USER = yaml_file[DBMS + '-config']['user']
-        PASSWORD = yaml_file[DBMS + '-config']['password']
-        DB = yaml_file[DBMS + '-config']['db']
-        HOST = yaml_file[DBMS + '-config']['host']
-        CONFIG_TABLE_INITIALIZATION = yaml_file['table-initialization']
-        CONFIG_DBMS_STEPS = yaml_file[DBMS + '-tests'][TEST_NUM]
-        TEST_COMMENT = find_comment(file_path, DBMS, TEST_NUM)
-
-        transactions = []
-        for steps in CONFIG_DBMS_STEPS:
-            # steps[-2:] will be e.g.: 'T1' from step3_T1
-            if steps[-2:] not in transactions:
-                # will fill the list with the unique T1, T2, T3
-                transactions.append(steps[-2:])
+                TEST_COMMENT, NUMBER_OF_TRANSACTIONS, TRANSACTIONS, \
+                TEST_PLAN, INITIALIZATION, DATABASE
+
+        USER = config['user']
+        PASSWORD = config['password']
+        DB = config['db']
+        HOST = config['host']
+        CONFIG_TABLE_INITIALIZATION = get_section(file_path, 'table-initialization')
+        CONFIG_DBMS_STEPS = get_test(file_path, DBMS, TEST_NUM)
+        # the steps as they get typed in the panes, see mvcc_plan.py
+        plan = load_plan(file_path, DBMS)
+        TEST_PLAN = plan['tests'][TEST_NUM]
+        INITIALIZATION = plan['initialization']
+        DATABASE = plan['database']
+        TEST_COMMENT = TEST_PLAN['comment']
+
+        # the unique T1, T2, ..., Tn
+        TRANSACTIONS = TEST_PLAN['transactions']
         # will be used for splitting the tmux session
         # into the appropriate panes
-        NUMBER_OF_TRANSACTIONS = len(transactions)
-
-        return yaml_file
+        NUMBER_OF_TRANSACTIONS = len(TRANSACTIONS)
     except KeyError as err:
         input('Error while parsing the yaml file - '
               'reason "%s"' % str(err) + ' does not exist')
+    except ValueError as err:
+        input('Error while parsing the yaml file - ' + str(err))
+        sys.exit(0)
     except IOError as err:
         print('Wrong yaml file path: \n'+str(err))
         sys.exit(0)
@@ -138,19 +233,9 @@ def find_comment(file_path, dbms, test_num):
     :return: comment next to test number
     """
     try:
-        with open(file_path, 'r') as ymlfile:
-            line_num_dbms = 1000000
-            commentLine = ''
-
-            for line_num, line in enumerate(ymlfile):
-                if dbms + '-tests:' in line:
-                    line_num_dbms = line_num
-                elif line_num > line_num_dbms:
-                    if test_num in line:
-                        commentLine = line.strip()
-                        break
-
-            return commentLine[commentLine.find('#'):None]
+        return get_comments(file_path, dbms).get(test_num, '')
+    except KeyError:
+        return ''
     except IOError as err:
         print('Wrong yaml file path: \n'+str(err))
         sys.exit(0)
@@ -179,12 +264,10 @@ def find_comments(file_path, dbms):
     """
     try:
         tests = []
+        comments = get_comments(file_path, dbms)
 
-        with open(file_path, 'r') as ymlfile:
-            config = yaml.load(ymlfile, Loader=yamlordereddictloader.Loader)
-
-        for test in config[dbms + '-tests']:
-            tests.append(test + str(find_comment(file_path, dbms, test)))
+        for test in test_numbers(file_path, dbms):
+            tests.append(test + comments.get(test, ''))
 
         return tests
     except KeyError as err:
@@ -206,121 +289,82 @@ def find_comments(file_path, dbms):
         sys.exit(0)
 
 
+def connection_commands(dbms, user, password, db, host):
+    """
+    Returns how to connect with the dbms CLI client and how to set it up.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :return: (connection string, clear command, autocommit on, autocommit off)
+    """
+    if dbms == 'mysql':
+        return ('mysql -u ' + user +
+                ' -p' + password +
+                ' -D ' + db +
+                ' -h ' + host,
+                'system clear', 'SET autocommit=1;;', 'SET autocommit=0;;')
+    elif dbms == 'postgres':
+        return ("export PGPASSWORD='" + password + "'; " +
+                ' psql' +
+                ' -h ' + host +
+                ' -d ' + db +
+                ' -U ' + user,
+                '\\! clear', '\\set AUTOCOMMIT on', '\\set AUTOCOMMIT off')
+    elif dbms == 'sqlserver':
+        return ('sqlcmd -U ' + user +
+                ' -P' + password +
+                ' -d ' + db +
+                ' -S ' + host,
+                ':RESET', 'SET IMPLICIT_TRANSACTIONS OFF', 'SET IMPLICIT_TRANSACTIONS ON')
+    elif dbms == 'oracle':
+        return (str('sqlplus ' +
+                    user + '/' +
+                    password + '@' +
+                    host + '/' +
+                    db),
+                'clear screen', 'set autocommit on;;', 'set autocommit off;;')
+
+    return (None,) * 4
+
+
 def prepare_connection():
     """Populates global variables with values based on the selected DBMS."""
     global CONNECTION_STRING, CLEAR_COMMAND
     global AUTOCOMMIT_ON, AUTOCOMMIT_OFF
-    if is_dbms_running(DBMS):
-        if DBMS == 'mysql':
-            CONNECTION_STRING = 'mysql -u ' + USER + \
-                                ' -p' + PASSWORD + \
-                                ' -D ' + DB + \
-                                ' -h ' + HOST
-            CLEAR_COMMAND = 'system clear'
-            AUTOCOMMIT_OFF = 'SET autocommit=0;;'
-            AUTOCOMMIT_ON = 'SET autocommit=1;;'
-        elif DBMS == 'postgres':
-            CONNECTION_STRING = "export PGPASSWORD='" + PASSWORD + "'; " + \
-                                ' psql' + \
-                                ' -h ' + HOST + \
-                                ' -d ' + DB + \
-                                ' -U ' + USER
-            CLEAR_COMMAND = '\! clear'
-            AUTOCOMMIT_OFF = '\set AUTOCOMMIT off'
-            AUTOCOMMIT_ON = '\set AUTOCOMMIT on'
-        elif DBMS == 'sqlserver':
-            CONNECTION_STRING = 'sqlcmd -U ' + USER + \
-                                ' -P' + PASSWORD + \
-                                ' -d ' + DB + \
-                                ' -S ' + HOST
-            CLEAR_COMMAND = ':RESET'
-            AUTOCOMMIT_OFF = 'SET IMPLICIT_TRANSACTIONS ON'
-            AUTOCOMMIT_ON = 'SET IMPLICIT_TRANSACTIONS OFF'
-        elif DBMS == 'oracle':
-            CONNECTION_STRING = str('sqlplus ' +
-                                    USER + '/' +
-                                    PASSWORD + '@' +
-                                    HOST + '/' +
-                                    DB)
-            CLEAR_COMMAND = 'clear screen'
-            AUTOCOMMIT_OFF = 'set autocommit off;;'
-            AUTOCOMMIT_ON = 'set autocommit on;;'
+    if is_dbms_running(DBMS, dict(get_section(YAML_FILE, DBMS + '-config'))):
+        CONNECTION_STRING, CLEAR_COMMAND, AUTOCOMMIT_ON, AUTOCOMMIT_OFF = \
+            connection_commands(DBMS, USER, PASSWORD, DB, HOST)
     else:
         input(DBMS + ' is not running')
 
     return CONNECTION_STRING
 
 
-def is_dbms_running(dbms):
-    """Checks if selected DBMS service is running"""
-    dbms_service = None
-    if "debian" in str(os.uname()):
-        if dbms == 'oracle':
-            dbms_service = 'oracle-xe'
-        elif dbms == 'postgres':
-            dbms_service = 'postgresql'
-        elif dbms == 'sqlserver':
-            dbms_service = 'mssql-server'
-        elif dbms == 'mysql':
-            dbms_service = 'mysql'
-        if os.system(str('systemctl is-active --quiet ' + dbms_service)) == 0:
-            return True
-        else:
-            return False
-
-    return True
+def is_dbms_running(dbms, config=None):
+    """
+    Checks if the selected DBMS accepts connections on its host, see mvcc_probe.py
 
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: (optional) the '<dbms>-config' section of the yaml file,
+                   the parsed host by default
+    :return: True/False
+    """
+    if config is None:
+        config = {'host': HOST}
 
-def check_connection(connection_result, connection_string):
-    """Checks connection output and determines
-    if connection is established or if an error occurred"""
-    # concatenate the error messages from a list to a string
-    connection_result_string = ' '.join([str(elem) for elem in connection_result])
-
-    database_errors = ['Unknown database',
-                       'FATAL:  database',
-                       'Cannot open database',
-                       'ORA-12514']
-    for db_error in database_errors:
-        if db_error in connection_result_string:
-            raise DatabaseError(connection_string)
-
-    host_errors = ['Unknown MySQL server host',
-                   'could not translate host name',
-                   'Login timeout expired',
-                   'could not connect',
-                   'could not resolve',
-                   'ORA-12541']
-    for host_error in host_errors:
-        if host_error in connection_result_string:
-            raise HostError(connection_string)
-
-    authentication_errors = ['Access denied',
-                             'authentication failed',
-                             'psql: warning: extra command',
-                             'Login failed',
-                             'invalid username/password']
-    for auth_error in authentication_errors:
-        if auth_error in connection_result_string:
-            raise AuthenticationError(connection_string)
-
-    # these are the success prompts in
-    # sqlserver | postgres | mysql | oracle
-    success = ['1>', '=#', ']>', '>']
-    for db_success in success:
-        if db_success in connection_result_string:
-            return True
-    else:
-        return False
+    return mvcc_probe.is_running(dbms, config)
 
 
 def create_tmux_window_and_panes():
     """
     Initiates the tmux server, the window session
-    and creates the appropriate number of panes (up to 3).
+    and creates one pane per transaction, side by side
+    for up to 3 transactions and tiled for more.
 
     :return: tmux panes objects in a list
     """
+    import libtmux
+    from libtmux.exc import BadSessionName
+
     try:
         global TMUX_SERVER, TMUX_SESSION_NAME
         TMUX_SERVER = libtmux.Server()
@@ -340,17 +384,24 @@ def create_tmux_window_and_panes():
         pane1.reset()
         tmux_panes.append(pane1)
 
-        if NUMBER_OF_TRANSACTIONS >= 2:
-            pane2 = window.split_window(vertical=False)
-            pane2.reset()
-            tmux_panes.append(pane2)
+        for _ in range(1, NUMBER_OF_TRANSACTIONS):
+            pane = window.split_window(vertical=False)
+            pane.reset()
+            tmux_panes.append(pane)
+            # make room for the next split
+            window.select_layout('tiled')
+
+        window.select_layout('even-horizontal' if NUMBER_OF_TRANSACTIONS <= 3 else 'tiled')
 
-        if NUMBER_OF_TRANSACTIONS >= 3:
-            pane3 = window.split_window(vertical=False)
-            pane3.reset()
-            tmux_panes.append(pane3)
+        for pane in tmux_panes:
+            PANE_STREAMS[pane.get('pane_id')] = PaneStream(
+                pane, classifier=OutputClassifier(DBMS))
 
-        window.select_layout('even-horizontal')
+        # T1 gets the first pane and T2 the last one, the rest go in between
+        ordered_panes = tmux_panes[:1] + tmux_panes[1:][-1:] + tmux_panes[1:-1]
+        TRANSACTION_PANES[:] = ordered_panes
+        for transaction, pane in zip(TRANSACTIONS, ordered_panes):
+            PANE_SESSIONS[pane.get('pane_id')] = mvcc_locks.ClientSession(transaction)
 
         return tmux_panes
     except BadSessionName as err:
@@ -371,92 +422,247 @@ def create_tmux_window_and_panes():
 
 def initiate_connection(pane):
     """
-    Initiates the dbms connection in the provided pane.
+    Initiates the dbms connection in the provided pane,
+    without waiting for it, see wait_for_connection.
 
     :param pane: tmux pane in which the dbms connection will take place
-    :return:
+    :return: None
     """
+    METRICS.inc('mvcc_connection_attempts_total', {'dbms': DBMS})
     pane.send_keys(CONNECTION_STRING)
 
-    start_time = time.time()
 
-    # try to connect until connection is established
-    # will try for 15 seconds, then execution will stop
-    while True:
-        if time.time() - start_time > 16:
-            print_dots(False)
-            print ("\n15 seconds have passed, probably the host is unreachable.\n")
-            print ("Check your yaml configuration file "
-                   "and make sure the service is running\n")
-            enter_pressed = input('\nPress Enter to exit..')
-            if enter_pressed == "":
-                sys.exit(1)
+def wait_for_connection(pane):
+    """
+    Waits for the dbms connection of the provided pane.
 
-        time.sleep(0.5)
-        # capture the attempt output
-        # so as to check if connection is successful
-        # or if an error occurred
-        output = pane.capture_pane()
-        connected = check_connection(output, CONNECTION_STRING)
-        if not connected:
-            continue
-        else:
-            break
+    :param pane: tmux pane in which the dbms connection takes place
+    :return: True if the dbms prompt showed up, False after CONNECTION_TIMEOUT seconds,
+             raises one of CONNECTION_ERRORS if the connection failed
+    """
+    stream = PANE_STREAMS[pane.get('pane_id')]
+    started = time.time()
+
+    # the output gets classified as it arrives, until the dbms prompt
+    # or a connection error shows up
+    state = stream.wait_for_state([READY, ERROR], CONNECTION_TIMEOUT)
+    if state == ERROR:
+        METRICS.inc('mvcc_errors_total', {'dbms': DBMS, 'class': stream.classifier.error})
+        raise CONNECTION_ERRORS[stream.classifier.error](CONNECTION_STRING)
+    if state != READY:
+        METRICS.inc('mvcc_errors_total', {'dbms': DBMS, 'class': 'timeout'})
+        return False
 
+    METRICS.observe('mvcc_connection_seconds', time.time() - started, {'dbms': DBMS})
+    return True
 
-def initiate_panes(panes):
+
+def pane_transaction(pane):
+    """Returns the transaction (e.g. 'T1') that runs in the provided pane."""
+    pane_ids = [transaction_pane.get('pane_id') for transaction_pane in TRANSACTION_PANES]
+    return TRANSACTIONS[pane_ids.index(pane.get('pane_id'))]
+
+
+def can_observe_locks():
+    """Checks if the lock waits can be watched, which takes the dbms's DB-API driver."""
+    import mvcc_headless
+
+    try:
+        mvcc_headless.load_driver(DBMS)
+        return True
+    except mvcc_headless.DriverError:
+        return False
+
+
+def read_session_id(pane):
     """
-    Initializes the dbms connections and
-    re-initializes the tables as per the
-    table initialization section in the yaml file.
+    Reads the id of the pane's dbms session (see mvcc_locks.SESSION_ID_QUERIES)
+    from its output, for the lock observer. The pane must be connected,
+    with autocommit on so that the query starts no transaction.
 
-    :param panes: tmux panes
-    :return: None
+    :param pane: tmux pane
+    :return: None, the id goes in the pane's PANE_SESSIONS entry
+    """
+    stream = PANE_STREAMS[pane.get('pane_id')]
+    position = stream.position
+    send_statement(pane, batch(DBMS, mvcc_locks.SESSION_ID_QUERIES[DBMS] + ';;'))
+    PANE_SESSIONS[pane.get('pane_id')].session_id = \
+        mvcc_locks.session_id_from_output(stream.lines(position))
+
+
+def start_lock_observer():
+    """
+    Starts watching the lock waits of the panes' sessions over a DB-API connection,
+    so that wait_for_statement knows when a statement waits on a lock.
+
+    :return: mvcc_locks.LockObserver, or None if a session id is missing
+             or the connection failed
     """
+    import mvcc_headless
+
+    names = dict((session.session_id, session.name) for session in PANE_SESSIONS.values())
+    if None in names:
+        return None
     try:
-        print('Connecting to ' + DBMS)
+        connection = mvcc_headless.connect(DBMS, {'user': USER, 'password': PASSWORD,
+                                                  'db': DB, 'host': HOST})
+        mvcc_headless.set_autocommit(connection, True)
+    except Exception:
+        return None
 
-        initiate_connection(panes[0])
+    observer = mvcc_locks.LockObserver(DBMS, dict((session.name, session) for session
+                                                  in PANE_SESSIONS.values()),
+                                       connection, names=names)
+    observer.start()
+    return observer
 
-        # terminate any left over transactions
-        panes[0].send_keys(AUTOCOMMIT_ON)
 
-        # table re-initialization commands in the yaml file
-        for create_table_instructions in CONFIG_TABLE_INITIALIZATION:
-            if DBMS == 'sqlserver':
-                if create_table_instructions == 'COMMIT;;':
-                    continue
+def prepare_pane(pane, autocommit_off, barrier, results, number, connect_started,
+                 observe_locks=False):
+    """
+    Waits for the connection of a pane and turns its autocommit off,
+    then waits at the barrier for the other panes, the work of a pane's thread.
+
+    :param pane: tmux pane
+    :param autocommit_off: the lines of the autocommit off statement
+    :param barrier: threading.Barrier shared by the panes' threads and initiate_panes
+    :param results: list where the pane's result (True, False or the raised error) is stored
+    :param number: the pane's place in results
+    :param connect_started: when the connection command was sent to the panes
+    :param observe_locks: (optional) True reads the pane's session id, see read_session_id
+    :return: None
+    """
+    try:
+        results[number] = wait_for_connection(pane)
+        if TIMELINE:
+            TIMELINE.span(pane_transaction(pane), 'connect', connect_started, time.time(),
+                          'connect', {'connected': results[number]})
+        if results[number]:
+            if observe_locks:
+                read_session_id(pane)
+            send_statement(pane, autocommit_off)
+            pane.send_keys(CLEAR_COMMAND)
+            pane.send_keys('')
+    except Exception as err:
+        results[number] = err
+    finally:
+        barrier.wait()
 
-                panes[0].send_keys('GO')
-                time.sleep(0.3)
 
-            panes[0].send_keys(create_table_instructions)
+def reset_tables(dbms, config, table_initialization):
+    """
+    Resets the tables through mvcc_reset.py, over a DB-API connection.
 
-        if DBMS == 'sqlserver':
-            time.sleep(1)
-            panes[0].send_keys('ALTER DATABASE ' + DB +
-                               ' SET READ_COMMITTED_SNAPSHOT ON;;')
-            panes[0].send_keys('GO')
-            panes[0].send_keys('ALTER DATABASE ' + DB +
-                               ' SET ALLOW_SNAPSHOT_ISOLATION ON;;')
-            panes[0].send_keys('GO')
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: dict with the user, password, db and host
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :return: True if the tables were reset, False if no DB-API driver
+             is installed or the reset failed
+    """
+    import mvcc_headless
+    import mvcc_reset
 
-        panes[0].send_keys(AUTOCOMMIT_OFF)
+    try:
+        connection = mvcc_headless.connect(dbms, config)
+    except Exception:
+        return False
 
-        # clear so as to show only the Transaction relevant data in the console
-        panes[0].send_keys(CLEAR_COMMAND)
-        panes[0].send_keys('')
+    try:
+        mvcc_reset.reset_tables(connection, dbms, config, table_initialization)
+        return True
+    except Exception:
+        return False
+    finally:
+        connection.close()
 
-        iter_panes = iter(panes)
 
-        # skip the first pane which is being handled above
-        next(iter_panes)
+def initiate_panes(panes):
+    """
+    Initializes the dbms connections and
+    re-initializes the tables as per the
+    table initialization section in the yaml file.
+
+    :param panes: tmux panes
+    :return: None
+    """
+    global LOCK_OBSERVER
+    try:
+        print('Connecting to ' + DBMS)
 
-        for pane in iter_panes:
+        # every pane logs in at the same time, the other panes' logins
+        # overlap the table initialization in the first pane.
+        # Changing the database settings (sqlserver) needs the database to itself,
+        # so the first pane sets them before the other panes log in
+        connect_started = time.time()
+        initiate_connection(panes[0])
+        if DATABASE:
+            first_connected = wait_for_connection(panes[0])
+            if first_connected:
+                for lines in DATABASE:
+                    send_statement(panes[0], lines)
+        for pane in panes[1:]:
             initiate_connection(pane)
-            pane.send_keys(AUTOCOMMIT_OFF)
-            pane.send_keys(CLEAR_COMMAND)
-            pane.send_keys('')
+
+        autocommit_off = batch(DBMS, AUTOCOMMIT_OFF)
+        observe_locks = can_observe_locks()
+        results = [None] * len(panes)
+        barrier = threading.Barrier(len(panes))
+        for number, pane in enumerate(panes[1:], 1):
+            thread = threading.Thread(target=prepare_pane,
+                                      args=(pane, autocommit_off, barrier, results, number,
+                                            connect_started, observe_locks))
+            thread.daemon = True
+            thread.start()
+
+        try:
+            results[0] = first_connected if DATABASE else wait_for_connection(panes[0])
+            if TIMELINE:
+                TIMELINE.span(pane_transaction(panes[0]), 'connect', connect_started, time.time(),
+                              'connect', {'connected': results[0]})
+            if results[0]:
+                initialization_started = time.time()
+                # terminate any left over transactions
+                send_statement(panes[0], batch(DBMS, AUTOCOMMIT_ON))
+                if observe_locks:
+                    read_session_id(panes[0])
+
+                # restore the tables from their baseline when a DB-API
+                # driver is available, otherwise replay the table
+                # re-initialization commands in the yaml file
+                config = {'user': USER, 'password': PASSWORD, 'db': DB, 'host': HOST}
+                if not reset_tables(DBMS, config, CONFIG_TABLE_INITIALIZATION):
+                    for lines in INITIALIZATION:
+                        send_statement(panes[0], lines)
+
+                send_statement(panes[0], autocommit_off)
+                if TIMELINE:
+                    TIMELINE.span(mvcc_timeline.SETUP_TRACK, 'table initialization',
+                                  initialization_started, time.time(), 'initialization')
+
+                # clear so as to show only the Transaction relevant data in the console
+                panes[0].send_keys(CLEAR_COMMAND)
+                panes[0].send_keys('')
+        except Exception as err:
+            results[0] = err
+        finally:
+            # every pane is ready, or has failed, past the barrier
+            barrier.wait()
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+        if not all(results):
+            print_dots(False)
+            print ("\n15 seconds have passed, probably the host is unreachable.\n")
+            print ("Check your yaml configuration file "
+                   "and make sure the service is running\n")
+            enter_pressed = input('\nPress Enter to exit..')
+            if enter_pressed == "":
+                sys.exit(1)
+
+        if observe_locks:
+            LOCK_OBSERVER = start_lock_observer()
 
     except HostError as err:
         print_dots(False)
@@ -472,52 +678,141 @@ def initiate_panes(panes):
               str(err) + '\n\nPress Enter to exit..')
 
 
-def execute_steps(tmux_panes):
+def wait_for_statement(stream, since, session=None):
+    """
+    Waits until the statement sent to the pane has finished,
+    which is when new output has arrived and ends with the prompt,
+    or until it is known to be blocked, which is when the lock observer
+    sees the pane's session wait on a lock (see start_lock_observer).
+    Without a lock observer a statement is considered blocked when no output
+    has arrived for BLOCKED_AFTER seconds and there is no prompt, with one
+    after OBSERVED_BLOCKED_AFTER seconds.
+
+    :param stream: PaneStream of the pane the statement was sent to
+    :param since: stream position before the statement was sent
+    :param session: (optional) the pane's mvcc_locks.ClientSession
+    :return: 'done' | 'blocked'
+    """
+    observed = LOCK_OBSERVER is not None and not LOCK_OBSERVER.error and session is not None
+    blocked_after = OBSERVED_BLOCKED_AFTER if observed else BLOCKED_AFTER
+    # the session's blocked counts once a whole poll ran after the statement was sent
+    polls = LOCK_OBSERVER.polls + 2 if observed else 0
+    position = since
+    last_output = time.time()
+
+    while True:
+        if stream.wait_for_output(position, min(BLOCKED_CHECK_INTERVAL, blocked_after)):
+            position = stream.position
+            last_output = time.time()
+            if stream.classifier.state() == READY:
+                return 'done'
+        elif observed and session.blocked and LOCK_OBSERVER.polls >= polls:
+            return 'blocked'
+        elif time.time() - last_output >= blocked_after:
+            return 'blocked'
+
+
+def send_statement(pane, lines):
+    """
+    Sends a statement to the pane and waits for it, see wait_for_statement.
+    The statement comes as the lines typed for it, the last one
+    executes it (e.g. GO for sqlserver), see mvcc_plan.batch.
+
+    If a previous statement of the pane is still blocked, the statement
+    is typed ahead and will execute as soon as the pane is unblocked.
+
+    :param pane: tmux pane
+    :param lines: the lines of the statement to be sent
+    :return: 'done' | 'blocked'
+    """
+    pane_id = pane.get('pane_id')
+    stream = PANE_STREAMS[pane_id]
+
+    if pane_id in BLOCKED_PANES:
+        if stream.classifier.state() != READY:
+            for line in lines:
+                pane.send_keys(line)
+            return 'blocked'
+        BLOCKED_PANES.discard(pane_id)
+
+    for line in lines[:-1]:
+        pane.send_keys(line)
+
+    position = stream.position
+    stream.classifier.expect()
+    pane.send_keys(lines[-1])
+    state = wait_for_statement(stream, position, PANE_SESSIONS.get(pane_id))
+    if state == 'blocked':
+        BLOCKED_PANES.add(pane_id)
+
+    return state
+
+
+def execute_steps(tmux_panes, trace=None):
     """
     Executes the steps from the selected dbms's
     test scenario in the appropriate pane.
 
     :param tmux_panes: all the tmux panes
+    :param trace: (optional) mvcc_trace.TraceWriter, gets a record of every statement
     :return: None
     """
-    transaction = 'T1'
-    pane = None
+    trace_context = {'run': mvcc_trace.new_run_id(), 'scenario': TEST_NUM, 'dbms': DBMS}
     print ('\nExecuting test ' + TEST_COMMENT)
-    for steps in CONFIG_DBMS_STEPS:
-        # last two characters (e.g. 'T2' from 'step2_T2')
-        current_transaction = steps[-2:]
-        if transaction != current_transaction:
-            # wait 1 second after switching transaction
-            time.sleep(1)
-        if steps[-2:] == 'T1':
-            # use the proper pane, depending on the Transaction
-            pane = tmux_panes[0]
-        elif steps[-2:] == 'T2':
-            # the previous to last element of the list
-            pane = tmux_panes[-1]
-        elif steps[-2:] == 'T3':
-            pane = tmux_panes[1]
-
-        for transaction_steps in CONFIG_DBMS_STEPS[steps]:
-            # execute the transaction's steps
-            pane.send_keys(transaction_steps)
-            if DBMS == 'sqlserver':
-                pane.send_keys('GO')
-                time.sleep(0.1)
-
-        transaction = current_transaction
+    labels = {'dbms': DBMS}
+    for step_name, transaction_id, statements in TEST_PLAN['steps']:
+        # use the proper pane, depending on the Transaction
+        pane = TRANSACTION_PANES[transaction_id]
+        classifier = PANE_STREAMS[pane.get('pane_id')].classifier
+        PANE_SESSIONS[pane.get('pane_id')].step = step_name
+        step_started = time.time()
+        state = 'done'
+
+        for lines in statements:
+            # execute the transaction's steps, each one as soon as
+            # the previous has finished or is blocked
+            started = time.time()
+            state = send_statement(pane, lines)
+            if state == 'done' and classifier.statement_error:
+                METRICS.inc('mvcc_errors_total',
+                            {'dbms': DBMS, 'class': classifier.statement_error})
+            if trace:
+                trace.write(mvcc_trace.statement_record(
+                    trace_context, step_name,
+                    mvcc_trace.cli_record(TRANSACTIONS[transaction_id], lines[0], started,
+                                          state, classifier.statement_error)))
+            if TIMELINE:
+                if state == 'blocked':
+                    TIMELINE.instant(TRANSACTIONS[transaction_id], 'blocked', time.time(),
+                                     'blocked', {'step': step_name})
+                elif mvcc_timeline.outcome_of(lines[0]):
+                    TIMELINE.instant(TRANSACTIONS[transaction_id],
+                                     mvcc_timeline.outcome_of(lines[0]), time.time(), 'outcome')
+
+        METRICS.inc('mvcc_steps_total', labels)
+        METRICS.observe('mvcc_step_seconds', time.time() - step_started, labels)
+        if TIMELINE:
+            TIMELINE.span(TRANSACTIONS[transaction_id], step_name, step_started, time.time(),
+                          'step', {'statements': len(statements), 'state': state})
 
     tmux_panes[0].select_pane()
 
 
 def run_tmux():
     """The "main" function of the tmux feature."""
+    trace = mvcc_trace.TraceWriter(OPTIONS['trace']) if OPTIONS.get('trace') else None
+    status = 'error'
+    if TIMELINE:
+        TIMELINE.begin(TEST_NUM, DBMS)
+        for transaction in TRANSACTIONS:
+            TIMELINE.track(transaction)
     try:
         tmux_panes = create_tmux_window_and_panes()
 
         initiate_panes(tmux_panes)
 
-        execute_steps(tmux_panes)
+        execute_steps(tmux_panes, trace)
+        status = 'ok'
 
         print_dots(False)
         time.sleep(0.5)
@@ -529,6 +824,14 @@ def run_tmux():
         input('\nYou probably have a formatting error in the yaml file'
               '\nPlease check the syntax, close this window and re-run the test\n'
               '\nError: ' + str(err))
+    finally:
+        METRICS.inc('mvcc_scenarios_total', {'dbms': DBMS, 'status': status})
+        if LOCK_OBSERVER:
+            LOCK_OBSERVER.stop()
+        for stream in PANE_STREAMS.values():
+            stream.close()
+        if trace:
+            trace.close()
 
 
 def print_dots(keep_printing):
@@ -562,31 +865,188 @@ def hide_user_input(hide):
     :param hide: True/False
     :return: None
     """
-    no_input_terminal = termios.tcgetattr(FILE_DESCRIPTOR)
-    no_input_terminal[3] = no_input_terminal[3] & ~termios.ECHO  # lflags
+    global NORMAL_TERMINAL
+    if not sys.stdin.isatty():
+        return
+    import termios
+
+    file_descriptor = sys.stdin.fileno()
+    if NORMAL_TERMINAL is None:
+        NORMAL_TERMINAL = termios.tcgetattr(file_descriptor)
     if hide:
-        termios.tcsetattr(FILE_DESCRIPTOR, termios.TCSADRAIN, no_input_terminal)
+        no_input_terminal = termios.tcgetattr(file_descriptor)
+        no_input_terminal[3] = no_input_terminal[3] & ~termios.ECHO  # lflags
+        termios.tcsetattr(file_descriptor, termios.TCSADRAIN, no_input_terminal)
     else:
-        termios.tcsetattr(FILE_DESCRIPTOR, termios.TCSADRAIN, NORMAL_TERMINAL)
+        termios.tcsetattr(file_descriptor, termios.TCSADRAIN, NORMAL_TERMINAL)
 
 
-def main():
-    hide_user_input(True)
+def run_headless():
+    """
+    Runs the selected test (or every test of the dbms when test_num is 'all')
+    over DB-API connections and prints the results as JSON.
+
+    :return: exit code, 0 if every test ran to completion
+    """
+    global TEST_NUM
+    import mvcc_anomaly
+    import mvcc_headless
+    import mvcc_memory
+
+    if TEST_NUM == 'all':
+        test_nums = test_numbers(YAML_FILE, DBMS)
+    else:
+        test_nums = [TEST_NUM]
+
+    results = []
+    trace = mvcc_trace.TraceWriter(OPTIONS['trace']) if OPTIONS.get('trace') else None
+    try:
+        for TEST_NUM in test_nums:
+            parse_yaml(YAML_FILE)
+            config = {'user': USER, 'password': PASSWORD, 'db': DB, 'host': HOST}
+            connect_function = None
+            if OPTIONS.get('backend') == 'memory':
+                connect_function = mvcc_memory.Engine().connect
+            result = mvcc_headless.run_scenario(DBMS, config, CONFIG_TABLE_INITIALIZATION,
+                                                CONFIG_DBMS_STEPS, TEST_NUM, TEST_COMMENT,
+                                                connect_function, trace=trace,
+                                                observe_locks=bool(OPTIONS.get('locks')))
+            result['analysis'] = mvcc_anomaly.analyze(result, CONFIG_TABLE_INITIALIZATION)
+            mvcc_metrics.observe_result(METRICS, result)
+            if TIMELINE:
+                TIMELINE.add_result(result)
+            results.append(result)
+    finally:
+        if trace:
+            trace.close()
+
+    # the backend could not run the unsupported ones, they are reported but not failed
+    failed = [result for result in results
+              if result['status'] not in ('ok', 'empty', 'unsupported')]
+    if len(results) == 1:
+        output = results[0]
+    else:
+        output = {'dbms': DBMS, 'status': 'error' if failed else 'ok',
+                  'verdicts': dict((result['test'], result['analysis']['verdict'])
+                                   for result in results),
+                  'unsupported': [result['test'] for result in results
+                                  if result['status'] == 'unsupported'],
+                  'results': results}
+    print(json.dumps(output, indent=2, default=str))
+
+    return 1 if failed else 0
+
+
+def run_pty():
+    """
+    Runs the selected test (or every test of the dbms when test_num is 'all')
+    in the dbms CLI clients through mvcc_pty.py and prints their transcripts as JSON.
+
+    :return: exit code, 0 if every test ran to completion
+    """
+    import asyncio
+    import mvcc_pty
+
+    trace = mvcc_trace.TraceWriter(OPTIONS['trace']) if OPTIONS.get('trace') else None
+    try:
+        results = asyncio.get_event_loop().run_until_complete(
+            mvcc_pty.run_scenarios(YAML_FILE, [DBMS], TEST_NUM, trace=trace))
+    finally:
+        if trace:
+            trace.close()
+    for result in results:
+        mvcc_metrics.observe_result(METRICS, result)
+        if TIMELINE:
+            TIMELINE.add_result(result)
+    print(json.dumps(results[0] if len(results) == 1 else results, indent=2, default=str))
+
+    return 0 if all(result['status'] in ('ok', 'empty') for result in results) else 1
+
+
+def run_on_daemon():
+    """
+    Submits the selected test to mvcc_daemon.py and prints its result,
+    readable in a terminal window, as JSON otherwise.
+
+    :return: exit code, 0 if the test ran to completion
+    """
+    import mvcc_daemon
+    import mvcc_headless
+
+    if not mvcc_daemon.is_daemon_running():
+        print('No mvcc daemon is listening on ' + mvcc_daemon.SOCKET_PATH +
+              '\nStart it with: python mvcc_daemon.py')
+        return 1
+
+    result = mvcc_daemon.submit_job(DBMS, TEST_NUM, YAML_FILE)
+
+    if sys.stdout.isatty():
+        print(mvcc_headless.format_result(result))
+        input('\nPress Enter to exit..')
+    else:
+        print(json.dumps(result, indent=2, default=str))
+
+    return 0 if result['status'] in ('ok', 'empty') else 1
+
+
+def profiled(function):
+    """
+    Runs the function, under cProfile when --profile=<file> is provided:
+    the stats of the calling thread get written to the file (see pstats).
+
+    :param function: e.g. run_headless
+    :return: what the function returns
+    """
+    if not OPTIONS.get('profile'):
+        return function()
+
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(OPTIONS['profile'])
 
+
+def main():
+    global TIMELINE
     validate_arguments()
 
-    parse_yaml(YAML_FILE)
+    if OPTIONS.get('timeline'):
+        TIMELINE = mvcc_timeline.Timeline(OPTIONS['timeline'])
+    metrics_writer = None
+    if OPTIONS.get('metrics'):
+        metrics_writer = mvcc_metrics.TextfileWriter(
+            METRICS, OPTIONS['metrics'],
+            float(OPTIONS.get('metrics-interval', mvcc_metrics.WRITE_INTERVAL)))
+    try:
+        if OPTIONS.get('headless') or OPTIONS.get('backend') == 'memory':
+            sys.exit(profiled(run_headless))
+        if OPTIONS.get('backend') == 'pty':
+            sys.exit(profiled(run_pty))
+        if OPTIONS.get('daemon'):
+            sys.exit(run_on_daemon())
 
-    prepare_connection()
+        hide_user_input(True)
 
-    thread_tmux = threading.Thread(target=run_tmux)
-    thread_tmux.start()
+        parse_yaml(YAML_FILE)
 
-    time.sleep(0.3)
-    print_dots(True)
+        prepare_connection()
 
-    thread_tmux.join()
-    hide_user_input(False)
+        # the tmux run is profiled in its own thread, this one only prints dots
+        thread_tmux = threading.Thread(target=profiled, args=(run_tmux,))
+        thread_tmux.start()
+
+        time.sleep(0.3)
+        print_dots(True)
+
+        thread_tmux.join()
+        hide_user_input(False)
+    finally:
+        if metrics_writer:
+            metrics_writer.close()
+        if TIMELINE:
+            TIMELINE.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,381 @@
+#!/usr/bin/python
+"""
+Soak mode: measures what the row versions kept for the snapshots cost over time.
+Either keeps a long-lived snapshot transaction open next to update loops
+on table T, or replays a test scenario in a loop, for a set duration,
+and samples the dbms's version store while it runs and after it stopped:
+    postgres  - dead and live tuples of T, (auto)vacuums, vacuums running,
+                age of the oldest snapshot (pg_stat_user_tables, pg_stat_progress_vacuum)
+    mysql     - InnoDB history list length, age of the oldest transaction
+    sqlserver - tempdb version store size, version generation and cleanup rates,
+                snapshot transactions and the longest one
+    oracle    - undo blocks and records of the open transactions, undo extents by status
+    memory    - row versions stored, rows with old versions, active transactions
+Queries the connected user is not allowed to run are reported once and skipped.
+
+Prints, as JSON, every sample and per metric its first, highest and last value.
+
+To run:
+$ python mvcc_soak.py <dbms> <yaml_file_path> [options]
+e.g.( python mvcc_soak.py postgres "./mvcc_tests.yml" --duration=300 --writers=4
+      --level="repeatable read" )
+
+Options:
+--duration=<seconds>     how long to keep the snapshot open, or to replay the scenario (default 60)
+--interval=<seconds>     seconds between two samples (default 1)
+--cooldown=<seconds>     how long to keep sampling after the load stopped, to see
+                         the cleanup (default 10)
+--writers=<N>            update loops, each on its own row of T (default 2)
+--level=<level>          isolation level of the snapshot transaction
+                         (default repeatable read, snapshot for sqlserver, serializable for oracle)
+--scenario=<test_num>    replay the scenario in a loop instead
+--backend=memory         run on the in-memory engine instead of the dbms
+------------------------------------------------------------------------------
+"""
+import decimal
+import json
+import sys
+import threading
+import time
+
+import mvcc_headless
+import mvcc_memory
+import mvcc_reset
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+OPTIONS = {'duration': 60, 'interval': 1, 'cooldown': 10, 'writers': 2}
+
+# the isolation level that keeps a snapshot for the whole transaction
+DEFAULT_LEVELS = {'postgres': 'repeatable read', 'mysql': 'repeatable read',
+                  'sqlserver': 'snapshot', 'oracle': 'serializable'}
+
+# what the snapshot transaction and the update loops run on
+SNAPSHOT_STATEMENTS = ['SET TRANSACTION ISOLATION LEVEL %s', 'SELECT * FROM T']
+ROW_IDS = 'SELECT id FROM T'
+UPDATE = 'UPDATE T SET x = x + 1 WHERE id = %d'
+
+# (metric names, query returning a single row with a value per name), by dbms
+METRIC_QUERIES = {
+    'postgres': [
+        (['dead_tuples', 'live_tuples', 'updates', 'hot_updates', 'vacuums', 'autovacuums'],
+         "SELECT n_dead_tup, n_live_tup, n_tup_upd, n_tup_hot_upd, vacuum_count, autovacuum_count "
+         "FROM pg_stat_user_tables WHERE relname = 't'"),
+        (['vacuums_running'], 'SELECT count(*) FROM pg_stat_progress_vacuum'),
+        (['oldest_snapshot_age'], 'SELECT max(age(backend_xmin)) FROM pg_stat_activity'),
+    ],
+    'mysql': [
+        (['history_list_length'],
+         "SELECT count FROM information_schema.innodb_metrics "
+         "WHERE name = 'trx_rseg_history_len'"),
+        (['oldest_transaction_seconds'],
+         'SELECT IFNULL(MAX(TIMESTAMPDIFF(SECOND, trx_started, NOW())), 0) '
+         'FROM information_schema.innodb_trx'),
+    ],
+    'sqlserver': [
+        (['version_store_kb'],
+         'SELECT SUM(version_store_reserved_page_count) * 8 '
+         'FROM tempdb.sys.dm_db_file_space_usage'),
+        (['version_generation_kb_per_second', 'version_cleanup_kb_per_second'],
+         "SELECT MAX(CASE WHEN counter_name LIKE 'Version Generation rate%' THEN cntr_value END), "
+         "MAX(CASE WHEN counter_name LIKE 'Version Cleanup rate%' THEN cntr_value END) "
+         "FROM sys.dm_os_performance_counters WHERE object_name LIKE '%Transactions%'"),
+        (['snapshot_transactions', 'longest_snapshot_seconds'],
+         'SELECT COUNT(*), ISNULL(MAX(elapsed_time_seconds), 0) '
+         'FROM sys.dm_tran_active_snapshot_database_transactions'),
+    ],
+    'oracle': [
+        (['undo_blocks', 'undo_records'],
+         'SELECT NVL(SUM(used_ublk), 0), NVL(SUM(used_urec), 0) FROM v$transaction'),
+        (['undo_active_bytes', 'undo_unexpired_bytes', 'undo_expired_bytes'],
+         "SELECT NVL(SUM(CASE WHEN status = 'ACTIVE' THEN bytes END), 0), "
+         "NVL(SUM(CASE WHEN status = 'UNEXPIRED' THEN bytes END), 0), "
+         "NVL(SUM(CASE WHEN status = 'EXPIRED' THEN bytes END), 0) FROM dba_undo_extents"),
+    ],
+}
+
+
+def parse_options():
+    """Removes the options (e.g. --duration=300) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+def number(value):
+    """Makes the drivers' numbers (Decimal, float, long) JSON friendly."""
+    if isinstance(value, (decimal.Decimal, float)):
+        return int(value) if value == int(value) else float(value)
+    return value
+
+
+def engine_metrics(engine):
+    """Samples the version store of the in-memory engine."""
+    with engine.condition:
+        return {'versions': engine.version_count(),
+                'rows': sum(len(table.rows) for table in engine.tables.values()),
+                'rows_with_old_versions': len(engine.dirty),
+                'active_transactions': len(engine.active)}
+
+
+class Sampler(object):
+    """The :class:`Sampler <Sampler>` object
+
+    Samples the version store from its own thread.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param connection: DB-API connection used only by the sampler, with autocommit on
+    :param interval: seconds between two samples
+    """
+
+    def __init__(self, dbms, connection, interval):
+        self.dbms = dbms
+        self.connection = connection
+        # the in-memory engine is sampled directly
+        self.engine = getattr(connection, 'engine', None)
+        self.interval = interval
+        self.queries = list(METRIC_QUERIES[dbms])
+        self.samples = []
+        self.errors = {}
+        self.phase = 'load'
+        self.started = time.time()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._sample)
+        self.thread.daemon = True
+
+    def sample(self):
+        """
+        Takes one sample.
+
+        :return: dict with the time since the start, the phase ('load' | 'cooldown')
+                 and every metric
+        """
+        sample = {'time': round(time.time() - self.started, 3), 'phase': self.phase}
+        if self.engine is not None:
+            sample.update(engine_metrics(self.engine))
+            return sample
+
+        for names, query in list(self.queries):
+            cursor = self.connection.cursor()
+            try:
+                cursor.execute(query)
+                row = cursor.fetchone() or [None] * len(names)
+                sample.update((name, number(value)) for name, value in zip(names, row))
+            except Exception as err:
+                # e.g. no permission on the view, never asked again
+                self.errors[', '.join(names)] = str(err).strip()
+                self.queries.remove((names, query))
+            finally:
+                cursor.close()
+        return sample
+
+    def _sample(self):
+        while True:
+            self.samples.append(self.sample())
+            if self.stopping.wait(self.interval):
+                return
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        self.samples.append(self.sample())
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+def summarize(samples):
+    """
+    :param samples: as taken by Sampler.sample
+    :return: dict of metric to its first, highest and last value
+    """
+    summary = {}
+    for name in samples[0] if samples else []:
+        if name in ('time', 'phase'):
+            continue
+        values = [sample[name] for sample in samples if sample.get(name) is not None]
+        if values:
+            summary[name] = {'first': values[0], 'max': max(values), 'last': values[-1]}
+    return summary
+
+
+def execute(connection, statement):
+    cursor = connection.cursor()
+    try:
+        cursor.execute(statement)
+        return cursor.fetchall() if cursor.description else None
+    finally:
+        cursor.close()
+
+
+def snapshot_load(dbms, connect_function, config, level, writers, deadline, stats):
+    """
+    Keeps a snapshot transaction open until the deadline while the writers
+    update their own row of T in a loop, a transaction per update.
+
+    :param stats: dict that receives the committed updates, the failed ones
+                  and the snapshot's reads
+    :return: None
+    """
+    reader = connect_function(dbms, config)
+    row_ids = [row[0] for row in execute(reader, ROW_IDS)]
+    reader.commit()
+    if not row_ids:
+        raise ValueError('table T has no rows to update')
+
+    def write(row_id):
+        connection = connect_function(dbms, config)
+        try:
+            while time.time() < deadline:
+                try:
+                    execute(connection, UPDATE % row_id)
+                    connection.commit()
+                    stats['updates'] += 1
+                except Exception:
+                    stats['failed_updates'] += 1
+                    connection.rollback()
+        finally:
+            connection.close()
+
+    try:
+        execute(reader, SNAPSHOT_STATEMENTS[0] % level.upper())
+        execute(reader, SNAPSHOT_STATEMENTS[1])
+        threads = [threading.Thread(target=write, args=(row_ids[writer % len(row_ids)],))
+                   for writer in range(writers)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        while time.time() < deadline:
+            # the snapshot keeps reading, as a long report would
+            execute(reader, SNAPSHOT_STATEMENTS[1])
+            stats['snapshot_reads'] += 1
+            time.sleep(min(1.0, max(0, deadline - time.time())))
+        for thread in threads:
+            thread.join()
+    finally:
+        reader.rollback()
+        reader.close()
+
+
+def scenario_load(dbms, connect_function, config, table_initialization, steps, test_num,
+                  deadline, stats):
+    """Replays a scenario until the deadline, on sessions kept between the runs."""
+    sessions = {}
+    try:
+        while time.time() < deadline:
+            result = mvcc_headless.run_scenario(dbms, config, table_initialization, steps,
+                                                test_num, None, connect_function, sessions)
+            stats['runs'] += 1
+            if result['status'] != 'ok':
+                stats['failed_runs'] += 1
+    finally:
+        mvcc_headless.close_sessions(list(sessions.values()))
+
+
+def soak(dbms, config, table_initialization, steps=None, test_num=None, level=None, writers=2,
+         duration=60, interval=1.0, cooldown=10, backend='dbms'):
+    """
+    Runs the load for the duration and samples the version store
+    until cooldown seconds after it.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :param steps: (optional) the steps of the scenario to replay, instead of the snapshot
+                  transaction and the update loops
+    :param test_num: (optional) the scenario's name
+    :param level: (optional) isolation level of the snapshot transaction
+    :param writers: number of update loops
+    :param duration: seconds of load
+    :param interval: seconds between two samples
+    :param cooldown: seconds to keep sampling after the load
+    :param backend: 'dbms' | 'memory'
+    :return: dict with the samples, their summary and the load's counts
+    """
+    connect_function = mvcc_memory.Engine().connect if backend == 'memory' \
+        else mvcc_headless.connect
+    level = level or DEFAULT_LEVELS[dbms]
+
+    connection = connect_function(dbms, config)
+    try:
+        mvcc_reset.reset_tables(connection, dbms, config, table_initialization)
+        connection.commit()
+    finally:
+        connection.close()
+
+    monitor = connect_function(dbms, config)
+    mvcc_headless.set_autocommit(monitor, True)
+    sampler = Sampler(dbms, monitor, interval)
+    stats = {'updates': 0, 'failed_updates': 0, 'snapshot_reads': 0} if steps is None \
+        else {'runs': 0, 'failed_runs': 0}
+    result = {'dbms': dbms, 'backend': backend, 'duration': duration, 'interval': interval,
+              'cooldown': cooldown}
+    if steps is None:
+        result.update({'mode': 'snapshot', 'level': level, 'writers': writers})
+    else:
+        result.update({'mode': 'scenario', 'test': test_num})
+
+    sampler.start()
+    try:
+        deadline = time.time() + duration
+        if steps is None:
+            snapshot_load(dbms, connect_function, config, level, writers, deadline, stats)
+        else:
+            scenario_load(dbms, connect_function, config, table_initialization, steps,
+                          test_num, deadline, stats)
+        sampler.phase = 'cooldown'
+        time.sleep(cooldown)
+    finally:
+        sampler.stop()
+
+    result['load'] = stats
+    result['errors'] = sampler.errors
+    result['summary'] = summarize(sampler.samples)
+    result['samples'] = sampler.samples
+
+    return result
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 3:
+        print('Argument error \n '
+              'Make sure you provide <dbms> and <yaml file path>')
+        sys.exit(2)
+    dbms, yaml_file = sys.argv[1:3]
+    if dbms not in SUPPORTED_DBMS:
+        print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+        sys.exit(2)
+
+    try:
+        config = dict(get_section(yaml_file, dbms + '-config'))
+        table_initialization = get_section(yaml_file, 'table-initialization')
+        test_num = OPTIONS.get('scenario')
+        steps = get_test(yaml_file, dbms, test_num) if test_num else None
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+    if test_num and not steps:
+        print('Test ' + test_num + ' has no steps')
+        sys.exit(2)
+
+    result = soak(dbms, config, table_initialization, steps, test_num,
+                  level=OPTIONS.get('level'), writers=int(OPTIONS['writers']),
+                  duration=float(OPTIONS['duration']), interval=float(OPTIONS['interval']),
+                  cooldown=float(OPTIONS['cooldown']), backend=OPTIONS.get('backend', 'dbms'))
+    if test_num:
+        result['comment'] = get_comments(yaml_file, dbms).get(test_num, '')
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+"""
+Streams the output of tmux panes, so that connection prompts and
+finished statements are noticed as soon as the output arrives,
+instead of polling and re-reading the whole pane with capture_pane.
+
+Each pane's output goes through `tmux pipe-pane` into a fifo,
+a reader thread keeps the last MAX_BUFFER bytes of it in memory.
+------------------------------------------------------------------------------
+"""
+import codecs
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+
+# bytes of output kept for every pane, older output gets dropped
+MAX_BUFFER = 64 * 1024
+
+# terminal escape sequences (colors, cursor movement, bracketed paste, titles)
+ESCAPE_SEQUENCES = re.compile(r'\x1b\[[0-9;?]*[ -/]*[@-~]'
+                              r'|\x1b\][^\x07\x1b]*(\x07|\x1b\\)'
+                              r'|\x1b[()][0-9A-Za-z]|\x1b[=>]')
+
+
+def clean_output(text):
+    """
+    Removes terminal escape sequences and carriage return overwrites,
+    so that the text reads the way it is shown in the pane.
+
+    :param text: raw pane output
+    :return: list of lines
+    """
+    lines = []
+    for line in ESCAPE_SEQUENCES.sub('', text).split('\n'):
+        # text after a carriage return overwrites the start of the line
+        lines.append(line.rstrip('\r').split('\r')[-1])
+
+    return lines
+
+
+class PaneStream(object):
+    """The :class:`PaneStream <PaneStream>` object
+
+    :param pane: tmux pane whose output will be streamed
+    :param max_buffer: (optional) bytes of output kept in memory
+    :param classifier: (optional) mvcc_classify.OutputClassifier, fed with every chunk
+    """
+
+    def __init__(self, pane, max_buffer=MAX_BUFFER, classifier=None):
+        self.pane = pane
+        self.max_buffer = max_buffer
+        self.classifier = classifier
+        # characters split between chunks wait for the rest of their bytes
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        self.buffer = bytearray()
+        # total bytes received, used as a position in the stream
+        self.position = 0
+        self.last_output = time.time()
+        self.closed = False
+        self.condition = threading.Condition()
+
+        self.directory = tempfile.mkdtemp(prefix='mvcc_')
+        self.fifo = os.path.join(self.directory, 'pane')
+        os.mkfifo(self.fifo)
+
+        self.thread = threading.Thread(target=self._read)
+        self.thread.daemon = True
+        self.thread.start()
+
+        pane.cmd('pipe-pane', '-o', 'cat >> ' + self.fifo)
+
+    def _read(self):
+        # blocks until tmux opens the fifo for writing
+        with open(self.fifo, 'rb', 0) as fifo:
+            while True:
+                chunk = fifo.read(4096)
+                if not chunk:
+                    break
+                with self.condition:
+                    self.buffer += chunk
+                    del self.buffer[:-self.max_buffer]
+                    self.position += len(chunk)
+                    self.last_output = time.time()
+                    if self.classifier:
+                        self.classifier.feed(self.decoder.decode(chunk))
+                    self.condition.notify_all()
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def text(self, since=0):
+        """
+        Returns the output received after the provided position,
+        or as much of it as is still in the buffer.
+
+        :param since: a previous value of self.position
+        :return: str
+        """
+        with self.condition:
+            new_bytes = max(0, self.position - since)
+            if new_bytes >= len(self.buffer):
+                data = bytes(self.buffer)
+            else:
+                data = bytes(self.buffer[-new_bytes:]) if new_bytes else b''
+
+        return data.decode('utf-8', 'replace')
+
+    def lines(self, since=0):
+        """Returns the output received after the provided position as clean lines."""
+        return clean_output(self.text(since))
+
+    def wait_for_output(self, since, timeout):
+        """
+        Waits until output arrives after the provided position.
+
+        :param since: a previous value of self.position
+        :param timeout: seconds
+        :return: True if output arrived, False on timeout or if the pane closed
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while self.position <= since:
+                remaining = deadline - time.time()
+                if remaining <= 0 or self.closed:
+                    return False
+                self.condition.wait(remaining)
+
+        return True
+
+    def wait_for(self, predicate, timeout, since=0):
+        """
+        Waits until predicate returns a true value for the lines
+        received after the provided position. Predicate gets called
+        once for the existing output and then once for every new chunk.
+
+        :param predicate: function that accepts a list of lines
+        :param timeout: seconds
+        :param since: a previous value of self.position
+        :return: the predicate's result, or None on timeout
+        """
+        deadline = time.time() + timeout
+        position = -1
+        while True:
+            with self.condition:
+                if self.position == position:
+                    remaining = deadline - time.time()
+                    if remaining <= 0 or self.closed:
+                        return None
+                    self.condition.wait(remaining)
+                    continue
+                position = self.position
+
+            result = predicate(self.lines(since))
+            if result:
+                return result
+
+    def wait_for_state(self, states, timeout):
+        """
+        Waits until the classifier's state is one of the provided ones.
+
+        :param states: e.g. [mvcc_classify.READY, mvcc_classify.ERROR]
+        :param timeout: seconds
+        :return: the state, or None on timeout or if the pane closed
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                state = self.classifier.state()
+                if state in states:
+                    return state
+                remaining = deadline - time.time()
+                if remaining <= 0 or self.closed:
+                    return None
+                self.condition.wait(remaining)
+
+    def close(self):
+        """Stops piping the pane output and removes the fifo."""
+        try:
+            # pipe-pane without a command closes the pipe
+            self.pane.cmd('pipe-pane')
+        except Exception:
+            pass
+        shutil.rmtree(self.directory, ignore_errors=True)
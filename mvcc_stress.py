@@ -0,0 +1,349 @@
+#!/usr/bin/python
+"""
+Contention stress mode: replays a test scenario in a loop with many
+concurrent worker groups, each with its own sessions (one per transaction),
+all of them on the same tables. Transactions that fail with a serialization
+failure, a deadlock or a lock timeout get retried on their own.
+
+Reports, as JSON, for every isolation level the scenario is run with:
+commits per second, the rate of serialization failures, deadlocks
+and lock timeouts, and what the retries cost (attempts and seconds).
+
+To run:
+$ python mvcc_stress.py <dbms> <test_num> <yaml_file_path> [options]
+e.g.( python mvcc_stress.py postgres test6 "./mvcc_tests.yml" --groups=16 --duration=30 )
+
+Options:
+--groups=<N>             concurrent worker groups (default 8)
+--duration=<seconds>     how long to run every isolation level (default 10)
+--iterations=<N>         stop every worker group after N iterations instead
+--retries=<N>            retries of a failed transaction (default 3)
+--levels=<a,b>           isolation levels to compare, they replace the scenario's own
+                         (e.g. --levels="read committed,repeatable read,serializable")
+--block-timeout=<sec>    seconds a step may run before the next one is sent (default 0.2)
+--backend=memory         run on the in-memory engine instead of the dbms
+--trace=<file>           append a record of every statement to the file (see mvcc_trace.py)
+
+The tables are reset once before every isolation level, not between iterations.
+Scenarios that create their tables in their first step are not suited for it.
+A worker group stops at the first statement the backend does not support
+(counted in 'unsupported').
+------------------------------------------------------------------------------
+"""
+import json
+import re
+import sys
+import threading
+import time
+
+import mvcc_headless
+import mvcc_memory
+import mvcc_reset
+import mvcc_trace
+from mvcc_index import get_comments
+from mvcc_index import get_section
+from mvcc_index import get_test
+
+SUPPORTED_DBMS = ['oracle', 'mysql', 'postgres', 'sqlserver']
+OPTIONS = {'groups': 8, 'duration': 10, 'retries': 3, 'block-timeout': 0.2}
+
+# the failures a transaction gets retried after
+RETRIED_KINDS = ['serialization_failure', 'deadlock', 'lock_timeout']
+
+SET_ISOLATION = re.compile(r'^(\s*SET\s+TRANSACTION\s+ISOLATION\s+LEVEL\s+)[A-Za-z ]+?(;*)\s*$',
+                           re.IGNORECASE)
+
+
+def parse_options():
+    """Removes the options (e.g. --groups=16) from the arguments and stores them in OPTIONS."""
+    for argument in sys.argv[1:]:
+        if argument.startswith('--'):
+            name, _, value = argument[2:].partition('=')
+            OPTIONS[name] = value or True
+            sys.argv.remove(argument)
+
+
+def with_isolation_level(steps, level):
+    """
+    Returns the steps with the isolation level of every
+    SET TRANSACTION ISOLATION LEVEL statement replaced.
+
+    :param steps: the test's steps
+    :param level: e.g. 'serializable', None keeps the scenario's levels
+    :return: steps dict
+    """
+    if not level:
+        return steps
+
+    return dict((step_name, [SET_ISOLATION.sub(r'\g<1>' + level.upper() + r'\g<2>', str(statement))
+                             for statement in statements or []])
+                for step_name, statements in steps.items())
+
+
+def new_stats():
+    return {'iterations': 0, 'attempts': 0, 'commits': 0, 'gave_up': 0, 'timeouts': 0,
+            'unsupported': 0,
+            'failures': dict((kind, 0) for kind in RETRIED_KINDS + ['error']),
+            'retries': 0, 'retry_seconds': 0.0}
+
+
+class WorkerGroup(object):
+    """The :class:`WorkerGroup <WorkerGroup>` object
+
+    Replays a scenario over its own sessions, one per transaction.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param steps: the test's steps
+    :param sessions: dict of transaction name to mvcc_headless.Session
+    :param trace: (optional) mvcc_trace.TraceWriter, gets a record of every statement
+    :param scenario: (optional) the test's name, for the trace
+    """
+
+    def __init__(self, dbms, steps, sessions, trace=None, scenario=None):
+        self.dbms = dbms
+        self.steps = steps
+        self.sessions = sessions
+        self.trace = trace
+        self.scenario = scenario
+        for session in sessions.values():
+            session.trace = trace
+        self.stats = new_stats()
+        # every statement of a transaction, for its retries
+        self.transaction_statements = {}
+        for step_name, statements in steps.items():
+            self.transaction_statements.setdefault(
+                mvcc_headless.transaction_of(step_name), []).extend(statements or [])
+
+    def reset_sessions(self):
+        for session in self.sessions.values():
+            if not session.wait(mvcc_headless.SCENARIO_TIMEOUT) or not session.reset():
+                return False
+        return True
+
+    def wait_sessions(self):
+        deadline = time.time() + mvcc_headless.SCENARIO_TIMEOUT
+        for session in self.sessions.values():
+            if not session.wait(max(0, deadline - time.time())):
+                return False
+        return True
+
+    def failure_of(self, session, records):
+        """Returns the kind of failure of a transaction's attempt, or None if it committed."""
+        for record in records:
+            if 'error' in record and record['error']['kind'] in RETRIED_KINDS:
+                return record['error']['kind']
+        if 'aborted' in session.outcomes:
+            return 'error'
+        return None
+
+    def count(self, transaction, records):
+        session = self.sessions[transaction]
+        failure = self.failure_of(session, records)
+        self.stats['attempts'] += 1
+        if failure:
+            self.stats['failures'][failure] += 1
+        elif session.outcomes and session.outcomes[-1] == 'committed':
+            self.stats['commits'] += 1
+
+        return failure in RETRIED_KINDS
+
+    def iterate(self, block_timeout, retries):
+        """
+        Replays the scenario once, then retries its failed transactions one by one.
+
+        :param block_timeout: seconds a step may run before the next one is sent
+        :param retries: maximum retries of a failed transaction
+        :return: False if the sessions got stuck
+        """
+        if not self.reset_sessions():
+            self.stats['timeouts'] += 1
+            return False
+
+        if self.trace:
+            # every iteration is a run of its own
+            trace_context = {'run': mvcc_trace.new_run_id(), 'scenario': self.scenario,
+                             'dbms': self.dbms}
+            for session in self.sessions.values():
+                session.trace_context = trace_context
+
+        records = dict((transaction, []) for transaction in self.sessions)
+        for step_name, statements in self.steps.items():
+            session = self.sessions[mvcc_headless.transaction_of(step_name)]
+            session.submit(statements or [], records[session.name], step_name)
+            session.wait_step(block_timeout)
+        if not self.wait_sessions():
+            self.stats['timeouts'] += 1
+            return False
+        if [record for transaction in records for record in records[transaction]
+                if record.get('error', {}).get('kind') == 'unsupported']:
+            # the scenario cannot run as written, replaying it measures nothing
+            self.stats['unsupported'] += 1
+            return False
+        self.stats['iterations'] += 1
+
+        for transaction in self.sessions:
+            if not self.count(transaction, records[transaction]):
+                continue
+            for attempt in range(retries + 1):
+                if attempt == retries:
+                    self.stats['gave_up'] += 1
+                    break
+                started = time.time()
+                session = self.sessions[transaction]
+                if not session.reset():
+                    self.stats['timeouts'] += 1
+                    return False
+                retry_records = []
+                session.submit(self.transaction_statements[transaction], retry_records,
+                               'retry')
+                if not session.wait(mvcc_headless.SCENARIO_TIMEOUT):
+                    self.stats['timeouts'] += 1
+                    return False
+                self.stats['retries'] += 1
+                self.stats['retry_seconds'] += time.time() - started
+                if not self.count(transaction, retry_records):
+                    break
+
+        return True
+
+    def close(self):
+        mvcc_headless.close_sessions(list(self.sessions.values()))
+
+
+def stress(dbms, config, table_initialization, steps, level=None, groups=8,
+           duration=10, iterations=None, retries=3, block_timeout=0.2, backend='dbms',
+           trace=None, scenario=None):
+    """
+    Replays a scenario with concurrent worker groups.
+
+    :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+    :param config: the '<dbms>-config' section of the yaml file
+    :param table_initialization: the 'table-initialization' section of the yaml file
+    :param steps: the test's steps
+    :param level: (optional) isolation level replacing the scenario's own
+    :param groups: number of concurrent worker groups
+    :param duration: seconds to run, when iterations is not given
+    :param iterations: (optional) iterations of every worker group
+    :param retries: maximum retries of a failed transaction
+    :param block_timeout: seconds a step may run before the next one is sent
+    :param backend: 'dbms' | 'memory'
+    :param trace: (optional) mvcc_trace.TraceWriter, gets a record of every statement
+    :param scenario: (optional) the test's name, for the trace
+    :return: stats dict
+    """
+    connect_function = mvcc_memory.Engine().connect if backend == 'memory' \
+        else mvcc_headless.connect
+
+    steps = with_isolation_level(steps, level)
+    transactions = []
+    for step_name in steps:
+        if mvcc_headless.transaction_of(step_name) not in transactions:
+            transactions.append(mvcc_headless.transaction_of(step_name))
+
+    connection = connect_function(dbms, config)
+    try:
+        mvcc_reset.reset_tables(connection, dbms, config, table_initialization)
+        connection.commit()
+    finally:
+        connection.close()
+
+    workers = []
+    try:
+        for _ in range(groups):
+            workers.append(WorkerGroup(dbms, steps, dict(
+                (transaction, mvcc_headless.Session(transaction, dbms,
+                                                    connect_function(dbms, config)))
+                for transaction in transactions), trace, scenario))
+
+        deadline = time.time() + float(duration)
+
+        def work(worker):
+            count = 0
+            while (count < iterations) if iterations else (time.time() < deadline):
+                if not worker.iterate(block_timeout, retries):
+                    return
+                count += 1
+
+        started = time.time()
+        threads = [threading.Thread(target=work, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+    finally:
+        for worker in workers:
+            worker.close()
+
+    stats = new_stats()
+    for worker in workers:
+        for name, value in worker.stats.items():
+            if name == 'failures':
+                for kind, failures in value.items():
+                    stats['failures'][kind] += failures
+            else:
+                stats[name] += value
+
+    attempts = stats['attempts'] or 1
+    stats['level'] = level
+    stats['groups'] = groups
+    stats['seconds'] = round(elapsed, 3)
+    stats['retry_seconds'] = round(stats['retry_seconds'], 3)
+    stats['commits_per_second'] = round(stats['commits'] / elapsed, 2) if elapsed else 0
+    stats['failure_rates'] = dict((kind, round(failures / float(attempts), 4))
+                                  for kind, failures in stats['failures'].items())
+    stats['abort_rate'] = round(sum(stats['failures'].values()) / float(attempts), 4)
+    stats['retries_per_commit'] = round(stats['retries'] / float(stats['commits']), 4) \
+        if stats['commits'] else None
+
+    return stats
+
+
+def main():
+    parse_options()
+    if len(sys.argv) < 4:
+        print('Argument error \n '
+              'Make sure you provide <dbms>,  <testNum> and <yaml file path>')
+        sys.exit(2)
+    dbms, test_num, yaml_file = sys.argv[1:4]
+    if dbms not in SUPPORTED_DBMS:
+        print('Invalid DBMS name!\nSupported DBMSs are: ' + str(SUPPORTED_DBMS))
+        sys.exit(2)
+
+    try:
+        config = dict(get_section(yaml_file, dbms + '-config'))
+        table_initialization = get_section(yaml_file, 'table-initialization')
+        steps = get_test(yaml_file, dbms, test_num)
+    except KeyError as err:
+        print('Error while parsing the yaml file - reason "%s"' % str(err) + ' does not exist')
+        sys.exit(2)
+    if not steps:
+        print('Test ' + test_num + ' has no steps')
+        sys.exit(2)
+
+    levels = [None]
+    if OPTIONS.get('levels'):
+        levels = [level.strip() for level in OPTIONS['levels'].split(',') if level.strip()]
+
+    results = {'dbms': dbms, 'test': test_num,
+               'comment': get_comments(yaml_file, dbms).get(test_num, ''),
+               'backend': OPTIONS.get('backend', 'dbms'), 'levels': []}
+    trace = mvcc_trace.TraceWriter(OPTIONS['trace']) if OPTIONS.get('trace') else None
+    try:
+        for level in levels:
+            results['levels'].append(stress(
+                dbms, config, table_initialization, steps, level,
+                groups=int(OPTIONS['groups']), duration=float(OPTIONS['duration']),
+                iterations=int(OPTIONS['iterations']) if OPTIONS.get('iterations') else None,
+                retries=int(OPTIONS['retries']), block_timeout=float(OPTIONS['block-timeout']),
+                backend=OPTIONS.get('backend', 'dbms'), trace=trace, scenario=test_num))
+    finally:
+        if trace:
+            trace.close()
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/python
+"""
+Writes the timeline of the scenario runs as Chrome trace-event JSON,
+which chrome://tracing and https://ui.perfetto.dev open:
+every scenario is a process, every transaction a track (thread) of it
+and a "setup" track holds the table initialization.
+    - spans: connecting a transaction's session, the table initialization,
+      every step and, for the headless and memory runs, every statement
+    - instants: a step that blocked, a commit, a rollback,
+      a commit that only rolled back an aborted transaction
+
+The interleaving of the T1/T2/... tracks shows where a scenario spends its time
+and where its transactions actually overlapped.
+
+An event:
+    {"name": "step3_T1", "ph": "X", "pid": 1, "tid": 1, "ts": 1602998741123456.0, "dur": 2104.0,
+     "cat": "step", "args": {"statements": 2}}
+------------------------------------------------------------------------------
+"""
+import json
+import re
+import threading
+
+# the track of what is not done by a transaction
+SETUP_TRACK = 'setup'
+# e.g. 'COMMIT;;' | 'rollback' | 'COMMIT TRAN;;'
+OUTCOME_STATEMENT = re.compile(r'^\s*(COMMIT|ROLLBACK)\b', re.IGNORECASE)
+# the outcome of a transaction by the statement that ends it, as in mvcc_headless.Session
+OUTCOMES = {'commit': 'committed', 'rollback': 'rolled back'}
+# characters of a statement kept in an event's name
+NAME_LENGTH = 60
+
+
+def microseconds(seconds):
+    return round(seconds * 1000000.0, 1)
+
+
+def statement_name(statement):
+    statement = ' '.join(str(statement).split())
+    return statement if len(statement) <= NAME_LENGTH else statement[:NAME_LENGTH - 3] + '...'
+
+
+def outcome_of(statement):
+    """
+    :param statement: a step line (e.g. 'COMMIT;;')
+    :return: 'committed' | 'rolled back' | None
+    """
+    match = OUTCOME_STATEMENT.match(str(statement))
+    return OUTCOMES[match.group(1).lower()] if match else None
+
+
+class Timeline(object):
+    """The :class:`Timeline <Timeline>` object
+
+    Collects the events of the scenario runs and writes them when closed,
+    safe to add events to from any thread.
+
+    :param path: the file, e.g. timeline.json
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.events = []
+        # the scenario the events are added to, a process of the trace
+        self.pid = 0
+        # track name to thread id, of the current scenario
+        self.tracks = {}
+
+    def begin(self, scenario, dbms):
+        """
+        Starts the events of a scenario, the scenarios run one after the other.
+
+        :param scenario: e.g. 'test4'
+        :param dbms: 'oracle' | 'mysql' | 'postgres' | 'sqlserver'
+        :return: None
+        """
+        with self.lock:
+            self.pid += 1
+            self.tracks = {}
+            self.events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid,
+                                'args': {'name': dbms + ' ' + scenario}})
+            self.events.append({'name': 'process_sort_index', 'ph': 'M', 'pid': self.pid,
+                                'args': {'sort_index': self.pid}})
+        self.track(SETUP_TRACK)
+
+    def track(self, name):
+        """Returns the thread id of a track (e.g. 'T1'), adding the track the first time."""
+        with self.lock:
+            if name not in self.tracks:
+                self.tracks[name] = tid = len(self.tracks)
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid,
+                                    'tid': tid, 'args': {'name': name}})
+                self.events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': self.pid,
+                                    'tid': tid, 'args': {'sort_index': tid}})
+            return self.tracks[name]
+
+    def span(self, track, name, start, end, category, args=None):
+        """
+        Adds a span.
+
+        :param track: e.g. 'T1' | SETUP_TRACK
+        :param name: e.g. 'step3_T1'
+        :param start: time.time() when it started
+        :param end: time.time() when it ended
+        :param category: e.g. 'connect' | 'initialization' | 'step' | 'statement'
+        :param args: (optional) dict shown with the span
+        :return: None
+        """
+        event = {'name': name, 'ph': 'X', 'pid': self.pid, 'tid': self.track(track),
+                 'ts': microseconds(start), 'dur': microseconds(max(end - start, 0)),
+                 'cat': category}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def instant(self, track, name, at, category, args=None):
+        """Adds an instant (e.g. 'blocked', 'commit') to a track, see span."""
+        event = {'name': name, 'ph': 'i', 's': 't', 'pid': self.pid, 'tid': self.track(track),
+                 'ts': microseconds(at), 'cat': category}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def add_result(self, result):
+        """
+        Adds the spans and instants of a scenario run over DB-API connections,
+        on the in-memory engine or in the dbms CLI clients (without statements).
+
+        :param result: as returned by mvcc_headless.run_scenario or mvcc_pty.run_scenario
+        :return: None
+        """
+        self.begin(result['test'], result['dbms'])
+        for transaction in result['transactions']:
+            self.track(transaction)
+        connections = result.get('connections', {})
+        for transaction in sorted(connections):
+            self.span(transaction, 'connect', connections[transaction]['start'],
+                      connections[transaction]['end'], 'connect',
+                      {'connected': connections[transaction].get('connected', True)})
+        for record in result.get('initialization', []):
+            if record.get('start') and record.get('end'):
+                self.span(SETUP_TRACK, 'table initialization', record['start'], record['end'],
+                          'initialization')
+
+        for step in result['steps']:
+            transaction = step['transaction']
+            ends = [step['start'] + step.get('duration', 0)]
+            for record in step.get('statements', []):
+                if not record.get('start'):
+                    continue
+                end = record.get('end') or record['start']
+                ends.append(end)
+                args = {'error': record['error'].get('kind')} if record.get('error') else None
+                self.span(transaction, statement_name(record.get('statement')),
+                          record['start'], end, 'statement', args)
+                if record.get('outcome'):
+                    self.instant(transaction, record['outcome'], end, 'outcome')
+            args = {'blocked': step['blocked']}
+            if 'statements' in step:
+                args['statements'] = len(step['statements'])
+            if step.get('errors'):
+                args['errors'] = step['errors']
+            self.span(transaction, step['step'], step['start'], max(ends), 'step', args)
+            if step['blocked']:
+                self.instant(transaction, 'blocked', step['start'], 'blocked',
+                             {'step': step['step']})
+
+    def close(self):
+        """Writes the trace-event JSON file."""
+        with self.lock:
+            events = list(self.events)
+        with open(self.path, 'w') as timeline_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, timeline_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,143 @@
+#!/usr/bin/python
+"""
+Writes an execution trace as JSON lines, one record per executed statement:
+the run and scenario, the dbms, the transaction and step, the sql,
+its start and end timestamps, the rows it returned and its error code,
+error kind and transaction outcome.
+
+Records are collected in memory and a writer thread encodes and writes
+them in batches, so the sessions executing statements never wait on the disk.
+
+A trace record:
+    {"run": "3f2a9c1e0b7d", "scenario": "test4", "dbms": "postgres",
+     "transaction": "T1", "step": "step3_T1", "sql": "SELECT * FROM T;;",
+     "action": "sql", "start": 1602998741.123, "end": 1602998741.125,
+     "rows": 2, "rowcount": 2, "error": null, "error_kind": null, "outcome": null}
+------------------------------------------------------------------------------
+"""
+import json
+import threading
+import time
+import uuid
+
+# pending records that get written without waiting for FLUSH_INTERVAL
+BATCH_SIZE = 1000
+# bytes buffered by the file before it gets written
+FILE_BUFFER = 1024 * 1024
+# seconds a record may wait in the buffer before it gets written
+FLUSH_INTERVAL = 1.0
+
+
+def new_run_id():
+    """Returns an identifier that tells apart the runs of a trace."""
+    return uuid.uuid4().hex[:12]
+
+
+def statement_record(context, step, record):
+    """
+    Builds the trace record of an executed statement.
+
+    :param context: dict with the run, scenario and dbms
+    :param step: the step's name (e.g. 'step3_T1'), None when it is not known
+    :param record: a statement record of mvcc_headless.Session.execute
+    :return: dict
+    """
+    error = record.get('error') or {}
+    trace_record = {'run': context.get('run'), 'scenario': context.get('scenario'),
+                    'dbms': context.get('dbms'), 'transaction': record.get('transaction'),
+                    'step': step, 'sql': record.get('statement'),
+                    'action': record.get('action'), 'start': record.get('start'),
+                    'end': record.get('end'),
+                    'rows': len(record['rows']) if 'rows' in record else None,
+                    'rowcount': record.get('rowcount'),
+                    'error': error.get('code'), 'error_kind': error.get('kind'),
+                    'outcome': record.get('outcome')}
+    if 'state' in record:
+        # the CLI clients only show if a statement finished or got blocked
+        trace_record['state'] = record['state']
+
+    return trace_record
+
+
+def cli_record(transaction, statement, start, state, error_kind=None):
+    """
+    Builds the statement record of a statement typed in a dbms CLI client,
+    in the shape of mvcc_headless.Session.execute's records.
+
+    :param transaction: e.g. 'T1'
+    :param statement: the step line
+    :param start: when it was typed
+    :param state: 'done' | 'blocked', as returned by send_statement
+    :param error_kind: (optional) the error the client printed, see mvcc_classify.py
+    :return: dict
+    """
+    record = {'transaction': transaction, 'statement': statement, 'action': 'cli',
+              'start': start, 'end': time.time() if state == 'done' else None,
+              'state': state}
+    if error_kind and state == 'done':
+        record['error'] = {'code': None, 'kind': error_kind}
+
+    return record
+
+
+class TraceWriter(object):
+    """The :class:`TraceWriter <TraceWriter>` object
+
+    Appends records to a JSON lines file from a writer thread.
+
+    :param path: trace file, records get appended to it
+    :param batch_size: (optional) records written at once
+    :param flush_interval: (optional) seconds a record may wait before it gets written
+    """
+
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # records not written yet, swapped for an empty list by the writer thread
+        self.pending = []
+        self.lock = threading.Lock()
+        self.closing = threading.Event()
+        self.written = 0
+        self.last_write = time.time()
+        self.encoder = json.JSONEncoder(default=str, check_circular=False)
+        self.file = open(path, 'a', FILE_BUFFER)
+        self.thread = threading.Thread(target=self._write)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, record):
+        """Adds a record to the pending ones, never waits on the disk."""
+        with self.lock:
+            self.pending.append(record)
+
+    def _write(self):
+        while True:
+            closing = self.closing.wait(self.flush_interval / 10)
+            with self.lock:
+                if not closing and len(self.pending) < self.batch_size and \
+                        time.time() - self.last_write < self.flush_interval:
+                    continue
+                batch, self.pending = self.pending, []
+
+            if batch:
+                encode = self.encoder.encode
+                self.file.write('\n'.join(encode(record) for record in batch) + '\n')
+                self.file.flush()
+                self.written += len(batch)
+            self.last_write = time.time()
+            if closing:
+                return
+
+    def close(self):
+        """Writes the pending records and closes the file."""
+        if self.thread.is_alive():
+            self.closing.set()
+            self.thread.join()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+import mvcc_anomaly
+import mvcc_headless
+import mvcc_index
+import mvcc_memory
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'db', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['DROP TABLE IF EXISTS T;;',
+                        'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'INSERT INTO T VALUES (2, 2);;',
+                        'COMMIT;;']
+
+
+def lost_update_steps(level):
+    return {
+        'step1_T1': ['BEGIN TRANSACTION;;', 'SET TRANSACTION ISOLATION LEVEL ' + level + ';;',
+                     'SELECT * FROM T WHERE id=1;;'],
+        'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=12 WHERE id=1;;', 'COMMIT;;'],
+        'step3_T1': ['UPDATE T SET x=13 WHERE id=1;;', 'SELECT * FROM T WHERE id=1;;',
+                     'COMMIT;;'],
+    }
+
+
+def run(steps, comment, dbms='postgres'):
+    result = mvcc_headless.run_scenario(dbms, CONFIG, TABLE_INITIALIZATION, steps, 'test1',
+                                        comment, mvcc_memory.Engine().connect)
+    return result, mvcc_anomaly.analyze(result, TABLE_INITIALIZATION)
+
+
+@pytest.fixture(autouse=True)
+def short_block_timeout(monkeypatch):
+    monkeypatch.setattr(mvcc_headless, 'STEP_BLOCK_TIMEOUT', 0.2)
+
+
+def test_find_cycles_finds_a_cycle_once():
+    edges = [('T1', 'T2', 'rw', 't:1'), ('T2', 'T1', 'ww', 't:1')]
+    assert mvcc_anomaly.find_cycles(edges) == [edges]
+
+
+def test_find_cycles_follows_longer_cycles():
+    edges = [('T1', 'T2', 'wr', 't:1'), ('T2', 'T3', 'wr', 't:2'), ('T3', 'T1', 'rw', 't:3')]
+    assert mvcc_anomaly.find_cycles(edges) == [edges]
+
+
+def test_find_cycles_without_a_cycle():
+    edges = [('T1', 'T2', 'wr', 't:1'), ('T2', 'T3', 'ww', 't:1'), ('T1', 'T3', 'rw', 't:2')]
+    assert mvcc_anomaly.find_cycles(edges) == []
+
+
+@pytest.mark.parametrize('cycle, anomaly', [
+    ([('T1', 'T2', 'rw', 't:1'), ('T2', 'T1', 'ww', 't:1')], 'lost update'),
+    ([('T1', 'T2', 'rw', 't:1'), ('T2', 'T1', 'wr', 't:1')], 'non-repeatable read'),
+    ([('T1', 'T2', 'rw', 't:1'), ('T2', 'T1', 'wr', 't:2')], 'read skew'),
+    ([('T1', 'T2', 'rw', 't:1'), ('T2', 'T1', 'rw', 't:2')], 'write skew'),
+    ([('T1', 'T2', 'prw', 't'), ('T2', 'T1', 'wr', 't:3')], 'phantom'),
+    ([('T1', 'T2', 'ww', 't:1'), ('T2', 'T1', 'ww', 't:2')], 'dirty write'),
+    ([('T1', 'T2', 'wr', 't:1'), ('T2', 'T3', 'wr', 't:2'), ('T3', 'T1', 'rw', 't:3')],
+     'serialization anomaly'),
+])
+def test_classify_cycle(cycle, anomaly):
+    assert mvcc_anomaly.classify_cycle(cycle) == anomaly
+
+
+def test_analyze_lost_update_at_read_committed():
+    result, analysis = run(lost_update_steps('READ COMMITTED'),
+                           '# Anomaly|Lost Update - Isolation|Read Committed')
+    assert result['status'] == 'ok'
+    assert [anomaly['type'] for anomaly in analysis['anomalies']] == ['lost update']
+    assert analysis['verdict'] == 'pass'
+
+
+def test_analyze_ignores_the_errors_after_a_serialization_failure():
+    result, analysis = run(lost_update_steps('REPEATABLE READ'),
+                           '# Anomaly|Lost Update - Isolation|Repeatable Read')
+    kinds = [record['error']['kind'] for step in result['steps']
+             for record in step['statements'] if record.get('error')]
+    # postgres refuses the statements after the failure until the transaction ends
+    assert kinds == ['serialization_failure', 'error']
+    assert analysis['anomalies'] == []
+    assert analysis['unexpected_errors'] == []
+    assert analysis['verdict'] == 'pass'
+
+
+def test_analyze_is_inconclusive_after_an_unexpected_error():
+    steps = lost_update_steps('SERIALIZABLE')
+    steps['step1_T1'].append('SELECT * FROM missing_table;;')
+    result, analysis = run(steps, '# Anomaly|Lost Update - Isolation|Serializable')
+    assert result['status'] == 'ok'
+    assert analysis['unexpected_errors'][0]['code'] == '42P01'
+    assert analysis['verdict'] == 'inconclusive'
+
+
+def test_analyze_unsupported_run():
+    steps = lost_update_steps('READ COMMITTED')
+    steps['step2_T2'].insert(1, 'UPDATE T SET x = CASE WHEN x > 1 THEN 1 ELSE 2 END;;')
+    result, analysis = run(steps, '# Anomaly|Lost Update - Isolation|Read Committed')
+    assert result['status'] == 'unsupported'
+    assert analysis['verdict'] == 'unknown'
+
+
+@pytest.mark.parametrize('dbms, test_num, anomalies', [
+    ('oracle', 'test9', ['non-repeatable read', 'read skew']),
+    ('postgres', 'test14', []),
+])
+def test_analyze_read_skew_scenario_dropping_a_missing_table(dbms, test_num, anomalies):
+    yaml_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                             'mvcc_tests.yml')
+    table_initialization = mvcc_index.get_section(yaml_file, 'table-initialization')
+    result = mvcc_headless.run_scenario(dbms, CONFIG, table_initialization,
+                                        mvcc_index.get_test(yaml_file, dbms, test_num), test_num,
+                                        mvcc_index.get_comments(yaml_file, dbms)[test_num],
+                                        mvcc_memory.Engine().connect)
+    analysis = mvcc_anomaly.analyze(result, table_initialization)
+    # the scenario starts with DROP TABLE accounts, which fails on the new engine
+    assert [record['error']['kind'] for record in result['steps'][0]['statements']
+            if record.get('error')] == ['error']
+    assert [anomaly['type'] for anomaly in analysis['anomalies']] == anomalies
+    assert analysis['unexpected_errors'] == []
+    assert analysis['verdict'] == 'pass'
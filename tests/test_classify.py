@@ -0,0 +1,80 @@
+import pytest
+
+from mvcc_classify import CONNECTING
+from mvcc_classify import ERROR
+from mvcc_classify import EXECUTING
+from mvcc_classify import OutputClassifier
+from mvcc_classify import READY
+
+
+@pytest.mark.parametrize('dbms, prompt', [
+    ('postgres', 'postgres=# '),
+    ('postgres', 'postgres=*> '),
+    ('mysql', 'mysql> '),
+    ('mysql', 'MariaDB [test]> '),
+    ('sqlserver', '1> '),
+    ('oracle', 'SQL> '),
+])
+def test_prompt_is_ready(dbms, prompt):
+    classifier = OutputClassifier(dbms)
+    assert classifier.feed('Welcome\r\n') == CONNECTING
+    assert classifier.feed(prompt) == READY
+    assert classifier.connected
+
+
+def test_prompt_split_over_chunks_and_colored():
+    classifier = OutputClassifier('postgres')
+    classifier.feed('\x1b[?2004hpost')
+    assert classifier.feed('gres=# ') == READY
+
+
+@pytest.mark.parametrize('dbms, output, reason', [
+    ('postgres', 'psql: error: FATAL:  database "x" does not exist\n', 'database'),
+    ('mysql', 'ERROR 2005 (HY000): Unknown MySQL server host \'x\' (-2)\n', 'host'),
+    ('sqlserver', 'Msg 18456, Level 14, State 1, Server x, Line 1\n'
+                  'Login failed for user \'sa\'.\n', 'authentication'),
+])
+def test_connection_errors(dbms, output, reason):
+    classifier = OutputClassifier(dbms)
+    assert classifier.feed(output) == ERROR
+    assert classifier.error == reason
+
+
+@pytest.mark.parametrize('dbms, output, kind', [
+    ('postgres', 'ERROR:  could not serialize access due to concurrent update\n',
+     'serialization_failure'),
+    ('postgres', 'ERROR:  deadlock detected\n', 'deadlock'),
+    ('mysql', 'ERROR 1213 (40001): Deadlock found when trying to get lock\n', 'deadlock'),
+    ('mysql', 'ERROR 1205 (HY000): Lock wait timeout exceeded\n', 'lock_timeout'),
+    ('sqlserver', 'Msg 3960, Level 16, State 2, Server x, Line 1\n', 'serialization_failure'),
+    ('oracle', 'ORA-08177: can\'t serialize access for this transaction\n',
+     'serialization_failure'),
+    ('mysql', 'ERROR 1146 (42S02): Table \'test.x\' doesn\'t exist\n', 'error'),
+])
+def test_statement_errors(dbms, output, kind):
+    classifier = OutputClassifier(dbms)
+    classifier.feed('prompt\n' if dbms != 'mysql' else '')
+    classifier.connected = True
+    classifier.expect()
+    classifier.feed(output)
+    assert classifier.statement_error == kind
+    classifier.expect()
+    assert classifier.statement_error is None
+
+
+def test_connection_error_text_after_connecting_is_a_statement_error():
+    classifier = OutputClassifier('mysql')
+    classifier.feed('mysql> ')
+    classifier.expect()
+    assert classifier.feed('ERROR 1045 (28000): Access denied for user\n') == EXECUTING
+    assert classifier.error is None
+    assert classifier.statement_error == 'error'
+
+
+def test_executing_until_the_prompt():
+    classifier = OutputClassifier('postgres')
+    classifier.feed('postgres=# ')
+    classifier.expect()
+    assert classifier.state() == EXECUTING
+    assert classifier.feed('UPDATE 1\r\n') == EXECUTING
+    assert classifier.feed('postgres=# ') == READY
@@ -0,0 +1,64 @@
+import mvcc_explore
+
+
+def footprint(step_name, *statements):
+    return mvcc_explore.footprint('postgres', step_name, list(statements))
+
+
+def test_dependent_steps_of_the_same_transaction():
+    assert mvcc_explore.dependent(footprint('step1_T1', 'SELECT * FROM T WHERE id=1;;'),
+                                  footprint('step2_T1', 'SELECT * FROM T WHERE id=2;;'))
+
+
+def test_dependent_write_and_read_of_the_same_row():
+    write = footprint('step1_T1', 'UPDATE T SET x=2 WHERE id=1;;')
+    read = footprint('step2_T2', 'SELECT * FROM T WHERE id=1;;')
+    assert mvcc_explore.dependent(write, read)
+    assert mvcc_explore.dependent(read, write)
+
+
+def test_independent_steps():
+    assert not mvcc_explore.dependent(footprint('step1_T1', 'UPDATE T SET x=2 WHERE id=1;;'),
+                                      footprint('step2_T2', 'UPDATE T SET x=3 WHERE id=2;;'))
+    assert not mvcc_explore.dependent(footprint('step1_T1', 'SELECT * FROM T WHERE id=1;;'),
+                                      footprint('step2_T2', 'SELECT * FROM T;;'))
+
+
+def test_dependent_transaction_boundary():
+    assert mvcc_explore.dependent(footprint('step1_T1', 'COMMIT;;'),
+                                  footprint('step2_T2', 'SELECT * FROM T WHERE id=2;;'))
+
+
+def test_dependent_unknown_statement():
+    assert mvcc_explore.dependent(footprint('step1_T1', 'EXEC currently_on_call;;'),
+                                  footprint('step2_T2', 'SELECT * FROM T WHERE id=2;;'))
+
+
+def test_interleavings_keep_every_transaction_in_order():
+    steps = {'step1_T1': ['SELECT * FROM T WHERE id=1;;'],
+             'step2_T2': ['UPDATE T SET x=2 WHERE id=1;;'],
+             'step3_T1': ['COMMIT;;']}
+    orders = list(mvcc_explore.interleavings('postgres', steps, reduce=False))
+    assert sorted(orders) == [['step1_T1', 'step2_T2', 'step3_T1'],
+                              ['step1_T1', 'step3_T1', 'step2_T2'],
+                              ['step2_T2', 'step1_T1', 'step3_T1']]
+    assert mvcc_explore.count_interleavings(steps) == len(orders)
+
+
+def test_interleavings_reduce_independent_steps():
+    steps = {'step1_T1': ['SELECT * FROM T WHERE id=1;;'],
+             'step2_T2': ['SELECT * FROM T WHERE id=2;;']}
+    assert len(list(mvcc_explore.interleavings('postgres', steps, reduce=False))) == 2
+    assert list(mvcc_explore.interleavings('postgres', steps)) == [['step1_T1', 'step2_T2']]
+
+
+def test_interleavings_keep_dependent_orders():
+    steps = {'step1_T1': ['SELECT * FROM T WHERE id=1;;'],
+             'step2_T2': ['UPDATE T SET x=2 WHERE id=1;;']}
+    assert len(list(mvcc_explore.interleavings('postgres', steps))) == 2
+
+
+def test_interleavings_limit():
+    steps = dict(('step' + str(number) + '_T' + str(number % 2 + 1), ['COMMIT;;'])
+                 for number in range(1, 7))
+    assert len(list(mvcc_explore.interleavings('postgres', steps, limit=5))) == 5
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+
+import mvcc_headless
+import mvcc_memory
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'db', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['DROP TABLE IF EXISTS T;;',
+                        'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'COMMIT;;']
+STEPS = {
+    'step1_T1': ['BEGIN TRANSACTION;;', 'SELECT * FROM T WHERE id=1;;'],
+    'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=2 WHERE id=1;;', 'COMMIT;;'],
+    'step3_T1': ['SELECT * FROM T WHERE id=1;;', 'COMMIT;;'],
+}
+
+
+class RecordingConnection(object):
+    """A memory engine connection that records the threads it gets used from."""
+
+    def __init__(self, connection):
+        self.__dict__.update(connection=connection, threads=set())
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+    def __setattr__(self, name, value):
+        if name == 'autocommit':
+            self.used()
+        setattr(self.connection, name, value)
+
+    def used(self):
+        self.threads.add(threading.current_thread())
+
+    def cursor(self):
+        self.used()
+        return self.connection.cursor()
+
+    def commit(self):
+        self.used()
+        self.connection.commit()
+
+    def rollback(self):
+        self.used()
+        self.connection.rollback()
+
+    def close(self):
+        self.used()
+        self.connection.close()
+
+
+@pytest.fixture(autouse=True)
+def short_block_timeout(monkeypatch):
+    monkeypatch.setattr(mvcc_headless, 'STEP_BLOCK_TIMEOUT', 0.2)
+
+
+@pytest.mark.parametrize('dbms, statement, translated', [
+    ('postgres', 'COMMIT;;', ('commit', None)),
+    ('mysql', 'rollback work;;', ('rollback', None)),
+    ('postgres', '\\set AUTOCOMMIT on', ('autocommit', True)),
+    ('sqlserver', 'set implicit_transactions on;;', ('autocommit', False)),
+    ('sqlserver', 'GO', ('skip', 'GO')),
+    ('postgres', '\\! clear', ('skip', '\\! clear')),
+    ('postgres', '----   S T E P  1  ----', None),
+    ('mysql', 'SELECT * FROM T;;', ('sql', 'SELECT * FROM T')),
+    ('oracle', 'var doctors_on_call NUMBER;;', ('variable', 'doctors_on_call')),
+    ('oracle', 'print doctors_on_call;;', ('print', 'doctors_on_call')),
+    ('oracle', 'exec count_on_call(:doctors_on_call);;',
+     ('sql', 'BEGIN count_on_call(:doctors_on_call); END;')),
+    ('oracle', 'BEGIN UPDATE T SET x=1; END;;', ('sql', 'BEGIN UPDATE T SET x=1; END;')),
+])
+def test_translate_statement(dbms, statement, translated):
+    assert mvcc_headless.translate_statement(dbms, statement) == translated
+
+
+def test_run_scenario():
+    result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS, 'test1',
+                                        '# comment', mvcc_memory.Engine().connect)
+    assert result['status'] == 'ok'
+    assert [step['step'] for step in result['steps']] == list(STEPS)
+    assert result['initialization'][0]['mode'] == 'rebuilt'
+    # read committed: the second read sees T2's commit
+    reads = [record['rows'] for step in result['steps'] for record in step['statements']
+             if record['transaction'] == 'T1' and 'rows' in record]
+    assert reads == [[[1, 1]], [[1, 2]]]
+    assert result['transactions'] == {'T1': 'committed', 'T2': 'committed'}
+    assert sorted(result['connections']) == ['T1', 'T2']
+    assert set(result['timings']) == set(['connect', 'reset', 'steps', 'total'])
+
+
+def test_run_scenario_blocked_step():
+    steps = {'step1_T1': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=2 WHERE id=1;;'],
+             'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=3 WHERE id=1;;', 'COMMIT;;'],
+             'step3_T1': ['COMMIT;;']}
+    result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, steps,
+                                        connect_function=mvcc_memory.Engine().connect)
+    assert [step['blocked'] for step in result['steps']] == [False, True, False]
+    assert result['transactions'] == {'T1': 'committed', 'T2': 'committed'}
+
+
+def test_run_scenario_uses_each_connection_from_one_thread():
+    engine = mvcc_memory.Engine()
+    connections = []
+
+    def connect(dbms, config):
+        connections.append(RecordingConnection(engine.connect(dbms)))
+        return connections[-1]
+
+    sessions = {}
+    for _ in range(2):
+        # the second run resets the kept sessions
+        result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                            connect_function=connect, sessions=sessions)
+        assert result['status'] == 'ok'
+    assert mvcc_headless.close_sessions(list(sessions.values()))
+    assert len(connections) == 2
+    for connection in connections:
+        assert len(connection.threads) == 1
+        assert threading.current_thread() not in connection.threads
+
+
+def test_run_scenario_connection_error():
+    def connect(dbms, config):
+        raise IOError('could not connect to server')
+
+    result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                        connect_function=connect)
+    assert result['status'] == 'error'
+    assert result['error'] == 'Connection error: could not connect to server'
+
+
+def test_run_scenario_other_errors_keep_their_type(monkeypatch):
+    def reset_tables(connection, dbms, config, table_initialization):
+        raise RuntimeError('reset failed')
+
+    monkeypatch.setattr(mvcc_headless.mvcc_reset, 'reset_tables', reset_tables)
+    result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                        connect_function=mvcc_memory.Engine().connect)
+    assert result['status'] == 'error'
+    assert result['error'] == 'RuntimeError: reset failed'
+
+
+def test_session_call_runs_on_the_worker():
+    session = mvcc_headless.Session('T1', 'postgres', mvcc_memory.Engine().connect('postgres'))
+    assert session.call(threading.current_thread) is session.thread
+    with pytest.raises(ZeroDivisionError):
+        session.call(lambda: 1 / 0)
+    assert mvcc_headless.close_sessions([session])
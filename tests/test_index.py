@@ -0,0 +1,150 @@
+import os
+
+import pytest
+import yaml
+
+import mvcc_index
+
+YAML = """# the configs
+postgres-config:
+    host: 127.0.0.1
+    db: test
+table-initialization:
+    - 'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;'
+postgres-tests:
+    test1:    # Anomaly|Lost Update - Isolation|Read Committed
+        step1_T1:
+            - 'BEGIN TRANSACTION;;'
+    test2:
+        step1_T1:
+            - 'SELECT * FROM T;;'
+        step2_T2:
+            - 'COMMIT;;'
+mysql-tests:
+    test1:    # Anomaly|Write Skew - Isolation|Serializable
+        step1_T1:
+            - 'BEGIN;;'
+"""
+
+
+def write(path, text):
+    with open(path, 'w') as yaml_file:
+        yaml_file.write(text)
+    return path
+
+
+def test_sections_and_tests_match_the_parsed_file(tmp_path):
+    yaml_file = write(str(tmp_path / 'tests.yml'), YAML)
+    parsed = yaml.safe_load(YAML)
+
+    assert mvcc_index.load_sections(yaml_file) == parsed
+    assert list(mvcc_index.load_sections(yaml_file)) == list(parsed)
+    for dbms in ['postgres', 'mysql']:
+        assert mvcc_index.test_numbers(yaml_file, dbms) == list(parsed[dbms + '-tests'])
+        for test_num, steps in parsed[dbms + '-tests'].items():
+            assert mvcc_index.get_test(yaml_file, dbms, test_num) == steps
+    assert mvcc_index.get_comments(yaml_file, 'postgres') == {
+        'test1': '# Anomaly|Lost Update - Isolation|Read Committed', 'test2': ''}
+
+
+def test_spans_cover_the_text_of_their_test(tmp_path):
+    yaml_file = write(str(tmp_path / 'tests.yml'), YAML)
+    entry = mvcc_index.load_index(yaml_file)['sections']['postgres-tests']
+    data = YAML.encode('utf-8')
+    start, end = entry['tests']['test2']
+    assert data[start:end].decode('utf-8') == YAML[YAML.index('    test2:'):
+                                                   YAML.index('mysql-tests:')]
+    assert entry['span'][1] == end
+
+
+@pytest.mark.parametrize('get', [
+    lambda yaml_file: mvcc_index.get_section(yaml_file, 'oracle-config'),
+    lambda yaml_file: mvcc_index.get_test(yaml_file, 'postgres', 'test9'),
+    lambda yaml_file: mvcc_index.get_test(yaml_file, 'oracle', 'test1'),
+])
+def test_missing_sections_and_tests(tmp_path, get):
+    with pytest.raises(KeyError):
+        get(write(str(tmp_path / 'tests.yml'), YAML))
+
+
+def test_the_cache_is_reused_until_the_file_changes(tmp_path, monkeypatch):
+    yaml_file = write(str(tmp_path / 'tests.yml'), YAML)
+    index = mvcc_index.load_index(yaml_file)
+    assert os.path.exists(mvcc_index.cache_path(yaml_file))
+    assert mvcc_index.load_index(yaml_file) is index
+
+    # another process reads the cache instead of the file
+    monkeypatch.setattr(mvcc_index, 'LOADED_INDEXES', {})
+    built = []
+    monkeypatch.setattr(mvcc_index, 'build_index',
+                        lambda data, build=mvcc_index.build_index: built.append(1) or build(data))
+    assert mvcc_index.load_index(yaml_file)['hash'] == index['hash']
+    assert built == []
+
+    # the same content with a new modification time needs no new index
+    stat = os.stat(yaml_file)
+    os.utime(yaml_file, (stat.st_atime, stat.st_mtime + 10))
+    assert mvcc_index.load_index(yaml_file)['hash'] == index['hash']
+    assert built == []
+
+    # a changed file of the same size does
+    write(yaml_file, YAML.replace('test2', 'test3'))
+    os.utime(yaml_file, (stat.st_atime, stat.st_mtime + 20))
+    assert mvcc_index.test_numbers(yaml_file, 'postgres') == ['test1', 'test3']
+    assert built == [1]
+    assert mvcc_index.section_hash(yaml_file, 'postgres-tests') != \
+        index['sections']['postgres-tests']['hash']
+    assert mvcc_index.section_hash(yaml_file, 'mysql-tests') == \
+        index['sections']['mysql-tests']['hash']
+
+
+def test_an_old_cache_version_is_rebuilt(tmp_path):
+    yaml_file = write(str(tmp_path / 'tests.yml'), YAML)
+    write(mvcc_index.cache_path(yaml_file), '{"version": 1}')
+    assert mvcc_index.read_cache(yaml_file) is None
+    assert mvcc_index.load_index(yaml_file)['version'] == mvcc_index.INDEX_VERSION
+
+
+@pytest.mark.parametrize('by, file_names', [
+    ('dbms', ['config.yml', 'mysql.yml', 'postgres.yml']),
+    ('anomaly', ['config.yml', 'lost_update.yml', 'other.yml', 'write_skew.yml']),
+])
+def test_split_files_hold_the_same_tests(tmp_path, by, file_names):
+    yaml_file = write(str(tmp_path / 'tests.yml'), YAML)
+    directory = str(tmp_path / 'scenarios')
+    written = mvcc_index.split_file(yaml_file, directory, by)
+    assert [os.path.basename(path) for path in written] == file_names
+
+    for name in ['postgres-config', 'table-initialization', 'postgres-tests', 'mysql-tests']:
+        assert mvcc_index.get_section(directory, name) == mvcc_index.get_section(yaml_file, name)
+    for dbms in ['postgres', 'mysql']:
+        assert sorted(mvcc_index.test_numbers(directory, dbms)) == \
+            mvcc_index.test_numbers(yaml_file, dbms)
+        assert mvcc_index.get_comments(directory, dbms) == \
+            mvcc_index.get_comments(yaml_file, dbms)
+        for test_num in mvcc_index.test_numbers(yaml_file, dbms):
+            assert mvcc_index.get_test(directory, dbms, test_num) == \
+                mvcc_index.get_test(yaml_file, dbms, test_num)
+    # the caches of the files are no scenario files
+    assert [os.path.basename(path) for path in mvcc_index.scenario_files(directory)] == \
+        file_names
+
+
+def test_a_section_in_several_files(tmp_path):
+    directory = tmp_path / 'scenarios'
+    directory.mkdir()
+    write(str(directory / 'a.yml'), 'postgres-config:\n    db: a\n'
+                                    'postgres-tests:\n    test1:\n        step1_T1: []\n')
+    write(str(directory / 'b.yml'), 'postgres-config:\n    db: b\n'
+                                    'postgres-tests:\n    test1:\n        step1_T2: []\n'
+                                    '    test2:\n        step1_T1: []\n')
+    assert mvcc_index.get_section(str(directory), 'postgres-config') == {'db': 'a'}
+    assert mvcc_index.get_section(str(directory), 'postgres-tests') == {
+        'test1': {'step1_T1': []}, 'test2': {'step1_T1': []}}
+    assert mvcc_index.get_test(str(directory), 'postgres', 'test1') == {'step1_T1': []}
+    assert mvcc_index.test_numbers(str(directory), 'postgres') == ['test1', 'test2']
+    # the section's hash changes with any of its files
+    before = mvcc_index.section_hash(str(directory), 'postgres-tests')
+    write(str(directory / 'b.yml'), 'postgres-tests:\n    test2:\n        step1_T2: []\n')
+    os.utime(str(directory / 'b.yml'), (0, 0))
+    assert mvcc_index.section_hash(str(directory), 'postgres-tests') != before
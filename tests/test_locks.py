@@ -0,0 +1,57 @@
+import pytest
+
+import mvcc_headless
+import mvcc_locks
+import mvcc_memory
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'test', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'INSERT INTO T VALUES (2, 2);;',
+                        'COMMIT;;']
+
+
+@pytest.mark.parametrize('lines, session_id', [
+    (['postgres=# SELECT pg_backend_pid();', ' pg_backend_pid ', '----------------',
+      '          12345', '(1 row)', '', 'postgres=# '], '12345'),
+    (['mysql> SELECT CONNECTION_ID();', '+-----------------+', '| CONNECTION_ID() |',
+      '+-----------------+', '|              42 |', '+-----------------+',
+      '1 row in set (0.00 sec)'], '42'),
+    (['1> SELECT @@SPID;', '2> GO', '------', '    53', '', '(1 rows affected)', '1> '], '53'),
+    (['SQL> SELECT 1 FROM DUAL;', 'no rows selected'], None),
+])
+def test_session_id_from_output(lines, session_id):
+    assert mvcc_locks.session_id_from_output(lines) == session_id
+
+
+@pytest.mark.parametrize('edges, cycles', [
+    ([], set()),
+    ([('T1', 'T2')], set()),
+    ([('T1', 'T2'), ('T2', 'T1')], set([('T1', 'T2')])),
+    ([('T1', 'T2'), ('T2', 'T3'), ('T3', 'T1'), ('T4', 'T1')], set([('T1', 'T2', 'T3')])),
+    # two cycles through the same transaction
+    ([('T1', 'T2'), ('T2', 'T1'), ('T2', 'T3'), ('T3', 'T2')],
+     set([('T1', 'T2'), ('T2', 'T3')])),
+    ([('T1', 'T2'), ('T2', 'T3'), ('T1', 'T3')], set()),
+])
+def test_find_deadlocks(edges, cycles):
+    assert mvcc_locks.find_deadlocks(edges) == cycles
+
+
+def test_run_scenario_reports_the_waits_and_the_deadlock(monkeypatch):
+    monkeypatch.setattr(mvcc_headless, 'STEP_BLOCK_TIMEOUT', 0.2)
+    steps = {'step1_T1': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=10 WHERE id=1;;'],
+             'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=20 WHERE id=2;;'],
+             'step3_T1': ['UPDATE T SET x=10 WHERE id=2;;'],
+             'step4_T2': ['UPDATE T SET x=20 WHERE id=1;;'],
+             'step5_T1': ['COMMIT;;'],
+             'step6_T2': ['ROLLBACK;;']}
+    result = mvcc_headless.run_scenario(
+        'postgres', CONFIG, TABLE_INITIALIZATION, steps,
+        connect_function=mvcc_memory.Engine().connect, observe_locks=True)
+    locks = result['locks']
+    assert locks['error'] is None
+    assert [deadlock['transactions'] for deadlock in locks['deadlocks']] == [['T1', 'T2']]
+    waits = [(wait['waiter'], wait['blocker'], wait['step']) for wait in locks['waits']]
+    assert waits[0] == ('T1', 'T2', 'step3_T1')
+    assert ('T2', 'T1', 'step4_T2') in waits
+    assert locks['graph'][-1]['edges'] == []
@@ -0,0 +1,56 @@
+import mvcc_matrix
+
+STEPS = """        step1_T1:
+            - 'BEGIN TRANSACTION;;'
+            - 'SET TRANSACTION ISOLATION LEVEL READ COMMITTED;;'
+            - 'SELECT * FROM T WHERE id=1;;'
+        step2_T2:
+            - 'BEGIN TRANSACTION;;'
+            - 'UPDATE T SET x=12 WHERE id=1;;'
+            - 'COMMIT;;'
+        step3_T1:
+            - 'SELECT * FROM T WHERE id=1;;'
+            - 'COMMIT;;'
+"""
+YAML = """postgres-config:
+    host: 127.0.0.1
+    user: user
+    password: password
+    db: test
+mysql-config:
+    host: 127.0.0.1
+    user: user
+    password: password
+    db: test
+table-initialization:
+    - 'DROP TABLE T;;'
+    - 'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;'
+    - 'INSERT INTO T VALUES (1, 1);;'
+    - 'COMMIT;;'
+postgres-tests:
+    test1:    # Anomaly|Non-Repeatable Read - Isolation|Read Committed
+""" + STEPS + """    test2:    # Anomaly|Non-Repeatable Read - Isolation|Read Committed
+""" + STEPS + """mysql-tests:
+    test1:    # Anomaly|Non-Repeatable Read - Isolation|Read Committed
+""" + STEPS
+
+
+def test_every_test_of_an_anomaly_and_level_gets_a_cell(tmp_path):
+    yaml_file = str(tmp_path / 'tests.yml')
+    with open(yaml_file, 'w') as test_file:
+        test_file.write(YAML)
+
+    matrix = mvcc_matrix.run_matrix(yaml_file, ['postgres', 'mysql'], 'memory', processes=1)
+    assert len(matrix['rows']) == 1
+    row = matrix['rows'][0]
+    assert (row['anomaly'], row['level']) == ('non-repeatable read', 'read committed')
+    assert [cell['test'] for cell in row['dbms']['postgres']] == ['test1', 'test2']
+    assert [cell['test'] for cell in row['dbms']['mysql']] == ['test1']
+    for cells in row['dbms'].values():
+        for cell in cells:
+            assert cell['anomalies'] == ['non-repeatable read']
+
+    lines = mvcc_matrix.format_matrix(matrix).split('\n')
+    assert len(lines) == 3
+    assert lines[1].startswith('Non-Repeatable Read  Read Committed  test1: ')
+    assert 'test2: ' in lines[2] and lines[2].rstrip().endswith('-')
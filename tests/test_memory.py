@@ -0,0 +1,176 @@
+import threading
+import time
+
+import pytest
+
+import mvcc_memory
+
+
+def connect(dbms, level, connections=2):
+    """Returns connections at the isolation level to a new engine with the table t."""
+    engine = mvcc_memory.Engine()
+    setup = engine.connect(dbms)
+    setup.cursor().execute('CREATE TABLE t (id INT PRIMARY KEY, x INT)')
+    setup.cursor().execute('INSERT INTO t VALUES (1, 10), (2, 20)')
+    setup.commit()
+    result = [engine.connect(dbms) for _ in range(connections)]
+    for connection in result:
+        connection.cursor().execute('SET TRANSACTION ISOLATION LEVEL ' + level)
+    return result
+
+
+def query(connection, sql):
+    cursor = connection.cursor()
+    cursor.execute(sql)
+    return cursor.fetchall() if cursor.description else cursor.rowcount
+
+
+def start(connection, sql):
+    """Executes the statement on a thread, returns the thread and the dict it answers in."""
+    answer = {}
+
+    def execute():
+        try:
+            answer['rows'] = query(connection, sql)
+        except mvcc_memory.Error as err:
+            answer['error'] = err.sqlstate
+
+    thread = threading.Thread(target=execute)
+    thread.daemon = True
+    thread.start()
+    time.sleep(0.1)
+    return thread, answer
+
+
+def sqlstate(connection, sql):
+    with pytest.raises(mvcc_memory.Error) as raised:
+        query(connection, sql)
+    return raised.value.sqlstate
+
+
+def test_read_committed_sees_every_commit():
+    first, second = connect('postgres', 'READ COMMITTED')
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    query(second, 'UPDATE t SET x=11 WHERE id=1')
+    second.commit()
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(11,)]
+
+
+def test_read_committed_writer_waits_and_rechecks():
+    first, second = connect('postgres', 'READ COMMITTED')
+    query(first, 'UPDATE t SET x=x+1 WHERE id=1')
+    thread, answer = start(second, 'UPDATE t SET x=x+1 WHERE id=1')
+    assert thread.is_alive()
+    first.commit()
+    thread.join(1)
+    second.commit()
+    assert answer == {'rows': 1}
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(12,)]
+
+
+def test_snapshot_isolation_first_updater_wins():
+    first, second = connect('postgres', 'REPEATABLE READ')
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    query(second, 'UPDATE t SET x=11 WHERE id=1')
+    second.commit()
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    assert sqlstate(first, 'UPDATE t SET x=12 WHERE id=1') == '40001'
+
+
+def test_serializable_snapshot_isolation_prevents_write_skew():
+    first, second = connect('postgres', 'SERIALIZABLE')
+    query(first, 'SELECT * FROM t')
+    query(second, 'SELECT * FROM t')
+    query(first, 'UPDATE t SET x=0 WHERE id=1')
+    query(second, 'UPDATE t SET x=0 WHERE id=2')
+    failures = []
+    for connection in (first, second):
+        try:
+            connection.commit()
+        except mvcc_memory.Error as err:
+            failures.append(err.sqlstate)
+    assert failures == ['40001']
+
+
+def test_innodb_repeatable_read_writes_the_latest_version():
+    first, second = connect('mysql', 'REPEATABLE READ')
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    query(second, 'UPDATE t SET x=11 WHERE id=1')
+    second.commit()
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    # no serialization failure: the update applies to the committed 11
+    assert query(first, 'UPDATE t SET x=x+1 WHERE id=1') == 1
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(12,)]
+
+
+def test_locking_read_blocks_writers_until_commit():
+    first, second = connect('sqlserver', 'REPEATABLE READ')
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    thread, answer = start(second, 'UPDATE t SET x=11 WHERE id=1')
+    assert thread.is_alive()
+    assert query(first, 'SELECT x FROM t WHERE id=1') == [(10,)]
+    first.commit()
+    thread.join(1)
+    assert answer == {'rows': 1}
+
+
+def test_locking_read_lost_update_is_a_deadlock():
+    first, second = connect('sqlserver', 'REPEATABLE READ')
+    query(first, 'SELECT x FROM t WHERE id=1')
+    query(second, 'SELECT x FROM t WHERE id=1')
+    thread, answer = start(first, 'UPDATE t SET x=x+1 WHERE id=1')
+    assert sqlstate(second, 'UPDATE t SET x=x+1 WHERE id=1') == '40P01'
+    thread.join(1)
+    assert answer == {'rows': 1}
+
+
+def test_repeatable_read_locks_let_phantoms_in():
+    first, second = connect('sqlserver', 'REPEATABLE READ')
+    query(first, 'SELECT * FROM t WHERE x > 0')
+    assert query(second, 'INSERT INTO t VALUES (3, 30)') == 1
+
+
+@pytest.mark.parametrize('dbms', ['mysql', 'sqlserver'])
+def test_serializable_locks_block_phantoms(dbms):
+    first, second = connect(dbms, 'SERIALIZABLE')
+    query(first, 'SELECT * FROM t WHERE x > 0')
+    thread, answer = start(second, 'INSERT INTO t VALUES (3, 30)')
+    assert thread.is_alive()
+    assert query(first, 'SELECT * FROM t WHERE x > 0') == [(1, 10), (2, 20)]
+    first.commit()
+    thread.join(1)
+    assert answer == {'rows': 1}
+
+
+def test_serializable_locks_missing_keys():
+    first, second = connect('sqlserver', 'SERIALIZABLE')
+    assert query(first, 'SELECT * FROM t WHERE id=5') == []
+    thread, _ = start(second, 'INSERT INTO t VALUES (5, 50)')
+    assert thread.is_alive()
+    first.commit()
+    thread.join(1)
+    assert not thread.is_alive()
+
+
+def test_deadlock_wait_is_seen_before_the_abort():
+    first, second = connect('postgres', 'READ COMMITTED')
+    engine = first.engine
+    seen = []
+    second.on_block = lambda blocked: seen.append(dict(engine.waits)) if blocked else None
+    query(first, 'UPDATE t SET x=11 WHERE id=1')
+    query(second, 'UPDATE t SET x=21 WHERE id=2')
+    thread, answer = start(first, 'UPDATE t SET x=12 WHERE id=2')
+    assert sqlstate(second, 'UPDATE t SET x=22 WHERE id=1') == '40P01'
+    thread.join(1)
+    assert answer == {'rows': 1}
+    # the wait that closed the cycle, with the one it closed
+    assert len(seen) == 1 and len(seen[0]) == 2
+    assert engine.waits == {}
+
+
+def test_unsupported_sql_raises_not_supported_error():
+    first, = connect('postgres', 'READ COMMITTED', 1)
+    with pytest.raises(mvcc_memory.NotSupportedError):
+        query(first, 'UPDATE t SET x = CASE WHEN x > 1 THEN 1 ELSE 2 END')
+    with pytest.raises(mvcc_memory.NotSupportedError):
+        query(first, 'SET TRANSACTION ISOLATION LEVEL SNAPSHOT')
@@ -0,0 +1,89 @@
+import os
+
+import mvcc_headless
+import mvcc_memory
+import mvcc_metrics
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'test', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'COMMIT;;']
+STEPS = {'step1_T1': ['BEGIN TRANSACTION;;', 'SELECT * FROM T;;'],
+         'step2_T2': ['BEGIN TRANSACTION;;', 'SELECT * FROM missing;;'],
+         'step3_T1': ['COMMIT;;'],
+         'step4_T2': ['ROLLBACK;;']}
+
+
+def samples(text):
+    """:return: dict of every sample line's name and labels to its value"""
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+
+
+def test_counters_and_labels():
+    metrics = mvcc_metrics.Metrics()
+    metrics.inc('mvcc_steps_total', {'dbms': 'postgres'})
+    metrics.inc('mvcc_steps_total', {'dbms': 'postgres'}, 2)
+    metrics.inc('mvcc_errors_total', {'dbms': 'mysql', 'class': 'say "hi"\n'})
+    rendered = metrics.render()
+    assert '# TYPE mvcc_steps_total counter' in rendered
+    assert samples(rendered) == {
+        'mvcc_steps_total{dbms="postgres"}': '3',
+        'mvcc_errors_total{class="say \\"hi\\"\\n",dbms="mysql"}': '1'}
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = mvcc_metrics.Metrics()
+    for seconds in [0.001, 0.005, 0.2, 60]:
+        metrics.observe('mvcc_step_seconds', seconds, {'dbms': 'oracle'})
+    values = samples(metrics.render())
+    assert values['mvcc_step_seconds_bucket{dbms="oracle",le="0.005"}'] == '2'
+    assert values['mvcc_step_seconds_bucket{dbms="oracle",le="0.1"}'] == '2'
+    assert values['mvcc_step_seconds_bucket{dbms="oracle",le="0.25"}'] == '3'
+    assert values['mvcc_step_seconds_bucket{dbms="oracle",le="30.0"}'] == '3'
+    assert values['mvcc_step_seconds_bucket{dbms="oracle",le="+Inf"}'] == '4'
+    assert values['mvcc_step_seconds_count{dbms="oracle"}'] == '4'
+    assert float(values['mvcc_step_seconds_sum{dbms="oracle"}']) == 60.206
+
+
+def test_observe_result():
+    result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                        connect_function=mvcc_memory.Engine().connect)
+    metrics = mvcc_metrics.Metrics()
+    mvcc_metrics.observe_result(metrics, result)
+    values = samples(metrics.render())
+    assert values['mvcc_scenarios_total{dbms="postgres",status="ok"}'] == '1'
+    assert values['mvcc_steps_total{dbms="postgres"}'] == '4'
+    assert values['mvcc_step_seconds_count{dbms="postgres"}'] == '4'
+    # one latency sample per connection
+    assert values['mvcc_connection_attempts_total{dbms="postgres"}'] == '2'
+    assert values['mvcc_connection_seconds_count{dbms="postgres"}'] == '2'
+    assert values['mvcc_errors_total{class="error",dbms="postgres"}'] == '1'
+
+
+def test_observe_a_failed_connection():
+    def connect(dbms, config):
+        raise IOError('could not connect to server')
+
+    result = mvcc_headless.run_scenario('mysql', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                        connect_function=connect)
+    metrics = mvcc_metrics.Metrics()
+    mvcc_metrics.observe_result(metrics, result)
+    values = samples(metrics.render())
+    assert values['mvcc_scenarios_total{dbms="mysql",status="error"}'] == '1'
+    assert values['mvcc_connection_attempts_total{dbms="mysql"}'] == '1'
+    assert values['mvcc_errors_total{class="connection",dbms="mysql"}'] == '1'
+
+
+def test_textfile_writer(tmp_path):
+    path = str(tmp_path / 'mvcc.prom')
+    metrics = mvcc_metrics.Metrics()
+    with mvcc_metrics.TextfileWriter(metrics, path, interval=60) as writer:
+        metrics.inc('mvcc_steps_total', {'dbms': 'postgres'})
+    with open(path) as metrics_file:
+        assert samples(metrics_file.read()) == {'mvcc_steps_total{dbms="postgres"}': '1'}
+    assert os.listdir(str(tmp_path)) == ['mvcc.prom']
+    assert writer.error is None
+
+    # a missing directory is kept as the error
+    writer = mvcc_metrics.TextfileWriter(metrics, str(tmp_path / 'missing' / 'mvcc.prom'), 60)
+    writer.close()
+    assert writer.error
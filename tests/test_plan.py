@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+import mvcc_plan
+
+YAML = """sqlserver-config:
+    host: 127.0.0.1
+    db: test
+postgres-config:
+    host: 127.0.0.1
+    db: test
+table-initialization:
+    - 'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;'
+    - 'COMMIT;;'
+sqlserver-tests:
+    test1:    # Anomaly|Lost Update - Isolation|Snapshot
+        step1_T10:
+            - 'BEGIN TRAN;;'
+        step2_T2:
+            - 'UPDATE T SET x=1;;'
+            - 'GO'
+postgres-tests:
+    test1:
+        step1_T1:
+            - 'BEGIN TRANSACTION;;'
+"""
+
+
+@pytest.fixture
+def yaml_file(tmp_path):
+    path = str(tmp_path / 'tests.yml')
+    with open(path, 'w') as test_file:
+        test_file.write(YAML)
+    return path
+
+
+@pytest.mark.parametrize('dbms, statement, lines', [
+    ('postgres', 'COMMIT;;', ['COMMIT;;']),
+    ('sqlserver', 'COMMIT;;', ['COMMIT;;', 'GO']),
+    ('sqlserver', ' go', [' go']),
+    ('oracle', 1, ['1']),
+])
+def test_batch(dbms, statement, lines):
+    assert mvcc_plan.batch(dbms, statement) == lines
+
+
+def test_compile_test_numbers_the_transactions_in_order():
+    compiled = mvcc_plan.compile_test('postgres', {'step1_T10': ['BEGIN;;'],
+                                                   'step2_T2': ['BEGIN;;', 'COMMIT;;'],
+                                                   'step3_T10': None}, '# comment')
+    assert compiled == {'comment': '# comment', 'transactions': ['T2', 'T10'],
+                        'steps': [['step1_T10', 1, [['BEGIN;;']]],
+                                  ['step2_T2', 0, [['BEGIN;;'], ['COMMIT;;']]],
+                                  ['step3_T10', 1, []]]}
+    with pytest.raises(ValueError):
+        mvcc_plan.compile_test('postgres', {'step1': ['BEGIN;;']})
+
+
+def test_compile_plan(yaml_file):
+    plan = mvcc_plan.compile_plan(yaml_file, 'sqlserver')
+    assert plan['version'] == mvcc_plan.PLAN_VERSION
+    # sqlserver runs without the COMMIT, every statement followed by GO
+    assert plan['initialization'] == [
+        ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;', 'GO']]
+    # the database settings come apart, before the other clients connect
+    assert [lines[0].split(' ALTER DATABASE ')[1] for lines in plan['database']] == [
+        'test SET READ_COMMITTED_SNAPSHOT ON;;', 'test SET ALLOW_SNAPSHOT_ISOLATION ON;;']
+    assert all(lines[1] == 'GO' for lines in plan['database'])
+    assert plan['tests']['test1']['steps'] == [
+        ['step1_T10', 1, [['BEGIN TRAN;;', 'GO']]],
+        ['step2_T2', 0, [['UPDATE T SET x=1;;', 'GO'], ['GO']]]]
+    assert plan['tests']['test1']['comment'] == '# Anomaly|Lost Update - Isolation|Snapshot'
+
+    plan = mvcc_plan.compile_plan(yaml_file, 'postgres')
+    assert plan['database'] == []
+    assert plan['initialization'] == [
+        ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;'], ['COMMIT;;']]
+
+
+def test_load_plan_compiles_again_when_its_sections_change(yaml_file, monkeypatch):
+    plan = mvcc_plan.load_plan(yaml_file, 'postgres')
+    assert os.path.exists(mvcc_plan.cache_path(yaml_file, 'postgres'))
+    assert mvcc_plan.load_plan(yaml_file, 'postgres') is plan
+
+    compiled = []
+    compile_plan = mvcc_plan.compile_plan
+
+    def counted_compile_plan(file_path, dbms):
+        compiled.append(dbms)
+        return compile_plan(file_path, dbms)
+
+    monkeypatch.setattr(mvcc_plan, 'compile_plan', counted_compile_plan)
+    # another process reads the cache
+    monkeypatch.setattr(mvcc_plan, 'LOADED_PLANS', {})
+    assert mvcc_plan.load_plan(yaml_file, 'postgres')['hash'] == plan['hash']
+    assert compiled == []
+
+    # a change of another dbms's tests keeps the plan
+    with open(yaml_file, 'w') as test_file:
+        test_file.write(YAML.replace("'UPDATE T SET x=1;;'", "'UPDATE T SET x=2;;'"))
+    os.utime(yaml_file, (0, 0))
+    assert mvcc_plan.load_plan(yaml_file, 'postgres')['hash'] == plan['hash']
+    assert compiled == []
+
+    with open(yaml_file, 'w') as test_file:
+        test_file.write(YAML.replace("'BEGIN TRANSACTION;;'", "'START TRANSACTION;;'"))
+    os.utime(yaml_file, (1, 1))
+    changed = mvcc_plan.load_plan(yaml_file, 'postgres')
+    assert compiled == ['postgres']
+    assert changed['tests']['test1']['steps'] == [['step1_T1', 0, [['START TRANSACTION;;']]]]
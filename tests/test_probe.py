@@ -0,0 +1,150 @@
+import socket
+import struct
+import threading
+
+import pytest
+
+import mvcc_probe
+
+
+def serve(answer):
+    """
+    Listens on a free local port, answers every connection with
+    answer(connection, received) and closes it.
+
+    :return: (the listening socket, received: list answer adds the requests to)
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    received = []
+
+    def accept():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.error:
+                return
+            connection.settimeout(1)
+            try:
+                answer(connection, received)
+            except socket.error:
+                pass
+            finally:
+                connection.close()
+
+    thread = threading.Thread(target=accept)
+    thread.daemon = True
+    thread.start()
+    return server, received
+
+
+def read_and_answer(size, answer):
+    def handle(connection, received):
+        # noted before answering, the probe returns once it has the answer
+        received.append(mvcc_probe.receive(connection, size) if size else b'')
+        connection.sendall(answer)
+    return handle
+
+
+@pytest.fixture(autouse=True)
+def no_shared_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(mvcc_probe, 'CACHE_FILE', str(tmp_path / 'probe.json'))
+    monkeypatch.setattr(mvcc_probe, 'CACHE', {})
+
+
+@pytest.mark.parametrize('dbms, config, address', [
+    ('postgres', {'host': 'localhost'}, ('localhost', 5432)),
+    ('postgres', {'host': '127.0.0.1:5433'}, ('127.0.0.1', 5433)),
+    ('mysql', {'host': 'db', 'port': 3307}, ('db', 3307)),
+    ('sqlserver', {'host': 'tcp:127.0.0.1,1434'}, ('127.0.0.1', 1434)),
+    ('oracle', {}, ('localhost', 1521)),
+    ('postgres', {'host': '::1'}, ('::1', 5432)),
+])
+def test_address_of(dbms, config, address):
+    assert mvcc_probe.address_of(dbms, config) == address
+
+
+@pytest.mark.parametrize('dbms, size, answer', [
+    ('postgres', 8, b'N'),
+    ('mysql', 0, b'\x4a\x00\x00\x00\x0a8.0.36\x00'),
+    ('sqlserver', 17, b'\x04\x01\x00\x25\x00\x00\x01\x00'),
+    ('oracle', 0, b''),
+])
+def test_probe_ready(dbms, size, answer):
+    server, received = serve(read_and_answer(size, answer))
+    try:
+        result = mvcc_probe.probe(dbms, '127.0.0.1', server.getsockname()[1])
+    finally:
+        server.close()
+    assert result['ready'], result
+    if dbms == 'postgres':
+        assert received == [struct.pack('!ii', 8, 80877103)]
+    if dbms == 'sqlserver':
+        # a TDS pre-login packet
+        assert received[0][:2] == b'\x12\x01'
+
+
+@pytest.mark.parametrize('dbms, size, answer', [
+    ('postgres', 8, b'HTTP/1.1 400'),
+    ('mysql', 0, b'\x04\x00\x00\x00SSH-'),
+    ('sqlserver', 17, b''),
+])
+def test_probe_unexpected_answer(dbms, size, answer):
+    server, _ = serve(read_and_answer(size, answer))
+    try:
+        result = mvcc_probe.probe(dbms, '127.0.0.1', server.getsockname()[1])
+    finally:
+        server.close()
+    assert not result['ready']
+    assert result['error']
+
+
+def test_probe_refused():
+    # a bound socket that does not listen refuses connections and keeps its port
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(('127.0.0.1', 0))
+    try:
+        result = mvcc_probe.probe('oracle', '127.0.0.1', closed.getsockname()[1])
+    finally:
+        closed.close()
+    assert not result['ready']
+    assert 'error' in result
+
+
+def test_check_retries_and_caches(monkeypatch):
+    probes = []
+
+    def probe(dbms, host, port, timeout):
+        probes.append((dbms, host, port))
+        return {'dbms': dbms, 'host': host, 'port': port, 'ready': len(probes) >= 2}
+
+    monkeypatch.setattr(mvcc_probe, 'probe', probe)
+    result = mvcc_probe.check('postgres', {'host': 'db'}, backoff=0)
+    assert result['ready'] and result['attempts'] == 2
+    assert probes == [('postgres', 'db', 5432)] * 2
+
+    assert mvcc_probe.check('postgres', {'host': 'db'})['cached']
+    assert len(probes) == 2
+    # another process finds it in the cache file
+    monkeypatch.setattr(mvcc_probe, 'CACHE', {})
+    assert mvcc_probe.check('postgres', {'host': 'db'})['cached']
+    assert len(probes) == 2
+
+    assert not mvcc_probe.check('postgres', {'host': 'db'}, use_cache=False).get('cached')
+    assert len(probes) == 3
+
+
+def test_failures_are_trusted_for_less(monkeypatch):
+    probes = []
+
+    def probe(dbms, host, port, timeout):
+        probes.append(port)
+        return {'dbms': dbms, 'host': host, 'port': port, 'ready': False}
+
+    monkeypatch.setattr(mvcc_probe, 'probe', probe)
+    assert not mvcc_probe.check('mysql', {}, retries=0)['ready']
+    assert mvcc_probe.check('mysql', {}, retries=0)['cached']
+    monkeypatch.setattr(mvcc_probe, 'FAILED_TTL', 0)
+    assert not mvcc_probe.check('mysql', {}, retries=0).get('cached')
+    assert probes == [3306, 3306]
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import mvcc_pty
+import mvcc_runner
+
+
+class FakeObserver(object):
+    """Polls every 10 milliseconds, the way mvcc_locks.LockObserver counts its polls."""
+
+    def __init__(self):
+        self.polls = 0
+        self.error = None
+        self.stopping = threading.Event()
+        thread = threading.Thread(target=self.poll)
+        thread.daemon = True
+        thread.start()
+
+    def poll(self):
+        while not self.stopping.wait(0.01):
+            self.polls += 1
+
+
+def wait_for_statement(command, observer=None, blocked_at=None):
+    """
+    Runs the command as a postgres client, which has just been sent a statement,
+    and waits for the statement.
+
+    :param command: prints the client's output
+    :param observer: (optional) the scenario's lock observer
+    :param blocked_at: (optional) seconds after which the observer sees the session wait
+    :return: ('done' | 'blocked', seconds it took)
+    """
+    async def run():
+        client = mvcc_pty.PtyClient('T1', 'postgres')
+        client.observer = observer
+        if blocked_at is not None:
+            asyncio.get_event_loop().call_later(blocked_at, client.session.set_blocked, True)
+        await client.start(command)
+        try:
+            started = time.time()
+            client.classifier.expect()
+            state = await client.wait_for_statement(0)
+            return state, time.time() - started
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def short_blocked_after(monkeypatch):
+    monkeypatch.setattr(mvcc_runner, 'BLOCKED_AFTER', 0.1)
+
+
+@pytest.fixture
+def observer():
+    observer = FakeObserver()
+    yield observer
+    observer.stopping.set()
+
+
+def test_statement_done_at_the_prompt():
+    assert wait_for_statement("printf 'UPDATE 1\\r\\npostgres=# '; sleep 5")[0] == 'done'
+
+
+def test_silent_statement_is_blocked_without_a_lock_observer():
+    state, seconds = wait_for_statement('sleep 5')
+    assert state == 'blocked' and seconds < 1
+
+
+def test_slow_statement_is_not_blocked_with_a_lock_observer(observer):
+    state, _ = wait_for_statement("sleep 0.4; printf 'UPDATE 1\\r\\npostgres=# '; sleep 5",
+                                  observer)
+    assert state == 'done'
+
+
+def test_statement_waiting_on_a_lock_is_blocked(observer, monkeypatch):
+    monkeypatch.setattr(mvcc_runner, 'BLOCKED_AFTER', 5)
+    state, seconds = wait_for_statement('sleep 5', observer, blocked_at=0.05)
+    assert state == 'blocked' and seconds < 1
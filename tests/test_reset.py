@@ -0,0 +1,75 @@
+import pytest
+
+import mvcc_memory
+import mvcc_reset
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'test', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['DROP TABLE T;;',
+                        'CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;',
+                        'INSERT INTO T VALUES (2, 2);;',
+                        'COMMIT;;']
+
+
+def rows(connection, table='T'):
+    return [list(row) for row in mvcc_reset.execute(connection, 'postgres',
+                                                    ['SELECT * FROM ' + table + ' ORDER BY id'])]
+
+
+@pytest.fixture
+def connection():
+    connection = mvcc_memory.Engine().connect('postgres')
+    yield connection
+    connection.close()
+
+
+def test_fingerprint_changes_with_the_section_and_the_dbms():
+    fingerprint = mvcc_reset.fingerprint('postgres', TABLE_INITIALIZATION)
+    assert fingerprint == mvcc_reset.fingerprint('postgres', tuple(TABLE_INITIALIZATION))
+    assert fingerprint != mvcc_reset.fingerprint('mysql', TABLE_INITIALIZATION)
+    assert fingerprint != mvcc_reset.fingerprint('postgres', TABLE_INITIALIZATION[:-2])
+    assert mvcc_reset.fingerprint('postgres', None) == mvcc_reset.fingerprint('postgres', [])
+
+
+def test_created_tables():
+    assert mvcc_reset.created_tables(TABLE_INITIALIZATION +
+                                     ['create table Accounts (id INT);;',
+                                      'CREATE TABLE T (id INT);;']) == ['T', 'Accounts']
+    assert mvcc_reset.created_tables(None) == []
+
+
+def test_reset_restores_the_rows_from_the_baseline(connection):
+    assert mvcc_reset.reset_tables(connection, 'postgres', CONFIG,
+                                   TABLE_INITIALIZATION) == 'rebuilt'
+    assert rows(connection) == [[1, 1], [2, 2]]
+    assert rows(connection, 'T' + mvcc_reset.BASELINE_SUFFIX) == [[1, 1], [2, 2]]
+
+    mvcc_reset.execute(connection, 'postgres', ['UPDATE T SET x=10 WHERE id=1;;',
+                                                'DELETE FROM T WHERE id=2;;',
+                                                'INSERT INTO T VALUES (3, 3);;', 'COMMIT;;'])
+    assert mvcc_reset.reset_tables(connection, 'postgres', CONFIG,
+                                   TABLE_INITIALIZATION) == 'restored'
+    assert rows(connection) == [[1, 1], [2, 2]]
+    # left for the scenario with autocommit off
+    assert not connection.autocommit
+
+
+def test_a_changed_section_or_a_dropped_baseline_rebuilds(connection):
+    mvcc_reset.reset_tables(connection, 'postgres', CONFIG, TABLE_INITIALIZATION)
+    changed = TABLE_INITIALIZATION[:-1] + ['INSERT INTO T VALUES (3, 3);;', 'COMMIT;;']
+    assert mvcc_reset.reset_tables(connection, 'postgres', CONFIG, changed) == 'rebuilt'
+    assert rows(connection) == [[1, 1], [2, 2], [3, 3]]
+    assert mvcc_reset.reset_tables(connection, 'postgres', CONFIG, changed) == 'restored'
+
+    mvcc_reset.execute(connection, 'postgres', ['DROP TABLE T' + mvcc_reset.BASELINE_SUFFIX])
+    assert mvcc_reset.reset_tables(connection, 'postgres', CONFIG, changed) == 'rebuilt'
+    assert rows(connection) == [[1, 1], [2, 2], [3, 3]]
+
+
+
+def test_only_sqlserver_sets_up_its_database():
+    assert mvcc_reset.database_statements('postgres', 'test') == []
+    statements = mvcc_reset.database_statements('sqlserver', 'test')
+    assert [statement.split(' ALTER DATABASE ')[1] for statement in statements] == [
+        'test SET READ_COMMITTED_SNAPSHOT ON', 'test SET ALLOW_SNAPSHOT_ISOLATION ON']
+    assert all(statement.startswith('IF NOT EXISTS') for statement in statements)
@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+import mvcc_locks
+import mvcc_runner
+from mvcc_classify import OutputClassifier
+
+
+class FakeStream(object):
+    """The parts of mvcc_stream.PaneStream that wait_for_statement uses."""
+
+    def __init__(self):
+        self.classifier = OutputClassifier('postgres')
+        self.classifier.feed('postgres=# ')
+        self.position = 0
+        self.condition = threading.Condition()
+
+    def feed(self, text):
+        with self.condition:
+            self.classifier.feed(text)
+            self.position += len(text)
+            self.condition.notify_all()
+
+    def feed_later(self, text, seconds):
+        timer = threading.Timer(seconds, self.feed, (text,))
+        timer.daemon = True
+        timer.start()
+
+    def wait_for_output(self, since, timeout):
+        with self.condition:
+            if self.position <= since:
+                self.condition.wait(timeout)
+            return self.position > since
+
+
+class FakeObserver(object):
+    """Polls every 10 milliseconds, the way mvcc_locks.LockObserver counts its polls."""
+
+    def __init__(self):
+        self.polls = 0
+        self.error = None
+        self.stopping = threading.Event()
+        thread = threading.Thread(target=self.poll)
+        thread.daemon = True
+        thread.start()
+
+    def poll(self):
+        while not self.stopping.wait(0.01):
+            self.polls += 1
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    monkeypatch.setattr(mvcc_runner, 'BLOCKED_AFTER', 0.1)
+    stream = FakeStream()
+    stream.classifier.expect()
+    return stream
+
+
+@pytest.fixture
+def observer(monkeypatch):
+    observer = FakeObserver()
+    monkeypatch.setattr(mvcc_runner, 'LOCK_OBSERVER', observer)
+    yield observer
+    observer.stopping.set()
+
+
+def test_statement_done_at_the_prompt(stream):
+    stream.feed_later('UPDATE 1\r\npostgres=# ', 0.02)
+    assert mvcc_runner.wait_for_statement(stream, 0) == 'done'
+
+
+def test_silent_statement_is_blocked_without_a_lock_observer(stream):
+    started = time.time()
+    assert mvcc_runner.wait_for_statement(stream, 0, mvcc_locks.ClientSession('T1')) == 'blocked'
+    assert time.time() - started < 1
+
+
+def test_slow_statement_is_not_blocked_with_a_lock_observer(stream, observer):
+    stream.feed_later('UPDATE 1\r\npostgres=# ', 0.3)
+    assert mvcc_runner.wait_for_statement(stream, 0, mvcc_locks.ClientSession('T1')) == 'done'
+
+
+def test_statement_waiting_on_a_lock_is_blocked(stream, observer):
+    session = mvcc_locks.ClientSession('T1')
+    threading.Timer(0.05, session.set_blocked, (True,)).start()
+    started = time.time()
+    assert mvcc_runner.wait_for_statement(stream, 0, session) == 'blocked'
+    assert time.time() - started < 0.3
+
+
+def test_lock_wait_seen_before_the_statement_is_not_its_own(stream, observer):
+    session = mvcc_locks.ClientSession('T1')
+    # the wait of the previous statement, not polled again yet
+    session.set_blocked(True)
+    observer.stopping.set()
+    stream.feed_later('UPDATE 1\r\npostgres=# ', 0.2)
+    assert mvcc_runner.wait_for_statement(stream, 0, session) == 'done'
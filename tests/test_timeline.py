@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import mvcc_headless
+import mvcc_memory
+import mvcc_timeline
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'test', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'COMMIT;;']
+STEPS = {'step1_T1': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=2 WHERE id=1;;'],
+         'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=3 WHERE id=1;;'],
+         'step3_T1': ['COMMIT;;'],
+         'step4_T2': ['ROLLBACK;;']}
+
+
+@pytest.fixture(autouse=True)
+def short_block_timeout(monkeypatch):
+    monkeypatch.setattr(mvcc_headless, 'STEP_BLOCK_TIMEOUT', 0.2)
+
+
+def read_events(path):
+    with open(path) as timeline_file:
+        return json.load(timeline_file)['traceEvents']
+
+
+@pytest.mark.parametrize('statement, outcome', [
+    ('COMMIT;;', 'committed'),
+    ('commit tran;;', 'committed'),
+    ('  ROLLBACK WORK;;', 'rolled back'),
+    ('SELECT * FROM T;;', None),
+])
+def test_outcome_of(statement, outcome):
+    assert mvcc_timeline.outcome_of(statement) == outcome
+
+
+def test_statement_name():
+    assert mvcc_timeline.statement_name('SELECT *\n  FROM T;;') == 'SELECT * FROM T;;'
+    name = mvcc_timeline.statement_name('SELECT ' + 'x, ' * 40 + 'y FROM T;;')
+    assert len(name) == mvcc_timeline.NAME_LENGTH and name.endswith('...')
+
+
+def test_every_scenario_is_a_process_with_a_track_per_transaction(tmp_path):
+    path = str(tmp_path / 'timeline.json')
+    with mvcc_timeline.Timeline(path) as timeline:
+        for test_num in ['test1', 'test2']:
+            timeline.add_result(mvcc_headless.run_scenario(
+                'postgres', CONFIG, TABLE_INITIALIZATION, STEPS, test_num,
+                connect_function=mvcc_memory.Engine().connect))
+    events = read_events(path)
+
+    processes = [(event['pid'], event['args']['name']) for event in events
+                 if event['name'] == 'process_name']
+    assert processes == [(1, 'postgres test1'), (2, 'postgres test2')]
+    tracks = dict(((event['pid'], event['args']['name']), event['tid']) for event in events
+                  if event['name'] == 'thread_name')
+    assert tracks == {(1, 'setup'): 0, (1, 'T1'): 1, (1, 'T2'): 2,
+                      (2, 'setup'): 0, (2, 'T1'): 1, (2, 'T2'): 2}
+
+    first = [event for event in events if event['pid'] == 1 and event['ph'] != 'M']
+    spans = dict((category, [event for event in first
+                             if event['ph'] == 'X' and event['cat'] == category])
+                 for category in ['connect', 'initialization', 'step', 'statement'])
+    assert sorted(event['tid'] for event in spans['connect']) == [1, 2]
+    assert [event['tid'] for event in spans['initialization']] == [0]
+    assert [(event['name'], event['tid']) for event in spans['step']] == [
+        ('step1_T1', 1), ('step2_T2', 2), ('step3_T1', 1), ('step4_T2', 2)]
+    assert len(spans['statement']) == 6
+    assert all(event['dur'] >= 0 for event in first if event['ph'] == 'X')
+
+    instants = [(event['name'], event['tid']) for event in first if event['ph'] == 'i']
+    # T2's update waits on T1's lock
+    assert ('blocked', 2) in instants
+    assert ('committed', 1) in instants and ('rolled back', 2) in instants
+    blocked_step = [event for event in spans['step'] if event['name'] == 'step2_T2'][0]
+    assert blocked_step['args']['blocked']
+
+
+def test_cli_runs_have_steps_without_statements(tmp_path):
+    path = str(tmp_path / 'timeline.json')
+    result = {'test': 'test3', 'dbms': 'mysql', 'transactions': {'T1': [], 'T2': []},
+              'steps': [{'step': 'step1_T1', 'transaction': 'T1', 'start': 10.0,
+                         'duration': 0.5, 'blocked': False, 'errors': ['deadlock']},
+                        {'step': 'step2_T2', 'transaction': 'T2', 'start': 10.5,
+                         'duration': 0.25, 'blocked': True, 'errors': []}]}
+    with mvcc_timeline.Timeline(path) as timeline:
+        timeline.add_result(result)
+    steps = [event for event in read_events(path) if event.get('cat') == 'step']
+    assert [(event['ts'], event['dur']) for event in steps] == [(10000000.0, 500000.0),
+                                                                (10500000.0, 250000.0)]
+    assert steps[0]['args'] == {'blocked': False, 'errors': ['deadlock']}
+    assert steps[1]['args'] == {'blocked': True}
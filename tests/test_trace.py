@@ -0,0 +1,83 @@
+import json
+import time
+
+import mvcc_headless
+import mvcc_memory
+import mvcc_trace
+
+CONFIG = {'user': 'user', 'password': 'password', 'db': 'test', 'host': 'localhost'}
+TABLE_INITIALIZATION = ['CREATE TABLE T (id INT NOT NULL PRIMARY KEY, x INT);;',
+                        'INSERT INTO T VALUES (1, 1);;', 'COMMIT;;']
+STEPS = {'step1_T1': ['BEGIN TRANSACTION;;', 'SELECT * FROM T;;'],
+         'step2_T2': ['BEGIN TRANSACTION;;', 'UPDATE T SET x=2 WHERE id=1;;'],
+         'step3_T1': ['COMMIT;;'],
+         'step4_T2': ['COMMIT;;']}
+
+
+def read_trace(path):
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file]
+
+
+def test_writer_writes_every_record_on_close(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    with mvcc_trace.TraceWriter(path, batch_size=3, flush_interval=60) as trace:
+        for number in range(10):
+            trace.write({'number': number})
+    assert [record['number'] for record in read_trace(path)] == list(range(10))
+    assert trace.written == 10
+
+    # a second writer appends to the file
+    with mvcc_trace.TraceWriter(path) as trace:
+        trace.write({'number': 10})
+    assert len(read_trace(path)) == 11
+
+
+def test_writer_writes_a_full_batch_without_waiting(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    trace = mvcc_trace.TraceWriter(path, batch_size=2, flush_interval=2)
+    try:
+        trace.write({'number': 1})
+        trace.write({'number': 2})
+        # the writer thread looks at the pending records every flush_interval / 10
+        started = time.time()
+        while trace.written < 2 and time.time() - started < 1:
+            time.sleep(0.01)
+        assert trace.written == 2
+        assert len(read_trace(path)) == 2
+    finally:
+        trace.close()
+
+
+def test_cli_record():
+    record = mvcc_trace.cli_record('T2', 'UPDATE T SET x=2;;', 1.0, 'blocked', 'error')
+    assert record['end'] is None and 'error' not in record
+    record = mvcc_trace.cli_record('T2', 'UPDATE T SET x=2;;', 1.0, 'done', 'deadlock')
+    trace_record = mvcc_trace.statement_record({'run': 'run', 'dbms': 'mysql'}, 'step2_T2',
+                                               record)
+    assert trace_record['error_kind'] == 'deadlock' and trace_record['state'] == 'done'
+    assert trace_record['end'] >= trace_record['start']
+    assert trace_record['rows'] is None
+
+
+def test_run_scenario_traces_every_statement(tmp_path):
+    path = str(tmp_path / 'trace.jsonl')
+    with mvcc_trace.TraceWriter(path) as trace:
+        result = mvcc_headless.run_scenario('postgres', CONFIG, TABLE_INITIALIZATION, STEPS,
+                                            'test1', connect_function=mvcc_memory.Engine().connect,
+                                            trace=trace)
+    records = read_trace(path)
+    statements = [record for step in result['steps'] for record in step['statements']]
+    # the table initialization, T2 leaving autocommit (on its own worker), every statement
+    assert (records[0]['transaction'], records[0]['action']) == ('T1', 'reset')
+    assert [(record['transaction'], record['action']) for record in records
+            if record['step'] is None] == [('T1', 'reset'), ('T2', 'autocommit')]
+    records = [record for record in records if record['step'] is not None]
+    assert len(records) == len(statements)
+    assert set(record['run'] for record in records) == set([records[0]['run']])
+    assert all(record['scenario'] == 'test1' and record['dbms'] == 'postgres'
+               for record in records)
+    assert [record['step'] for record in records] == \
+        [step['step'] for step in result['steps'] for _ in step['statements']]
+    select = [record for record in records if record['sql'] == 'SELECT * FROM T;;'][0]
+    assert select['transaction'] == 'T1' and select['rows'] == 1